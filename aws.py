@@ -10,13 +10,236 @@ Nikki Hess (nkhess@umich.edu)
 import time
 
 import json
-import boto3
+import queue
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
 
-LATEST_MESSAGE = None # latest SQS message
-STOP_THREAD = False
+# boto3 is imported when the first client is built, it's slow to import on a Pi
+AWS_CONFIG = {} # filled in by load_configs
+SLACK_CONFIG = {}
+CONFIGS_LOADED = False
 
-def post_to_slack(aws_client: boto3.client, message: str, channel_id: str,
-                  device_id: str, dev: bool):
+# guards the lazy globals below, which the GUI and warm_up_clients may build at once
+INIT_LOCK = threading.RLock()
+
+CLIENT_FACTORY = None # the shared ClientFactory, see get_client
+SQS_CLIENT = None # kept for older callers, set by setup_aws
+
+# the queue every kiosk shared before per-device queues, still used as a fallback
+SQS_QUEUE_URL = "https://sqs.us-east-2.amazonaws.com/225753854445/slackLambda-dev.fifo"
+SQS_CONSUMER = None # the shared SqsConsumer, see get_sqs_consumer
+PUSH_CONSUMER = None # the shared push.PushConsumer, see get_notification_consumer
+
+FUNCTION_NAME = "slackLambda"
+
+INVOKE_WORKERS = 2 # background invokes in flight at once
+DELETE_ATTEMPTS = 3 # per SQS message, before it's left to be redelivered
+INVOKER = None # the shared AsyncInvoker, see get_invoker
+TRANSPORT = None # how we reach the backend, see get_transport
+
+def get_function_name(dev: bool) -> str:
+    """
+    Gets the name of the Lambda function to invoke
+
+    Args:
+        dev (bool): whether we're using the dev AWS instance
+
+    Returns:
+        str: the function name
+    """
+    return FUNCTION_NAME + ("-dev" if dev else "")
+
+class AsyncInvoker:
+    """
+    Invokes the Lambda function on a small, bounded pool of worker threads
+    so the GUI never waits on a round trip. Calls return futures.
+    """
+
+    def __init__(self, lambda_client, function_name: str,
+                 max_workers: int = INVOKE_WORKERS):
+        """
+        Args:
+            lambda_client (boto3.client): the Lambda client
+            function_name (str): the function to invoke
+            max_workers (int): how many invokes may be in flight at once
+        """
+        self.lambda_client = lambda_client
+        self.function_name = function_name
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="lambda-invoke")
+
+        # message id -> [future, latest payload] for status updates not yet sent
+        self._pending_updates = {}
+        self._lock = threading.Lock()
+
+    def invoke(self, payload: dict, wait_for_response: bool = True) -> Future:
+        """
+        Invokes the function in the background
+
+        Args:
+            payload (dict): the event to send
+            wait_for_response (bool): False sends a fire-and-forget Event
+                invocation, which AWS acknowledges without running the function first
+
+        Returns:
+            Future: resolves to the decoded response, or None for Event invocations
+        """
+        return self.executor.submit(self._invoke, payload, wait_for_response)
+
+    def update_status(self, message_id: str, payload: dict) -> Future:
+        """
+        Sends a fire-and-forget status update for a message. If an update for
+        the same message is still waiting for a worker, it's replaced by this
+        one instead, so only the latest status goes out
+
+        Args:
+            message_id (str): the message the update is for
+            payload (dict): the event to send
+
+        Returns:
+            Future: resolves to None once the update has been sent
+        """
+        with self._lock:
+            pending = self._pending_updates.get(message_id)
+            if pending is not None:
+                pending[1] = payload
+                return pending[0]
+
+            pending = [None, payload]
+            self._pending_updates[message_id] = pending
+            pending[0] = self.executor.submit(self._send_update, message_id)
+
+            return pending[0]
+
+    def _send_update(self, message_id: str) -> None:
+        """
+        Sends the latest queued update for a message, on a worker thread
+        """
+        with self._lock:
+            _, payload = self._pending_updates.pop(message_id)
+
+        return self._invoke(payload, False)
+
+    def _invoke(self, payload: dict, wait_for_response: bool) -> dict | None:
+        """
+        Does the actual invoke, on a worker thread
+        """
+        response = self.lambda_client.invoke(
+            FunctionName=self.function_name,
+            InvocationType="RequestResponse" if wait_for_response else "Event",
+            Payload=json.dumps(payload)
+        )
+
+        if not wait_for_response:
+            return None
+
+        return json.loads(response["Payload"].read().decode("utf-8"))
+
+class TkCallbackQueue:
+    """
+    Hands callbacks from worker threads to the Tk thread, which is the only
+    thread allowed to touch widgets. Create it on the Tk thread.
+    """
+
+    def __init__(self, root, interval_ms: int = 50):
+        """
+        Args:
+            root (tk.Tk): the root window
+            interval_ms (int): how often the Tk thread checks for callbacks
+        """
+        self.root = root
+        self.interval_ms = interval_ms
+        self._queue = queue.SimpleQueue()
+
+        self.root.after(self.interval_ms, self._drain)
+
+    def put(self, callback, *args) -> None:
+        """
+        Schedules callback(*args) to run on the Tk thread. Safe from any thread
+
+        Args:
+            callback: the function to call
+            *args: its arguments
+        """
+        self._queue.put((callback, args))
+
+    def _drain(self) -> None:
+        """
+        Runs every queued callback, then checks again later
+        """
+        while True:
+            try:
+                callback, args = self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            try:
+                callback(*args)
+            except Exception as e: # one bad callback shouldn't stop the rest
+                print(f"Error in Tk callback: {e}")
+
+        self.root.after(self.interval_ms, self._drain)
+
+def add_callback(future: Future, callback, tk_queue: TkCallbackQueue = None) -> None:
+    """
+    Calls callback(future) once a future finishes, on the Tk thread if a
+    TkCallbackQueue is given
+
+    Args:
+        future (Future): the future to watch
+        callback: called with the finished future
+        tk_queue (TkCallbackQueue): marshals the call onto the Tk thread
+    """
+    if tk_queue is None:
+        future.add_done_callback(callback)
+    else:
+        future.add_done_callback(lambda done: tk_queue.put(callback, done))
+
+def get_invoker(aws_client, dev: bool) -> AsyncInvoker:
+    """
+    Gets the shared invoker, creating it on first use
+
+    Args:
+        aws_client (boto3.client): the Lambda client
+        dev (bool): whether we're using the dev AWS instance
+
+    Returns:
+        AsyncInvoker: the invoker
+    """
+    global INVOKER
+
+    if INVOKER is None:
+        INVOKER = AsyncInvoker(aws_client, get_function_name(dev))
+
+    return INVOKER
+
+def get_transport(aws_client, dev: bool):
+    """
+    Gets the transport set by "transport" in config/aws.json, creating it on
+    first use. Defaults to invoking the Lambda function
+
+    Args:
+        aws_client (boto3.client): the Lambda client
+        dev (bool): whether we're using the dev AWS instance
+
+    Returns:
+        transport.Transport: the transport
+    """
+    global TRANSPORT
+
+    if TRANSPORT is None:
+        load_configs()
+        import transport # deferred, transport imports this module
+
+        name = AWS_CONFIG.get("transport", "lambda")
+        TRANSPORT = transport.create_transport(name, get_invoker(aws_client, dev) if name == "lambda" else None)
+
+    return TRANSPORT
+
+def post_to_slack(aws_client, message: str, channel_id: str,
+                  device_id: str, dev: bool, post_id: str = None):
     """
     Posts a message to Slack using chat.postMessage
 
@@ -25,200 +248,506 @@ def post_to_slack(aws_client: boto3.client, message: str, channel_id: str,
         message (str): the message to send
         channel_id (str): the Slack channel to send the message to
         dev (bool): whether we're using the dev AWS instance
+        post_id (str): a unique ID for this help request, makes retries safe
+
+    Returns:
+        tuple: the posted message ID and channel ID, see transport.Transport.post
     """
 
     print("Posting message to Slack via AWS...")
 
-    payload = {
-        "body": {
-            "type": "post",
-            "message": message,
-            "channel_id": channel_id,
-            "device_id": device_id
-        }
-    }
-    payload = json.dumps(payload) # convert dict to string
-
-    # the function name is apparently the name of the instance ¯\_(ツ)_/¯
-    response = aws_client.invoke(
-        FunctionName="slackLambda" + "-dev" if dev else "",
-        Payload=payload
-    )
+    return get_transport(aws_client, dev).post(message, channel_id, device_id, post_id)
 
-    # extract our custom response
-    response = response["Payload"].read().decode("utf-8")
-    response = json.loads(response)
-
-    # this should be guaranteed with a post payload
-    return response.get("posted_message_id"), response.get("posted_message_channel")
-
-def mark_message_timed_out(aws_client: boto3.client, message_id: str, channel_id: str, dev: bool):
+def mark_message_timed_out(aws_client, message_id: str, channel_id: str, dev: bool) -> Future:
     """
-    Edits a message on Slack to mark it timed out
+    Edits a message on Slack to mark it timed out, without waiting
 
     Args:
         aws_client (boto3.client): the AWS client we're using
         message_id (str): the message id to edit
         channel_id (str): the Slack channel to send the message to
         dev (bool): whether we're using the dev AWS instance
+
+    Returns:
+        Future: resolves once the update has been sent
     """
 
     print(f"Marking message {message_id} as timed out...")
 
-    payload = {
-        "body": {
-            "type": "message_timeout",
-            "message_id": message_id,
-            "channel_id": channel_id
-        }
-    }
-    payload = json.dumps(payload) # convert dict to string
-
-    # invoke the AWS Lambda function
-    aws_client.invoke(
-        FunctionName="slackLambda" + "-dev" if dev else "",
-        Payload=payload
-    )
+    # nobody needs the result, so don't wait for it
+    return get_transport(aws_client, dev).update_status(message_id, channel_id, "timed_out")
 
-def mark_message_replied(aws_client: boto3.client, message_id: str, channel_id: str, dev: bool):
+def mark_message_replied(aws_client, message_id: str, channel_id: str, dev: bool) -> Future:
     """
-    Edits a message on Slack to mark it replied
+    Edits a message on Slack to mark it replied, without waiting
 
     Args:
         aws_client (boto3.client): the AWS client we're using
         message_id (str): the message id to edit
         channel_id (str): the Slack channel to send the message to
         dev (bool): whether we're using the dev AWS instance
+
+    Returns:
+        Future: resolves once the update has been sent
     """
 
     print(f"Marking message {message_id} as replied...")
 
-    payload = {
-        "body": {
-            "type": "message_replied",
-            "message_id": message_id,
-            "channel_id": channel_id
-        }
-    }
-    payload = json.dumps(payload) # convert dict to string
-
-    # invoke the AWS Lambda function
-    aws_client.invoke(
-        FunctionName="slackLambda" + "-dev" if dev else "",
-        Payload=payload
-    )
+    return get_transport(aws_client, dev).update_status(message_id, channel_id, "replied")
 
-def poll_sqs(sqs_client: boto3.client, device_id: str):
+class SqsConsumer:
     """
-    Periodically polls SQS, will run on a separate thread
-
-    Args:
-        sqs_client (boto3.client): the SQS client we're using
-        device_id (str): the id of the device we're on
+    One long-polling consumer per process. Notifications are received in
+    batches, handed over through a bounded thread-safe queue, and only then
+    deleted (also in batches), so a burst of replies can't overwrite each
+    other and nothing is deleted before it has been delivered.
     """
-    global LATEST_MESSAGE, STOP_THREAD
 
-    queue_url = "https://sqs.us-east-2.amazonaws.com/225753854445/slackLambda-dev.fifo"
-
-    while True:
-        if STOP_THREAD:
-            STOP_THREAD = False
-            break
-
-        response = sqs_client.receive_message(
-            QueueUrl=queue_url,
-            MaxNumberOfMessages=1,
-            WaitTimeSeconds=3 # no hammering AWS >:()
+    def __init__(self, sqs_client, queue_url: str = SQS_QUEUE_URL,
+                 max_queued: int = 100, seen_size: int = 256, wait_seconds: int = 20):
+        """
+        Args:
+            sqs_client (boto3.client): the SQS client we're using
+            queue_url (str): the queue to consume
+            max_queued (int): how many notifications may wait to be picked up
+            seen_size (int): how many MessageIds to remember for dropping redeliveries
+            wait_seconds (int): the long poll wait, 20 is the most SQS allows
+        """
+        self.sqs_client = sqs_client
+        self.queue_url = queue_url
+        self.wait_seconds = wait_seconds
+        self.messages = queue.Queue(maxsize=max_queued)
+
+        self.seen_size = seen_size
+        self._seen = OrderedDict() # MessageId -> None, oldest first
+
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """
+        Starts consuming in the background, if we aren't already
+        """
+        with self._lock:
+            # a consumer that was just stopped keeps going if it hasn't exited yet
+            self._stop.clear()
+            if self._thread is not None and self._thread.is_alive():
+                return
+
+            self._thread = threading.Thread(target=self._run, daemon=True, name="sqs-consumer")
+            self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops consuming once the current long poll returns
+        """
+        self._stop.set()
+
+    def get_message(self) -> dict | None:
+        """
+        Gets the next notification without waiting
+
+        Returns:
+            dict | None: the decoded notification, or None if there isn't one
+        """
+        try:
+            return self.messages.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _run(self) -> None:
+        """
+        The consumer loop, runs on its own thread
+        """
+        failures = 0
+
+        while not self._stop.is_set():
+            try:
+                self.receive_batch()
+                failures = 0
+            except Exception as e: # keep consuming through network blips
+                failures += 1
+                delay = min(2 ** failures, 60)
+                print(f"Error receiving from SQS, retrying in {delay}s: {e}")
+                self._stop.wait(delay)
+
+    def receive_batch(self) -> int:
+        """
+        Receives, delivers and deletes one batch of notifications
+
+        Returns:
+            int: how many new notifications were delivered
+        """
+        response = self.sqs_client.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=10,
+            WaitTimeSeconds=self.wait_seconds
         )
 
         # has to be obtained as a list first
         messages = response.get("Messages", [])
+        delivered = 0
+
+        for message in messages:
+            if self._remember(message["MessageId"]):
+                notification = decode_notification(message["Body"])
+                print("SQS message received:", notification)
+
+                # replies, resolutions and server-side timeouts
+                if notification is not None and ("reply_text" in notification or "status" in notification):
+                    self.messages.put(notification) # waits if the GUI has fallen behind
+                    delivered += 1
 
         if messages:
-            message = messages[0] # get the first item
+            self.delete_batch(messages)
+
+        return delivered
 
-            print(message)
+    def delete_batch(self, messages: list, attempts: int = DELETE_ATTEMPTS) -> list:
+        """
+        Deletes received messages, retrying any the batch reports as failed.
+        Undeleted messages come back once their visibility timeout runs out
 
-            # process the message
-            message_body = message["Body"]
-            message_body = json.loads(message_body) # load into JSON
-            message_body = message_body["Message"] # get message
-            message_body = json.loads(message_body) # load into JSON again
+        Args:
+            messages (list): the messages from receive_message
+            attempts (int): how many times to try each message
 
-            print("SQS message received:", message_body)
-            if "reply_text" in message_body.keys():
-                LATEST_MESSAGE = message_body
+        Returns:
+            list: the Failed entries that still weren't deleted
+        """
+        entries = {str(index): message["ReceiptHandle"] for index, message in enumerate(messages)}
+        failed = []
 
-            # delete from queue after process
-            sqs_client.delete_message(
-                QueueUrl=queue_url,
-                ReceiptHandle=message["ReceiptHandle"]
+        for _ in range(attempts):
+            response = self.sqs_client.delete_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[{"Id": entry_id, "ReceiptHandle": handle} for entry_id, handle in entries.items()]
             )
 
-def setup_aws() -> boto3.client:
+            failed = response.get("Failed", [])
+            # sender faults (e.g. an expired receipt handle) won't go any better next time
+            entries = {entry["Id"]: entries[entry["Id"]] for entry in failed if not entry.get("SenderFault")}
+            if not entries:
+                break
+
+        for entry in failed:
+            print(f"Unable to delete SQS message {entry['Id']}, it will be redelivered: "
+                  f"{entry.get('Code')} {entry.get('Message', '')}")
+
+        return failed
+
+    def _remember(self, message_id: str) -> bool:
+        """
+        Records a MessageId
+
+        Returns:
+            bool: False if we've seen it recently, i.e. it's a redelivery
+        """
+        if message_id in self._seen:
+            self._seen.move_to_end(message_id)
+            return False
+
+        self._seen[message_id] = None
+        while len(self._seen) > self.seen_size:
+            self._seen.popitem(last=False)
+
+        return True
+
+def decode_notification(body: str) -> dict | None:
     """
-    Sets up the AWS client
+    Unwraps an SNS notification delivered through SQS
+
+    Args:
+        body (str): the SQS message body
 
     Returns:
-        the Lambda client, the SQS client
+        dict | None: the notification we published, or None if it isn't one
     """
-    global AWS_CONFIG, SLACK_CONFIG, SQS_CLIENT
-
-    config_defaults = {"aws_access_key": "", "aws_secret": "", "region": "us-east-2", "sns_arn": ""}
     try:
-        with open("config/aws.json", "r", encoding="utf8") as file:
-            AWS_CONFIG = json.load(file)
+        body = json.loads(body) # load into JSON
+        return json.loads(body["Message"]) # get message, load into JSON again
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return None
+
+def device_queue_name(device_id: str, dev: bool = True) -> str:
+    """
+    Gets the name of a device's own notification queue. SNS only delivers
+    a device's notifications to it, see provision_notifications.py
+
+    Args:
+        device_id (str): the device's ID
+        dev (bool): whether we're using the dev AWS instance
+
+    Returns:
+        str: the FIFO queue name
+    """
+    # queue names only allow letters, numbers, hyphens and underscores
+    safe_id = re.sub(r"[^A-Za-z0-9_-]", "_", device_id)
 
-            # if we don't have all required keys, populate the defaults
-            if not all(AWS_CONFIG.get(key) for key in list(config_defaults.keys())):
-                with open("config/aws.json", "w", encoding="utf8") as write_file:
-                    json.dump(config_defaults, write_file)
-    except (FileNotFoundError, json.JSONDecodeError):
-        with open("config/aws.json", "w+", encoding="utf8") as file:
-            print("config/aws.json not found or wrong, creating + populating defaults...")
+    return f"{get_function_name(dev)}-{safe_id}.fifo"
 
-            json.dump(config_defaults, file)
-            print("Please fill out config/aws.json before running again.")
+def get_device_queue_url(sqs_client, device_id: str, dev: bool = True) -> str:
+    """
+    Looks up a device's notification queue, falling back on the shared queue
+    if it hasn't been provisioned yet
+
+    Args:
+        sqs_client (boto3.client): the SQS client we're using
+        device_id (str): the device's ID
+        dev (bool): whether we're using the dev AWS instance
 
-    config_defaults = {"bot_oauth_token": "", "button_config": {"device_id": ""}}
+    Returns:
+        str: the queue URL
+    """
     try:
-        with open("config/slack.json", "r", encoding="utf8") as file:
-            SLACK_CONFIG = json.load(file)
-
-            # if we don't have all required keys, populate the defaults
-            if not all(SLACK_CONFIG.get(key) for key in list(config_defaults.keys())):
-                with open("config/slack.json", "w", encoding="utf8") as write_file:
-                    json.dump(config_defaults, write_file)
-    except (FileNotFoundError, json.JSONDecodeError):
-        with open("config/slack.json", "w+", encoding="utf8") as file:
-            print("config/slack.json not found or wrong, creating + populating defaults...")
-
-            json.dump(config_defaults, file)
-            print("Please fill out config/slack.json before running again.")
-        exit()
-
-    access_key = AWS_CONFIG["aws_access_key"]
-    secret = AWS_CONFIG["aws_secret"]
-    region = AWS_CONFIG["region"]
-    device_id = SLACK_CONFIG["button_config"]["device_id"]
-
-    # set up lambda client
-    client = boto3.client(
-        "lambda",
-        aws_access_key_id=access_key,
-        aws_secret_access_key=secret,
-        region_name=region
-    )
-
-    # set up sqs client
-    SQS_CLIENT = boto3.client(
-        "sqs",
-        aws_access_key_id=access_key,
-        aws_secret_access_key=secret,
-        region_name=region
-    )
-
-    return client, SQS_CLIENT
+        return sqs_client.get_queue_url(QueueName=device_queue_name(device_id, dev))["QueueUrl"]
+    except sqs_client.exceptions.QueueDoesNotExist:
+        print(f"No queue provisioned for device {device_id}, using the shared queue")
+        return SQS_QUEUE_URL
+
+def get_sqs_consumer(sqs_client = None) -> SqsConsumer:
+    """
+    Gets the shared consumer, creating and starting it on first use.
+    Consumes "sqs_queue_url" from config/aws.json if set, otherwise this
+    device's own queue
+
+    Args:
+        sqs_client (boto3.client): the SQS client, defaults to the shared one
+
+    Returns:
+        SqsConsumer: the running consumer
+    """
+    global SQS_CONSUMER
+
+    if SQS_CONSUMER is None:
+        load_configs()
+        sqs_client = sqs_client or get_client("sqs")
+        queue_url = AWS_CONFIG.get("sqs_queue_url") or \
+            get_device_queue_url(sqs_client, SLACK_CONFIG["button_config"]["device_id"])
+
+        SQS_CONSUMER = SqsConsumer(sqs_client, queue_url)
+    SQS_CONSUMER.start()
+
+    return SQS_CONSUMER
+
+def get_notification_consumer():
+    """
+    Gets where the GUI should read notifications from: MQTT push with SQS as
+    a fallback if "push" is enabled in config/aws.json, otherwise just SQS
+
+    Returns:
+        push.PushConsumer | SqsConsumer: the running consumer
+    """
+    global PUSH_CONSUMER
+
+    load_configs()
+    push_config = AWS_CONFIG.get("push", {})
+    if not push_config.get("enabled", False):
+        return get_sqs_consumer()
+
+    if PUSH_CONSUMER is None:
+        import push # deferred, only needed with push enabled
+
+        PUSH_CONSUMER = push.PushConsumer(push_config, SLACK_CONFIG["button_config"]["device_id"],
+                                          get_sqs_consumer())
+        PUSH_CONSUMER.start()
+
+    return PUSH_CONSUMER
+
+def load_configs() -> None:
+    """
+    Reads config/aws.json and config/slack.json, once per process,
+    creating them from defaults if they're missing
+    """
+    global AWS_CONFIG, SLACK_CONFIG, CONFIGS_LOADED
+
+    with INIT_LOCK:
+        if CONFIGS_LOADED:
+            return
+
+        config_defaults = {"aws_access_key": "", "aws_secret": "", "region": "us-east-2", "sns_arn": ""}
+        try:
+            with open("config/aws.json", "r", encoding="utf8") as file:
+                AWS_CONFIG = json.load(file)
+
+                # if we don't have all required keys, populate the defaults
+                if not all(AWS_CONFIG.get(key) for key in list(config_defaults.keys())):
+                    with open("config/aws.json", "w", encoding="utf8") as write_file:
+                        json.dump(config_defaults, write_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with open("config/aws.json", "w+", encoding="utf8") as file:
+                print("config/aws.json not found or wrong, creating + populating defaults...")
+
+                json.dump(config_defaults, file)
+                print("Please fill out config/aws.json before running again.")
+
+        config_defaults = {"bot_oauth_token": "", "button_config": {"device_id": ""}}
+        try:
+            with open("config/slack.json", "r", encoding="utf8") as file:
+                SLACK_CONFIG = json.load(file)
+
+                # if we don't have all required keys, populate the defaults
+                if not all(SLACK_CONFIG.get(key) for key in list(config_defaults.keys())):
+                    with open("config/slack.json", "w", encoding="utf8") as write_file:
+                        json.dump(config_defaults, write_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with open("config/slack.json", "w+", encoding="utf8") as file:
+                print("config/slack.json not found or wrong, creating + populating defaults...")
+
+                json.dump(config_defaults, file)
+                print("Please fill out config/slack.json before running again.")
+            exit()
+
+        CONFIGS_LOADED = True
+
+class ClientFactory:
+    """
+    Builds boto3 clients on first use from one shared session, with explicit
+    timeouts, adaptive retries and connection pools sized for the threads
+    that use them. Building a client is slow on a Pi, so each one is built
+    once and how long it took is recorded in timings.
+    """
+
+    # per-service settings on top of the defaults below. the SQS read timeout
+    # has to outlast a 20 second long poll
+    SERVICE_SETTINGS = {
+        "lambda": {"read_timeout": 15},
+        "sqs": {"read_timeout": 25}
+    }
+
+    def __init__(self, aws_config: dict, connect_timeout: float = 3, read_timeout: float = 10,
+                 max_attempts: int = 3, max_pool_connections: int = INVOKE_WORKERS + 2):
+        """
+        Args:
+            aws_config (dict): the parsed config/aws.json
+            connect_timeout (float): how long to wait for a connection, in seconds
+            read_timeout (float): how long to wait for a response, in seconds
+            max_attempts (int): the most retries per call, on top of the first attempt
+            max_pool_connections (int): keep-alive connections per client, enough for the
+                invoker's workers plus the SQS consumer
+        """
+        self.aws_config = aws_config
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_attempts = max_attempts
+        self.max_pool_connections = max_pool_connections
+
+        self.timings = {} # "session" or service -> ms spent building it
+        self._session = None
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def client(self, service: str):
+        """
+        Gets a client, building it on first use
+
+        Args:
+            service (str): the AWS service, e.g. "sqs"
+
+        Returns:
+            boto3.client: the client
+        """
+        with self._lock:
+            if service not in self._clients:
+                if self._session is None:
+                    import boto3 # deferred, see the top of this module
+
+                    start = time.perf_counter()
+                    self._session = boto3.session.Session(
+                        aws_access_key_id=self.aws_config.get("aws_access_key") or None,
+                        aws_secret_access_key=self.aws_config.get("aws_secret") or None,
+                        region_name=self.aws_config.get("region")
+                    )
+                    self.timings["session"] = (time.perf_counter() - start) * 1000
+
+                start = time.perf_counter()
+                self._clients[service] = self._session.client(
+                    service,
+                    config=self.client_config(service),
+                    endpoint_url=self.aws_config.get("endpoint_url") or None # e.g. a local SNS/SQS stand-in
+                )
+                self.timings[service] = (time.perf_counter() - start) * 1000
+                print(f"Built {service} client in {self.timings[service]:.1f} ms")
+
+            return self._clients[service]
+
+    def client_config(self, service: str):
+        """
+        Gets the botocore settings for a service
+
+        Args:
+            service (str): the AWS service
+
+        Returns:
+            botocore.config.Config: the settings
+        """
+        from botocore.config import Config
+
+        settings = {
+            "connect_timeout": self.connect_timeout,
+            "read_timeout": self.read_timeout,
+            "retries": {"mode": "adaptive", "max_attempts": self.max_attempts},
+            "max_pool_connections": self.max_pool_connections,
+            "tcp_keepalive": True
+        }
+        settings.update(self.SERVICE_SETTINGS.get(service, {}))
+
+        return Config(**settings)
+
+def get_client(service: str):
+    """
+    Gets a client from the shared factory, building it on first use
+
+    Args:
+        service (str): the AWS service, e.g. "lambda"
+
+    Returns:
+        boto3.client: the client
+    """
+    global CLIENT_FACTORY
+
+    with INIT_LOCK:
+        load_configs()
+        if CLIENT_FACTORY is None:
+            CLIENT_FACTORY = ClientFactory(AWS_CONFIG)
+
+    # building the client itself is serialized by the factory's own lock
+    return CLIENT_FACTORY.client(service)
+
+def warm_up_clients(services: tuple = ("lambda", "sqs")) -> threading.Thread:
+    """
+    Builds clients in the background so the first press doesn't wait on them
+
+    Args:
+        services (tuple): the services to build
+
+    Returns:
+        threading.Thread: the thread doing the work
+    """
+    def worker():
+        start = time.perf_counter()
+        for service in services:
+            get_client(service)
+        print(f"AWS clients ready in {(time.perf_counter() - start) * 1000:.1f} ms: {CLIENT_FACTORY.timings}")
+
+    thread = threading.Thread(target=worker, daemon=True, name="aws-warm-up")
+    thread.start()
+
+    return thread
+
+def setup_aws():
+    """
+    Sets up the AWS clients
+
+    Returns:
+        the Lambda client, the SQS client
+    """
+    global SQS_CLIENT
+
+    SQS_CLIENT = get_client("sqs")
+
+    return get_client("lambda"), SQS_CLIENT
 
 if __name__ == "__main__":
     lambda_client, sqs_client = setup_aws()
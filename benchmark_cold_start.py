@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+"""
+Measures lambda_function.py cold starts: how long the import takes and how long
+the first invocation takes, per event type, using the events in aws_json/.
+Each run is a fresh interpreter so nothing is warm.
+
+Like replay.py, it runs offline: the function gets throwaway config from a
+temp directory pointing Slack at replay.FakeSlackServer, and SNS is replaced
+by replay.FakeSNSClient once the import has been timed. Nothing reaches the
+real workspace, and every run starts with an empty rate limiter.
+
+Usage:
+    python benchmark_cold_start.py [--runs 5] [--json results.json] [fixtures...]
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from replay import FakeSlackServer, write_offline_config
+
+FIXTURE_DIR = "aws_json"
+
+# runs inside the fresh interpreter, prints one JSON line of timings
+CHILD_SCRIPT = """
+import json, sys, time
+
+sys.path.insert(0, sys.argv[2]) # the repo, we run from the scratch config directory
+
+start = time.perf_counter()
+import lambda_function
+imported = time.perf_counter()
+
+from replay import FakeSNSClient
+lambda_function.SNS_CLIENT = FakeSNSClient()
+
+with open(sys.argv[1], "r", encoding="utf8") as file:
+    event = json.load(file)
+
+error = None
+invoke_start = time.perf_counter()
+try:
+    status = lambda_function.lambda_handler(event, None).get("statusCode")
+except Exception as e: # downstream failures still tell us how long we took
+    status = None
+    error = repr(e)
+invoked = time.perf_counter()
+
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_invoke_ms": (invoked - invoke_start) * 1000,
+    "status": status,
+    "error": error,
+    "boto3_loaded": "boto3" in sys.modules,
+    "requests_loaded": "requests" in sys.modules
+}))
+"""
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def run_once(fixture: str, scratch: str) -> dict:
+    """
+    Runs one cold start in a fresh interpreter
+
+    Args:
+        fixture (str): the path of the event to invoke with
+        scratch (str): the directory holding the offline config to run in
+
+    Returns:
+        dict: the child's timings
+    """
+    result = subprocess.run([sys.executable, "-c", CHILD_SCRIPT, os.path.abspath(fixture), REPO_DIR],
+                            cwd=scratch, capture_output=True, text=True, check=False)
+
+    # the handler prints plenty, our line is the last one
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        raise RuntimeError(f"Cold start run failed for {fixture}:\n{result.stderr}")
+
+    return json.loads(lines[-1])
+
+def benchmark(fixtures: list, runs: int, scratch: str) -> dict:
+    """
+    Runs every fixture several times and summarizes the results
+
+    Args:
+        fixtures (list): paths of events to invoke with
+        runs (int): how many cold starts per fixture
+        scratch (str): the directory holding the offline config to run in
+
+    Returns:
+        dict: fixture -> summary
+    """
+    summaries = {}
+
+    for fixture in fixtures:
+        samples = [run_once(fixture, scratch) for _ in range(runs)]
+        last = samples[-1]
+
+        summaries[fixture] = {
+            "event_type": event_type(fixture),
+            "runs": runs,
+            "import_ms_median": statistics.median(s["import_ms"] for s in samples),
+            "first_invoke_ms_median": statistics.median(s["first_invoke_ms"] for s in samples),
+            "status": last["status"],
+            "error": last["error"],
+            "boto3_loaded": last["boto3_loaded"],
+            "requests_loaded": last["requests_loaded"]
+        }
+
+    return summaries
+
+def event_type(fixture: str) -> str:
+    """
+    Gets the event type of a fixture, unwrapping event_callback
+
+    Args:
+        fixture (str): the path of the event
+
+    Returns:
+        str: the event type
+    """
+    with open(fixture, "r", encoding="utf8") as file:
+        body = json.load(file).get("body", {})
+
+    if isinstance(body, str):
+        body = json.loads(body)
+    if body.get("type") == "event_callback":
+        return body.get("event", {}).get("type", "event_callback")
+
+    return body.get("type", "unknown")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("Usage:")[0].strip())
+    parser.add_argument("fixtures", nargs="*", help="events to invoke with, defaults to everything in aws_json/")
+    parser.add_argument("--runs", type=int, default=5, help="cold starts per fixture")
+    parser.add_argument("--json", help="also write the results to this file, for tracking over time")
+    args = parser.parse_args()
+
+    fixtures = args.fixtures or sorted(os.path.join(FIXTURE_DIR, name) for name in os.listdir(FIXTURE_DIR))
+
+    slack = FakeSlackServer()
+    slack.start()
+    scratch = tempfile.mkdtemp(prefix="slack-lambda-cold-start-")
+    write_offline_config(scratch, argparse.Namespace(state_store="memory", log_level="WARNING",
+                                                     fast_ack=False), slack.url)
+    try:
+        summaries = benchmark(fixtures, args.runs, scratch)
+    finally:
+        slack.stop()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    print(f"{'event type':<18} {'import ms':>10} {'1st invoke ms':>14} {'boto3':>6} {'requests':>9}  status")
+    for summary in summaries.values():
+        status = summary["status"] if summary["error"] is None else summary["error"][:40]
+        print(f"{summary['event_type']:<18} {summary['import_ms_median']:>10.1f} "
+              f"{summary['first_invoke_ms_median']:>14.1f} {str(summary['boto3_loaded']):>6} "
+              f"{str(summary['requests_loaded']):>9}  {status}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf8") as file:
+            json.dump(summaries, file, indent=2)
+
+if __name__ == "__main__":
+    main()
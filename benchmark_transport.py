@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+"""
+Compares press-to-posted latency across the kiosk transports (see
+transport.py), offline. Slack is the fake Web API from replay.py and the
+Lambda invoke is modeled by a stand-in client that adds a fixed overhead
+before running lambda_handler in-process.
+
+Usage:
+    python benchmark_transport.py [--posts 50] [--slack-latency-ms 120] [--invoke-latency-ms 80]
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import argparse
+import importlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+from replay import FakeSlackServer, FakeSNSClient, percentile, write_offline_config
+
+class FakeLambdaClient:
+    """
+    Stands in for a boto3 Lambda client: waits invoke_latency_ms to model
+    the network hop and Lambda overhead, then runs lambda_handler
+    """
+
+    def __init__(self, lambda_function, invoke_latency_ms: float = 0):
+        """
+        Args:
+            lambda_function: the imported lambda_function module
+            invoke_latency_ms (float): added to every invoke
+        """
+        self.lambda_function = lambda_function
+        self.invoke_latency_ms = invoke_latency_ms
+
+    def invoke(self, FunctionName: str, Payload: str, InvocationType: str = "RequestResponse"):
+        time.sleep(self.invoke_latency_ms / 1000)
+        response = self.lambda_function.lambda_handler(json.loads(Payload), None)
+
+        return {"StatusCode": 200, "Payload": io.BytesIO(json.dumps(response).encode("utf-8"))}
+
+def benchmark(transport, posts: int, name: str) -> dict:
+    """
+    Posts through a transport and times each post
+
+    Args:
+        transport (transport.Transport): the transport to measure
+        posts (int): how many posts to send
+        name (str): the transport's name, keeps device IDs unique between runs
+
+    Returns:
+        dict: p50/p95/max latency in ms
+    """
+    latencies = []
+
+    for index in range(posts):
+        # a fresh device per post so the rate limiter stays out of the way
+        start = time.perf_counter()
+        message_id, _ = transport.post("benchmark", "CBENCH", f"bench-{name}-{index}")
+        latencies.append(time.perf_counter() - start)
+
+        if message_id in (None, "N/A"):
+            raise RuntimeError(f"Post {index} wasn't posted")
+
+    return {
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "max_ms": max(latencies) * 1000
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("Usage:")[0].strip())
+    parser.add_argument("--posts", type=int, default=50, help="posts per transport")
+    parser.add_argument("--slack-latency-ms", type=float, default=120, help="added to every fake Slack call")
+    parser.add_argument("--invoke-latency-ms", type=float, default=80,
+                        help="the modeled Lambda invoke overhead")
+    args = parser.parse_args()
+
+    slack = FakeSlackServer(args.slack_latency_ms)
+    slack.start()
+
+    # the same scratch config replay.py uses, so nothing reaches the real workspace
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, repo_dir)
+    scratch = tempfile.mkdtemp(prefix="slack-lambda-transport-")
+    write_offline_config(scratch, argparse.Namespace(state_store="memory", log_level="WARNING",
+                                                     fast_ack=False), slack.url)
+    os.chdir(scratch)
+
+    lambda_function = importlib.import_module("lambda_function")
+    lambda_function.SNS_CLIENT = FakeSNSClient()
+    aws = importlib.import_module("aws")
+    transport = importlib.import_module("transport")
+
+    transports = {
+        "lambda": transport.LambdaTransport(
+            aws.AsyncInvoker(FakeLambdaClient(lambda_function, args.invoke_latency_ms), "benchmark")
+        ),
+        "direct": transport.DirectSlackTransport(),
+        "in_process": transport.InProcessTransport()
+    }
+
+    print(f"{'transport':<12} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for name, instance in transports.items():
+        result = benchmark(instance, args.posts, name)
+        print(f"{name:<12} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['max_ms']:>8.1f}")
+
+    slack.stop()
+
+if __name__ == "__main__":
+    main()
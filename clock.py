@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+"""
+A background clock for the kiosk. The offset between the system clock and a
+time source is estimated every so often, NTP-style: a few samples are taken,
+the one with the shortest round trip wins and half its round trip is added
+on. now() is anchored to the monotonic clock, so it never touches the network
+and doesn't jump if the system clock is changed under it. The system clock
+itself is only set when it has drifted past a threshold.
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import sys
+import threading
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from subprocess import DEVNULL, STDOUT, CalledProcessError, check_call
+
+import requests
+from requests.exceptions import RequestException
+
+TIME_SOURCE = "http://worldtimeapi.org/api/timezone/America/Detroit"
+SYNC_INTERVAL = 15 * 60 # in seconds
+SAMPLES = 3 # per sync, the shortest round trip is kept
+DRIFT_THRESHOLD = 2 # in seconds, how far off the system clock may get before it's set
+TIME_FORMAT = "%B %d, %Y %I:%M:%S %p"
+
+is_raspberry_pi = not sys.platform.startswith("win32")
+
+def fetch_source_time(source: str, timeout: float = 3) -> float:
+    """
+    Asks the time source what time it is
+
+    Args:
+        source (str): a URL returning worldtimeapi-style JSON ("datetime" or "unixtime") or,
+            failing that, any URL with an HTTP Date header
+        timeout (float): the request timeout, in seconds
+
+    Returns:
+        float: the source's time as a Unix timestamp
+    """
+    response = requests.get(source, timeout=timeout)
+    response.raise_for_status()
+
+    try:
+        data = response.json()
+        if "datetime" in data: # has microseconds, unixtime is whole seconds
+            return datetime.fromisoformat(data["datetime"]).timestamp()
+        return float(data["unixtime"])
+    except (ValueError, KeyError, TypeError):
+        return parsedate_to_datetime(response.headers["Date"]).timestamp()
+
+class Clock:
+    """
+    The source's time, kept in step with the monotonic clock between syncs.
+    Until the first sync succeeds, now() is just the system clock
+    """
+
+    def __init__(self, source: str = TIME_SOURCE, sync_interval: float = SYNC_INTERVAL,
+                 drift_threshold: float = DRIFT_THRESHOLD, set_system_clock: bool = is_raspberry_pi):
+        """
+        Args:
+            source (str): where to get the time from, see fetch_source_time
+            sync_interval (float): how often to sync, in seconds
+            drift_threshold (float): how far off the system clock may get before
+                it's set, in seconds
+            set_system_clock (bool): whether to set the system clock at all (needs sudo)
+        """
+        self.source = source
+        self.sync_interval = sync_interval
+        self.drift_threshold = drift_threshold
+        self.set_system_clock = set_system_clock
+
+        # the source's time at one monotonic instant, replaced as a pair
+        self.anchor = None
+        self.last_offset = None # source - system clock at the last sync, in seconds
+        self.last_round_trip = None
+
+        self._thread = None
+
+    def now(self) -> float:
+        """
+        Gets the current time, without touching the network
+
+        Returns:
+            float: a Unix timestamp
+        """
+        anchor = self.anchor
+        if anchor is None:
+            return time.time()
+
+        monotonic_at, source_at = anchor
+        return source_at + (time.monotonic() - monotonic_at)
+
+    def sync(self, samples: int = SAMPLES) -> float:
+        """
+        Estimates the offset from the time source and re-anchors now()
+
+        Args:
+            samples (int): how many round trips to take
+
+        Returns:
+            float: the system clock's offset from the source, in seconds
+        """
+        best = None # (round trip, monotonic at the midpoint, source time, system time at the midpoint)
+
+        for _ in range(samples):
+            sent_monotonic, sent_wall = time.monotonic(), time.time()
+            source_time = fetch_source_time(self.source)
+            round_trip = time.monotonic() - sent_monotonic
+
+            # the source most likely answered halfway through the round trip
+            if best is None or round_trip < best[0]:
+                best = (round_trip, sent_monotonic + round_trip / 2, source_time, sent_wall + round_trip / 2)
+
+        round_trip, monotonic_at, source_time, wall_at = best
+        offset = source_time - wall_at
+
+        self.anchor = (monotonic_at, source_time)
+        self.last_offset = offset
+        self.last_round_trip = round_trip
+
+        print(f"Clock synced: system clock off by {offset:+.3f} s (round trip {round_trip * 1000:.0f} ms)")
+
+        if self.set_system_clock and abs(offset) > self.drift_threshold:
+            self.correct_system_clock()
+
+        return offset
+
+    def correct_system_clock(self) -> None:
+        """
+        Sets the system clock to now() (Linux only)
+        """
+        try:
+            check_call(["sudo", "date", "-s", f"@{self.now():.3f}"], stdout=DEVNULL, stderr=STDOUT)
+            print("System clock set")
+        except (OSError, CalledProcessError) as e: # no sudo, no date, etc.
+            print(f"Unable to set the system clock: {e}")
+
+    def start(self) -> None:
+        """
+        Starts syncing in the background, right away and then every sync_interval
+        """
+        if self._thread is not None:
+            return
+
+        def worker():
+            while True:
+                try:
+                    self.sync()
+                except (RequestException, ValueError, KeyError, TypeError) as e:
+                    print(f"Unable to sync the clock, keeping the last estimate: {e}")
+
+                time.sleep(self.sync_interval)
+
+        self._thread = threading.Thread(target=worker, daemon=True, name="clock-sync")
+        self._thread.start()
+
+    def format(self, timestamp: float = None) -> str:
+        """
+        Formats a time (by default now()) as a beautifully formatted local time string
+
+        Args:
+            timestamp (float): a Unix timestamp
+
+        Returns:
+            str: the formatted time
+        """
+        return datetime.fromtimestamp(self.now() if timestamp is None else timestamp).strftime(TIME_FORMAT)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+"""
+Hands Slack events off to be processed after the Lambda function has already
+acknowledged them, so slow Slack/SNS calls can't push us past Slack's
+3 second retry deadline.
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import hashlib
+import hmac
+import json
+import queue
+import threading
+import time
+
+import structured_log
+
+# Slack rejects anything older than this itself, so we do too
+SIGNATURE_MAX_AGE = 5 * 60 # in seconds
+
+def verify_slack_signature(signing_secret: str, headers: dict, raw_body: str) -> bool:
+    """
+    Verifies that a request really came from Slack using its signing secret.
+    See https://api.slack.com/authentication/verifying-requests-from-slack
+
+    Args:
+        signing_secret (str): the app's signing secret
+        headers (dict): the request headers
+        raw_body (str): the request body, exactly as received
+
+    Returns:
+        bool: whether the signature is valid and recent
+    """
+    headers = {key.lower(): value for key, value in (headers or {}).items()}
+    timestamp = headers.get("x-slack-request-timestamp", "")
+    signature = headers.get("x-slack-signature", "")
+
+    try:
+        if abs(time.time() - int(timestamp)) > SIGNATURE_MAX_AGE:
+            return False
+    except ValueError:
+        return False
+
+    base_string = f"v0:{timestamp}:{raw_body}".encode("utf-8")
+    expected = "v0=" + hmac.new(signing_secret.encode("utf-8"), base_string, hashlib.sha256).hexdigest()
+
+    return hmac.compare_digest(expected, signature)
+
+class LambdaSelfInvokeStage:
+    """
+    Defers events by asynchronously invoking this same Lambda function
+    (InvocationType="Event"), which returns as soon as AWS has queued it.
+    The execution role needs lambda:InvokeFunction on the function itself.
+    """
+
+    def __init__(self, lambda_client, function_name: str = None):
+        """
+        Args:
+            lambda_client (boto3.client): the Lambda client to invoke with
+            function_name (str): the function to invoke, defaults to the running one
+        """
+        self.lambda_client = lambda_client
+        self.function_name = function_name
+
+    def submit(self, event_body: dict, context: object = None) -> None:
+        """
+        Queues an event to be processed by another invocation
+
+        Args:
+            event_body (dict): the decoded Slack request body
+            context (object): the Lambda runtime information, for the function name
+        """
+        function_name = self.function_name or getattr(context, "invoked_function_arn", None)
+
+        self.lambda_client.invoke(
+            FunctionName=function_name,
+            InvocationType="Event",
+            Payload=json.dumps({"deferred": True, "enqueued_at": time.time(), "body": event_body})
+        )
+
+class LocalQueueStage:
+    """
+    An in-process stand-in for the deferred stage. A worker thread drains a
+    queue, so tests can measure acknowledgement and processing separately.
+    """
+
+    def __init__(self, process, log: structured_log.StructuredLogger = None):
+        """
+        Args:
+            process (Callable[[dict], dict]): processes one decoded request body
+            log (structured_log.StructuredLogger): where failed events are logged,
+                defaults to stdout
+        """
+        self.process = process
+        self.log = log or structured_log.StructuredLogger()
+        self.processing_latencies = [] # seconds from submit to done, per event
+
+        self._queue = queue.Queue()
+        self._latencies_lock = threading.Lock()
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, event_body: dict, context: object = None) -> None:
+        """
+        Queues an event to be processed by the worker thread
+
+        Args:
+            event_body (dict): the decoded Slack request body
+            context (object): unused, matches LambdaSelfInvokeStage
+        """
+        self._queue.put((time.perf_counter(), event_body))
+
+    def join(self) -> None:
+        """
+        Blocks until every submitted event has been processed
+        """
+        self._queue.join()
+
+    def _worker(self) -> None:
+        while True:
+            enqueued_at, event_body = self._queue.get()
+            try:
+                self.process(event_body)
+            except Exception as e: # a bad event shouldn't kill the worker
+                self.log.error("Deferred event failed", error=repr(e),
+                               event_id=event_body.get("event_id"))
+            finally:
+                with self._latencies_lock:
+                    self.processing_latencies.append(time.perf_counter() - enqueued_at)
+                self._queue.task_done()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+"""
+The device configuration table from the config spreadsheet, held in memory.
+The whole table is read in one request, indexed by device ID and refreshed in
+the background, so looking up a device on a press never touches the network.
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import threading
+import time
+
+TABLE_RANGE = "A:I"
+REFRESH_INTERVAL = 5 * 60 # in seconds
+
+# field -> header names it may appear under (compared lowercased, spaces as
+# underscores) and the column it used to be read from, for sheets whose
+# headers don't match
+COLUMNS = {
+    "device_id": (("device_id", "device", "id"), 1),
+    "mac": (("mac", "mac_address", "device_mac"), 2),
+    "location": (("location", "device_location"), 3),
+    "message": (("message", "device_message"), 4),
+    "function": (("function", "device_function"), 5),
+    "rate_limit": (("rate_limit", "ratelimit", "rate_limit_(s)", "rate_limit_seconds"), 7),
+    "channel_id": (("channel_id", "channel", "slack_channel", "slack_channel_id"), 8)
+}
+
+class DeviceConfig:
+    """
+    One device's row from the config spreadsheet
+    """
+
+    __slots__ = ("device_id", "mac", "location", "message", "function", "rate_limit", "channel_id")
+
+    def __init__(self, device_id: str, mac: str = "", location: str = "", message: str = "",
+                 function: str = "", rate_limit: int = 0, channel_id: str = ""):
+        """
+        Args:
+            device_id (str): the device's ID
+            mac (str): the device's MAC address
+            location (str): where the device is, shown in logs
+            message (str): what a press posts to Slack
+            function (str): what the device is for
+            rate_limit (int): the fewest seconds allowed between posts
+            channel_id (str): the Slack channel posts go to
+        """
+        self.device_id = device_id
+        self.mac = mac
+        self.location = location
+        self.message = message
+        self.function = function
+        self.rate_limit = rate_limit
+        self.channel_id = channel_id
+
+    def __repr__(self) -> str:
+        return f"DeviceConfig({', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)})"
+
+def column_indexes(header: list) -> dict:
+    """
+    Works out which column each field is in from the header row
+
+    Args:
+        header (list): the first row of the table
+
+    Returns:
+        dict: field -> column index
+    """
+    normalized = [str(cell).strip().lower().replace(" ", "_") for cell in header]
+    indexes = {}
+
+    for field, (names, fallback_index) in COLUMNS.items():
+        indexes[field] = next((normalized.index(name) for name in names if name in normalized), fallback_index)
+
+    return indexes
+
+def parse_table(rows: list) -> dict:
+    """
+    Builds the device table from the spreadsheet's rows
+
+    Args:
+        rows (list): the rows, header first
+
+    Returns:
+        dict: device ID -> DeviceConfig
+    """
+    if not rows:
+        return {}
+
+    indexes = column_indexes(rows[0])
+    devices = {}
+
+    for row in rows[1:]:
+        cells = {field: row[index].strip() if index < len(row) else "" for field, index in indexes.items()}
+        if not cells["device_id"]:
+            continue
+
+        try:
+            rate_limit = int(cells["rate_limit"] or 0)
+        except ValueError:
+            print(f"Device {cells['device_id']} has a bad rate limit {cells['rate_limit']!r}, using 0")
+            rate_limit = 0
+
+        devices[cells["device_id"]] = DeviceConfig(
+            cells["device_id"], cells["mac"], cells["location"], cells["message"],
+            cells["function"], rate_limit, cells["channel_id"]
+        )
+
+    return devices
+
+class DeviceConfigTable:
+    """
+    Every device's config, swapped in whole after each refresh so a lookup
+    always sees one complete version of the table
+    """
+
+    def __init__(self, sheets_service, spreadsheet_id: str, refresh_interval: float = REFRESH_INTERVAL):
+        """
+        Args:
+            sheets_service: the Google Sheets service to read with
+            spreadsheet_id (str): the config spreadsheet
+            refresh_interval (float): how often to re-read the table, in seconds
+        """
+        self.sheets_service = sheets_service
+        self.spreadsheet_id = spreadsheet_id
+        self.refresh_interval = refresh_interval
+
+        self.devices = {} # device ID -> DeviceConfig, replaced, never modified
+        self.loaded_at = None
+        self._thread = None
+
+    def load(self) -> int:
+        """
+        Reads the whole table in one request and swaps it in
+
+        Returns:
+            int: how many devices were loaded
+        """
+        result = (
+            self.sheets_service.spreadsheets()
+            .values()
+            .get(spreadsheetId=self.spreadsheet_id, range=TABLE_RANGE)
+            .execute()
+        )
+
+        devices = parse_table(result.get("values", []))
+        self.devices = devices # a single assignment, so readers never see half a table
+        self.loaded_at = time.time()
+
+        print(f"Device config table loaded: {len(devices)} devices")
+        return len(devices)
+
+    def get(self, device_id: str) -> DeviceConfig | None:
+        """
+        Looks up a device, from memory only
+
+        Args:
+            device_id (str): the device's ID
+
+        Returns:
+            DeviceConfig | None: the device's config, or None if it isn't listed
+        """
+        return self.devices.get(device_id)
+
+    def start_refresh(self) -> None:
+        """
+        Starts re-reading the table in the background every refresh_interval
+        """
+        if self._thread is not None:
+            return
+
+        def worker():
+            while True:
+                time.sleep(self.refresh_interval)
+                try:
+                    self.load()
+                except Exception as e: # keep the table we have until the next try
+                    print(f"Unable to refresh device config table: {e}")
+
+        self._thread = threading.Thread(target=worker, daemon=True, name="device-config-refresh")
+        self._thread.start()
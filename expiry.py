@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+"""
+A time-ordered index of deadlines, used to find pending help requests that
+have gone unanswered for too long. It lives in the state store as one key per
+minute of deadlines ("expiry:<bucket>"), so a sweep reads only the buckets
+that have come due since the last sweep, never the whole table.
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import math
+import time
+
+import state_store
+
+BUCKET_SECONDS = 60
+KEY_PREFIX = "expiry:"
+CURSOR_KEY = f"{KEY_PREFIX}cursor" # the last bucket every sweep is done with
+
+class ExpiryIndex:
+    """
+    Message deadlines, bucketed by the minute. A message may be indexed more
+    than once (say its deadline moved); sweeps check the message itself
+    before acting, so stale entries are only ever skipped.
+    """
+
+    def __init__(self, store: state_store.StateStore, ttl: float,
+                 bucket_seconds: float = BUCKET_SECONDS):
+        """
+        Args:
+            store (state_store.StateStore): where the buckets live
+            ttl (float): how long a message can stay in the index, in seconds.
+                Buckets expire after this, and the first sweep looks back this far
+            bucket_seconds (float): how much time each bucket covers
+        """
+        self.store = store
+        self.ttl = ttl
+        self.bucket_seconds = bucket_seconds
+
+    def bucket(self, deadline: float) -> int:
+        """
+        Gets the bucket a deadline falls in
+
+        Args:
+            deadline (float): an epoch time
+
+        Returns:
+            int: the bucket number
+        """
+        return int(deadline // self.bucket_seconds)
+
+    def add(self, message_id: str, deadline: float) -> None:
+        """
+        Indexes a message under its deadline
+
+        Args:
+            message_id (str): the message ID/timestamp
+            deadline (float): the epoch time the message expires at
+        """
+        def insert(current: dict | None) -> dict:
+            due = dict((current or {}).get("due", {}))
+            due[message_id] = deadline
+            return {"due": due}
+
+        self.store.update(f"{KEY_PREFIX}{self.bucket(deadline)}", insert, ttl=self.ttl)
+
+    def pop_due(self, now: float = None) -> list:
+        """
+        Gets every indexed message whose deadline has passed, oldest first,
+        and forgets them. Buckets that have fully passed are deleted and the
+        cursor moves past them, so the next sweep starts where this one stopped
+
+        Args:
+            now (float): the current epoch time, defaults to time.time()
+
+        Returns:
+            list: the overdue message IDs
+        """
+        now = time.time() if now is None else now
+        current = self.bucket(now)
+
+        cursor = self.store.get(CURSOR_KEY)
+        # buckets older than the TTL have expired along with their messages
+        oldest = current - math.ceil(self.ttl / self.bucket_seconds)
+        first = max(cursor["bucket"] + 1, oldest) if cursor else oldest
+
+        due = []
+        for bucket in range(first, current + 1):
+            key = f"{KEY_PREFIX}{bucket}"
+
+            if bucket < current:
+                # nothing more can land in a bucket that's fully passed
+                entries = (self.store.pop(key) or {}).get("due", {})
+                due += entries.items()
+                continue
+
+            # the current bucket keeps whatever isn't due yet
+            taken = {}
+
+            def take_due(value: dict | None) -> dict | None:
+                taken.clear()
+                entries = (value or {}).get("due", {})
+                taken.update({message_id: deadline for message_id, deadline in entries.items()
+                              if deadline <= now})
+                if not taken:
+                    return None
+
+                return {"due": {message_id: deadline for message_id, deadline in entries.items()
+                                if message_id not in taken}}
+
+            self.store.update(key, take_due, ttl=self.ttl)
+            due += taken.items()
+
+        if first < current:
+            self.store.update(CURSOR_KEY,
+                              lambda value: None if value and value["bucket"] >= current - 1
+                              else {"bucket": current - 1})
+
+        # a message indexed twice comes back once
+        return list(dict.fromkeys(message_id for message_id, _ in sorted(due, key=lambda entry: entry[1])))
@@ -14,7 +14,7 @@ from tkinter import ttk
 import tkinter.font as tkFont
 
 import sys
-import threading # for sqs polling
+import threading
 
 from PIL import Image, ImageTk
 
@@ -33,6 +33,10 @@ import auto_updater
 MAIZE = "#FFCB05"
 BLUE = "#00274C"
 PRESS_START = None # for long button presses
+MESSAGE_CHECK_MS = 100 # how often the post-interaction screen checks for replies
+
+RATE_LIMIT_NOTICE = "Rate limit applied. Please wait before tapping again."
+POST_FAILED_NOTICE = "Sorry, your request couldn't be sent. Please tap again."
 
 pending_message_ids = [] # pending messages from this device specifically
 message_to_channel = {} # maps message ids to channel ids
@@ -43,8 +47,9 @@ frames = []
 frames_ready = False
 frames_lock = threading.Lock()
 
+TK_CALLBACKS = None # runs background results on the Tk thread, see display_gui
+
 LOGGING_SHEETS_SERVICE, LOGGING_SPREADSHEET_ID = None, None
-CONFIG_SHEETS_SERVICE, CONFIG_SPREADSHEET_ID = None, None
 
 if is_simpleaudio_installed:
     INTERACT_SOUND = sa.WaveObject.from_wave_file("audio/send.wav")
@@ -214,13 +219,18 @@ def handle_interaction(root: tk.Tk, frame: tk.Frame, style: ttk.Style,
             root.quit()  # exit cleanly on long press
             return
 
-        message_id, channel_id = slack.handle_interaction(
-            slack.lambda_client, do_post,
-            (current_time - PRESS_START) if PRESS_START else 0
+        # filled in by the countdown this press starts, so a dropped post can end it
+        request = {"cancel": None, "notice": None}
+
+        # queued, not sent, so this returns without touching the network
+        result = slack.handle_interaction(
+            do_post,
+            (current_time - PRESS_START) if PRESS_START else 0,
+            lambda posted, error: TK_CALLBACKS.put(record_posted_message, posted, error, request)
         )
 
         def gui_update():
-            if message_id != "statusCode":
+            if not isinstance(result, dict): # a dict means rate limited
                 # clear display and switch frames
                 for widget in frame.winfo_children():
                     widget.place_forget()
@@ -228,28 +238,35 @@ def handle_interaction(root: tk.Tk, frame: tk.Frame, style: ttk.Style,
                 root.unbind("<ButtonPress-1>")
                 root.unbind("<ButtonRelease-1>")
 
-                display_post_interaction(root, frame, style, do_post)
-
-                with pending_message_ids_lock:
-                    pending_message_ids.append(message_id)
-                message_to_channel[message_id] = channel_id
+                display_post_interaction(root, frame, style, do_post, request)
 
                 if is_simpleaudio_installed:
                     INTERACT_SOUND.play()
             else:
-                ratelimit_label = ttk.Label(frame, text="Rate limit applied. Please wait before tapping again.",
-                                            style="Escape.TLabel")
-                ratelimit_label.place(relx=0.5, rely=0.99, anchor="s")
-                if is_simpleaudio_installed:
-                    RATELIMIT_SOUND.play()
-                root.after(3 * 1000, fade_label, root,
-                           ratelimit_label, hex_to_rgb(MAIZE), hex_to_rgb(BLUE), 0, 1500)
+                show_notice(root, frame, RATE_LIMIT_NOTICE)
 
         root.after(0, gui_update)
 
     threading.Thread(target=worker, daemon=True).start()
 
-def display_post_interaction(root: tk.Tk, frame: tk.Frame, style: ttk.Style, do_post: bool) -> None:
+def show_notice(root: tk.Tk, frame: tk.Frame, text: str) -> None:
+    """
+    Shows a short notice along the bottom of the screen that fades away
+
+    Args:
+        root (tk.Tk): the root window
+        frame (tk.Frame): the frame to show it in
+        text (str): the notice
+    """
+    notice_label = ttk.Label(frame, text=text, style="Escape.TLabel")
+    notice_label.place(relx=0.5, rely=0.99, anchor="s")
+    if is_simpleaudio_installed:
+        RATELIMIT_SOUND.play()
+    root.after(3 * 1000, fade_label, root,
+               notice_label, hex_to_rgb(MAIZE), hex_to_rgb(BLUE), 0, 1500)
+
+def display_post_interaction(root: tk.Tk, frame: tk.Frame, style: ttk.Style, do_post: bool,
+                             request: dict = None) -> None:
     """
     Displays the post interaction instructions
 
@@ -258,6 +275,8 @@ def display_post_interaction(root: tk.Tk, frame: tk.Frame, style: ttk.Style, do_
         frame (tk.Frame): the frame
         style (ttk.Style): the style manager for our window
         do_post (bool): whether to post to Slack
+        request (dict): the press's request, given a "cancel" callback that
+            record_posted_message calls with a notice if its post is dropped
     """
 
     base_timeout = 180
@@ -305,109 +324,137 @@ def display_post_interaction(root: tk.Tk, frame: tk.Frame, style: ttk.Style, do_
     # Initial update
     update_text_widget()
 
-    polling_thread = threading.Thread(target=aws.poll_sqs,
-                                      args=[aws.SQS_CLIENT, slack.BUTTON_CONFIG["device_id"]],
-                                      daemon=True)
-    polling_thread.start()
+    # one consumer for the life of the process, started the first time through
+    consumer = aws.get_notification_consumer()
 
     # this helps determine whether we've received a reply later
     reply_received = False
 
+    # set once we've gone back to the main screen, stops the loops below
+    finished = False
+
+    # checked far more often than the countdown ticks, so pushed replies show
+    # up right away. it's only a local queue, so this costs no requests
+    def check_messages():
+        nonlocal timeout, reply_received, finished
+        nonlocal root, frame, style, do_post
+
+        # handle every notification since the last check, making sure each is ours
+        while (latest_message := consumer.get_message()) is not None:
+            ts = latest_message["ts"]
+
+            if latest_message.get("status") == "timed_out":
+                # the server's expiry sweep timed our message out, the
+                # countdown's normal timeout path handles the rest next tick
+                with pending_message_ids_lock:
+                    if ts in pending_message_ids and not reply_received:
+                        timeout = 0
+                continue
+
+            reply_author = latest_message["reply_author"]
+            reply_text = latest_message["reply_text"]
+
+            with pending_message_ids_lock:
+                if ts not in pending_message_ids:
+                    continue
+
+            # if no resolving reaction/emoji, display message
+            if not "white_check_mark" in reply_text and not "+1" in reply_text:
+                received_label.configure(text="")
+                waiting_label.configure(text=f"From {reply_author}\n" + reply_text)
+                waiting_label.place_configure(rely=0.5)
+
+                # bump the timer up if necessary
+                if timeout <= base_timeout // 3 + 1:
+                    timeout = base_timeout // 3 + 1
+
+                # make sure the system knows we replied but
+                # still allow for multi-replies
+                reply_received = True
+
+                # if we've received a reply mark it replied
+                with pending_message_ids_lock:
+                    message_id = pending_message_ids[0]
+                channel_id = message_to_channel[message_id]
+
+                # sent in the background, the countdown keeps ticking
+                slack.queue_status_update(message_id, channel_id, "replied",
+                                          lambda _, error: TK_CALLBACKS.put(report_status_update, error))
+
+                if is_simpleaudio_installed:
+                    RECEIVE_SOUND.play()
+            # else revert to main and cancel this countdown
+            else:
+                device = slack.get_config(slack.BUTTON_CONFIG["device_id"])
+
+                slack.queue_log_row([
+                    slack.get_datetime(),
+                    device.location,
+                    "Resolved"
+                ])
+
+                forget_pending_messages()
+                revert_to_main(root, frame, style, do_post)
+
+                if is_simpleaudio_installed:
+                    RESOLVED_SOUND.play()
+
+                finished = True
+                break # the screen is gone, anything else can wait for the next request
+
+        if not finished:
+            root.after(MESSAGE_CHECK_MS, check_messages)
+
     # do a timeout countdown
     def countdown():
-        nonlocal timeout, reply_received
+        nonlocal timeout, reply_received, finished
         nonlocal root, frame, style, do_post
 
+        if finished: # resolved while we were waiting
+            return
+
         # decrement seconds left and set the label's text
         timeout -= 1
         update_text_widget()
 
-        # if we have a message from SQS, make sure it's ours and then use it
-        if aws.LATEST_MESSAGE:
-            ts = aws.LATEST_MESSAGE["ts"]
-            reply_author = aws.LATEST_MESSAGE["reply_author"]
-            reply_text = aws.LATEST_MESSAGE["reply_text"]
-
-            with pending_message_ids_lock:
-                if ts in pending_message_ids:
-                    # if no resolving reaction/emoji, display message
-                    if not "white_check_mark" in reply_text and not "+1" in reply_text:
-                        received_label.configure(text="")
-                        waiting_label.configure(text=f"From {reply_author}\n" + reply_text)
-                        waiting_label.place_configure(rely=0.5)
-
-                        aws.LATEST_MESSAGE = None
-
-                        # bump the timer up if necessary
-                        if timeout <= base_timeout // 3 + 1:
-                            timeout = base_timeout // 3 + 1
-
-                        # make sure the system knows we replied but
-                        # still allow for multi-replies
-                        reply_received = True
-
-                        # if we've received a reply mark it replied
-                        message_id = pending_message_ids[0]
-                        channel_id = message_to_channel[message_id]
-                        aws.mark_message_replied(slack.lambda_client, message_id, channel_id, True)
-
-                        if is_simpleaudio_installed:
-                            RECEIVE_SOUND.play()
-                    # else revert to main and cancel this countdown
-                    else:
-                        sheets_button_config = slack.get_config(CONFIG_SHEETS_SERVICE,
-                                                                CONFIG_SPREADSHEET_ID,
-                                                                slack.BUTTON_CONFIG["device_id"])
-                        
-                        threading.Thread(target=sheets.add_row, args=(LOGGING_SHEETS_SERVICE, LOGGING_SPREADSHEET_ID,
-                                                                        [
-                                                                        slack.get_datetime(),
-                                                                        sheets_button_config[3], # gets location
-                                                                        "Resolved"
-                                                                        ]
-                                                                    ),
-                                                                daemon=True
-                                        ).start()
-
-                        revert_to_main(root, frame, style, do_post)
-                        
-                        if is_simpleaudio_installed:
-                            RESOLVED_SOUND.play()
-
-                        aws.LATEST_MESSAGE = None
-
         if timeout <= 0:
+            finished = True
+            forget_pending_messages()
             revert_to_main(root, frame, style, do_post)
 
-            sheets_button_config = slack.get_config(CONFIG_SHEETS_SERVICE,
-                                                    CONFIG_SPREADSHEET_ID,
-                                                    slack.BUTTON_CONFIG["device_id"])
-            threading.Thread(target=sheets.add_row, args=(LOGGING_SHEETS_SERVICE, LOGGING_SPREADSHEET_ID,
-                                                            [
-                                                            slack.get_datetime(),
-                                                            sheets_button_config[3], # gets location
-                                                            "Replied" if reply_received else "Timed Out"
-                                                            ]
-                                                         ),
-                                                         daemon=True
-                            ).start()
-
-            # if we have a pending message or haven't received a reply,
-            # we need to time out
-            with pending_message_ids_lock:
-                if len(pending_message_ids) > 0 and not reply_received:
-                    message_id = pending_message_ids[0]
-                    channel_id = message_to_channel[message_id]
+            device = slack.get_config(slack.BUTTON_CONFIG["device_id"])
+            slack.queue_log_row([
+                slack.get_datetime(),
+                device.location,
+                "Replied" if reply_received else "Timed Out"
+            ])
 
-                    aws.mark_message_timed_out(slack.lambda_client, message_id, channel_id, True)
+            # no need to tell the server we timed out, its expiry sweep
+            # marks the message on Slack even if we never get this far
 
         # schedule countdown until seconds_left is 1
         if timeout > 0:
             root.after(1000, countdown)
-        else:
-            aws.STOP_THREAD = True
+
+    # the post was dropped, so nobody will ever reply: back to main with a notice
+    def cancel(notice: str):
+        nonlocal finished
+
+        if finished:
             return
 
+        finished = True
+        forget_pending_messages()
+        revert_to_main(root, frame, style, do_post)
+        show_notice(root, frame, notice)
+
+    if request is not None:
+        request["cancel"] = cancel
+        if request.get("notice") is not None: # dropped before we got here
+            root.after(0, cancel, request["notice"])
+
+    root.after(MESSAGE_CHECK_MS, check_messages)
+
     root.after(1000, countdown)
 
     received_label = tk.Label(frame,
@@ -433,6 +480,49 @@ def display_post_interaction(root: tk.Tk, frame: tk.Frame, style: ttk.Style, do_
 
     root.update_idletasks() # gets stuff to load all at once
 
+def record_posted_message(posted: tuple | None, error: str | None, request: dict = None) -> None:
+    """
+    Adds a message to our pending messages once the outbox has posted it,
+    or ends its countdown if it never will be. Runs on the Tk thread
+
+    Args:
+        posted (tuple | None): the message ID and channel ID
+        error (str | None): why it was never posted, if it wasn't, e.g.
+            "rate_limited", "unknown" or "expired"
+        request (dict): the press's request, see display_post_interaction
+    """
+    if error is not None:
+        print(f"Message was never posted: {error}")
+        if request is not None:
+            request["notice"] = RATE_LIMIT_NOTICE if error == "rate_limited" else POST_FAILED_NOTICE
+            if request["cancel"] is not None:
+                request["cancel"](request["notice"])
+        return
+
+    message_id, channel_id = posted
+    with pending_message_ids_lock:
+        pending_message_ids.append(message_id)
+    message_to_channel[message_id] = channel_id
+
+def forget_pending_messages() -> None:
+    """
+    Forgets every pending message once its countdown is over, so late or
+    redelivered notifications for it can't show up on the next request
+    """
+    with pending_message_ids_lock:
+        pending_message_ids.clear()
+    message_to_channel.clear()
+
+def report_status_update(error: str | None) -> None:
+    """
+    Reports a dropped background status update, runs on the Tk thread
+
+    Args:
+        error (str | None): why it was dropped, if it was
+    """
+    if error is not None:
+        print(f"Unable to update message status: {error}")
+
 def revert_to_main(root: tk.Tk, frame: tk.Frame, style: ttk.Style, do_post: bool) -> None:
     """
     Reverts from another frame to the main display
@@ -512,24 +602,29 @@ def fade_label(frame: tk.Tk, label: ttk.Label, start_color: tuple, end_color: tu
 
 def setup_logging():
     """
-    Runs the sheets function to set up logging,
+    Gets the shared Sheets service for logging from the sheets registry,
     then sets the globals LOGGING_SHEETS_SERVICE + SPREADSHEET_ID
     """
-    global LOGGING_SHEETS_SERVICE, LOGGING_SPREADSHEET_ID, CONFIG_SHEETS_SERVICE
-    global CONFIG_SPREADSHEET_ID
+    global LOGGING_SHEETS_SERVICE, LOGGING_SPREADSHEET_ID
+
+    LOGGING_SHEETS_SERVICE, LOGGING_SPREADSHEET_ID = sheets.get_sheets("google_logging")
 
-    _, sheets_service, _, _, spreadsheet_id = sheets.setup_sheets("google_logging")
-    LOGGING_SHEETS_SERVICE = sheets_service
-    LOGGING_SPREADSHEET_ID = spreadsheet_id
+    # queued log rows go out together in one append
+    slack.get_outbox().register(
+        "log",
+        lambda rows: sheets.add_rows(LOGGING_SHEETS_SERVICE, LOGGING_SPREADSHEET_ID,
+                                     [row["cells"] for row in rows]),
+        batch=True, max_age=slack.LOG_MAX_AGE
+    )
 
-    _, sheets_service, _, _, spreadsheet_id = sheets.setup_sheets("google_config")
-    CONFIG_SHEETS_SERVICE = sheets_service
-    CONFIG_SPREADSHEET_ID = spreadsheet_id
+    # load the device config table now so the first press doesn't wait on it
+    slack.get_device_configs()
 
 def display_gui() -> None:
     """
     Displays the TKinter GUI. Essentially the main function
     """
+    global TK_CALLBACKS
 
     escape_display_period_ms = 5000
     do_post = True
@@ -542,6 +637,8 @@ def display_gui() -> None:
     root.configure(bg=BLUE)
     root.title("Slack Lambda Button")
 
+    TK_CALLBACKS = aws.TkCallbackQueue(root)
+
     display_frame = tk.Frame(root, bg=BLUE)
     display_frame.place(relx=0, rely=0, relwidth=1, relheight=1)
 
@@ -575,6 +672,15 @@ def display_gui() -> None:
     # run the auto updater
     interval_seconds = 15 * 60 # every 15 minutes
 
+    # build the AWS clients while the main screen is already up
+    aws.warm_up_clients()
+
+    # start syncing the clock so presses never wait on the time source
+    slack.get_clock()
+
+    # load the saved rate limits now, rather than on the first press
+    slack.get_press_limiter()
+
     thread = threading.Thread(target=auto_updater.do_auto_update, args=(interval_seconds,), daemon=True)
     thread.start()
 
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+"""
+Remembers which Slack events we've already handled so retried deliveries
+don't publish duplicate notifications or edit messages twice.
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import state_store
+
+INDEX_SIZE = 4096
+INDEX_TTL = 60 * 60 # in seconds, Slack gives up retrying well before this
+CLAIM_TTL = 60 # in seconds, how long a claim holds before a retry may take over
+
+def event_key(event_body: dict) -> str | None:
+    """
+    Works out the idempotency key for a request body. Events API callbacks
+    use Slack's event_id; anything without one gets a key from its contents.
+
+    Args:
+        event_body (dict): the decoded request body
+
+    Returns:
+        str | None: the key, or None if the request shouldn't be deduplicated
+    """
+    if event_body.get("event_id"):
+        return f"event:{event_body['event_id']}"
+
+    event = event_body.get("event", event_body)
+    event_type = event.get("type")
+
+    if event_type == "reaction_added":
+        item = event.get("item", {})
+        return f"event:reaction:{item.get('channel')}:{item.get('ts')}:{event.get('reaction')}:{event.get('user')}"
+    if event_type == "message" and event.get("ts"):
+        return f"event:message:{event.get('channel')}:{event.get('ts')}"
+
+    return None
+
+class IdempotencyIndex:
+    """
+    A bounded, TTL-based set of seen event keys. Checked in memory first and,
+    if a shared store is given, claimed there too so retries that land on
+    another container are caught as well.
+    """
+
+    def __init__(self, store: state_store.StateStore = None, max_size: int = INDEX_SIZE,
+                 ttl: float = INDEX_TTL, claim_ttl: float = CLAIM_TTL):
+        """
+        Args:
+            store (state_store.StateStore): an optional store shared between containers
+            max_size (int): the most keys to hold in memory
+            ttl (float): how long to remember a finished key, in seconds
+            claim_ttl (float): how long an unfinished claim holds, in seconds, in
+                case whoever claimed it dies before finishing or releasing it
+        """
+        self.store = store
+        self.max_size = max_size
+        self.ttl = ttl
+        self.claim_ttl = claim_ttl
+        self.deduplicated = 0 # how many duplicates we've turned away
+
+        self._seen = OrderedDict() # key -> expiry, oldest first
+        self._lock = threading.Lock()
+
+    def claim(self, key: str) -> bool:
+        """
+        Claims a key for processing. The claim is "in progress" until
+        complete() or release() is called, and lapses after claim_ttl
+
+        Args:
+            key (str): the event's idempotency key
+
+        Returns:
+            bool: True if we get to process the event, False for duplicates
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            # drop expired keys from the old end
+            while self._seen and next(iter(self._seen.values())) <= now:
+                self._seen.popitem(last=False)
+
+            if key in self._seen and self._seen[key] > now:
+                self.deduplicated += 1
+                return False
+
+            self._seen[key] = now + self.claim_ttl
+            self._seen.move_to_end(key)
+            while len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+
+        if self.store is not None and \
+                not self.store.add(key, {"state": "in_progress", "seen_at": time.time()}, ttl=self.claim_ttl):
+            with self._lock:
+                self._seen.pop(key, None) # someone else has it, they'll finish or release it
+                self.deduplicated += 1
+            return False
+
+        return True
+
+    def complete(self, key: str) -> None:
+        """
+        Marks a claimed key as done, so retries are turned away for the full ttl
+
+        Args:
+            key (str): the event's idempotency key
+        """
+        with self._lock:
+            self._seen[key] = time.monotonic() + self.ttl
+            self._seen.move_to_end(key)
+
+        if self.store is not None:
+            self.store.put(key, {"state": "done", "seen_at": time.time()}, ttl=self.ttl)
+
+    def release(self, key: str) -> None:
+        """
+        Gives up a claim after processing failed, so a retry can take over
+
+        Args:
+            key (str): the event's idempotency key
+        """
+        with self._lock:
+            self._seen.pop(key, None)
+
+        if self.store is not None:
+            self.store.delete(key)
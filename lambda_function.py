@@ -8,64 +8,386 @@ Nikki Hess (nkhess@umich.edu)
 """
 
 import json
-import requests
-from threading import Timer
-import boto3
+import sys
 import time
-import re
-
-# Read the configuration files
-try:
-    with open("config/slack.json", "r", encoding="utf8") as file:
-        CONFIG = json.load(file)
-except json.JSONDecodeError as e:
-    print(e)
-except FileNotFoundError as e:
-    with open("config/slack.json", "x", encoding="utf8") as file:
-        print("config/slack.json not found, creating it for you...")
-
-        defaults = {"bot_oauth_token": "", "button_config": {"device_id": ""}}
-        json.dump(defaults, file)
-
-
-CONFIG_DEFAULTS = {"aws_access_key": "", "aws_secret": "", "region": "us-east-2"}
-try:
-    with open("config/aws.json", "r", encoding="utf8") as file:
-        AWS_CONFIG = json.load(file)
-
-        # if we don't have all required keys, populate the defaults
-        if not all(AWS_CONFIG.get(key) for key in list(CONFIG_DEFAULTS.keys())):
-            with open("config/aws.json", "w", encoding="utf8") as write_file:
-                json.dump(CONFIG_DEFAULTS, write_file)
-except (FileNotFoundError, json.JSONDecodeError):
-    with open("config/aws.json", "w+", encoding="utf8") as file:
-        print("config/aws.json not found or wrong, creating + populating defaults...")
-
-        json.dump(CONFIG_DEFAULTS, file)
-        print("Please fill out config/aws.json before running again.")
-    exit()
-
-ACCESS_KEY = AWS_CONFIG["aws_access_key"]
-SECRET = AWS_CONFIG["aws_secret"]
+import threading
+import uuid
+from enum import Enum
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# only light modules here: boto3 and requests (via slack_client) are imported
+# the first time something needs them, so a cold start that only answers a
+# url_verification or a 404 never pays for them
+import state_store
+import rate_limiter
+import deferred
+import idempotency
+import structured_log
+import expiry
+import metrics
+
+SLACK_CONFIG_DEFAULTS = {"bot_oauth_token": "", "button_config": {"device_id": ""}}
+AWS_CONFIG_DEFAULTS = {"aws_access_key": "", "aws_secret": "", "region": "us-east-2", "sns_arn": ""}
+
+def load_config(path: str, defaults: dict, required: list) -> dict:
+    """
+    Reads and validates a config file, creating it from defaults if missing
+
+    Args:
+        path (str): the config file to read
+        defaults (dict): what to write if the file doesn't exist
+        required (list): keys that must be present and non-empty
+
+    Returns:
+        dict: the parsed config
+    """
+    try:
+        with open(path, "r", encoding="utf8") as file:
+            config = json.load(file)
+    except FileNotFoundError as e:
+        try:
+            with open(path, "x", encoding="utf8") as file:
+                json.dump(defaults, file)
+            print(f"{path} not found, one has been created for you.")
+        except OSError:
+            pass # read-only filesystem, e.g. in Lambda
+
+        raise RuntimeError(f"Please fill out {path} before running again.") from e
+    except json.JSONDecodeError as e:
+        raise RuntimeError(f"{path} is not valid JSON: {e}") from e
+
+    missing = [key for key in required if not config.get(key)]
+    if missing:
+        raise RuntimeError(f"{path} is missing required settings: {missing}")
+
+    return config
+
+# Read the configuration files, once per container
+CONFIG = load_config("config/slack.json", SLACK_CONFIG_DEFAULTS, ["bot_oauth_token"])
+AWS_CONFIG = load_config("config/aws.json", AWS_CONFIG_DEFAULTS, ["region", "sns_arn"])
+
+ACCESS_KEY = AWS_CONFIG.get("aws_access_key")
+SECRET = AWS_CONFIG.get("aws_secret")
 REGION = AWS_CONFIG["region"]
 SNS_ARN = AWS_CONFIG["sns_arn"]
 
-# set up sns client
-SNS_CLIENT = boto3.client(
-    "sns",
-    aws_access_key_id=ACCESS_KEY,
-    aws_secret_access_key=SECRET,
-    region_name=REGION
-)
-
-BUTTON_CONFIG = CONFIG["button_config"]
+BUTTON_CONFIG = CONFIG.get("button_config", {})
 BOT_OAUTH_TOKEN = CONFIG["bot_oauth_token"]
+SIGNING_SECRET = CONFIG.get("signing_secret", "") # verifies Events API requests if set
+
+# when enabled, notifications are also pushed to each kiosk's MQTT topic
+PUSH_CONFIG = AWS_CONFIG.get("push", {})
+
+# when enabled, event_callback requests are acked right away and processed later
+FAST_ACK_CONFIG = AWS_CONFIG.get("fast_ack", {})
+
+LOG = structured_log.StructuredLogger.from_config(AWS_CONFIG.get("logging", {}))
+
+# per-invocation timings of every Slack/SNS/state store call, flushed as one
+# Embedded Metric Format line at the end of each invocation
+METRICS = metrics.InvocationMetrics.from_config(AWS_CONFIG.get("metrics", {}))
+
+# the state store methods that are timed
+STORE_OPERATIONS = ("get", "put", "add", "pop", "delete", "scan", "update")
+
+MESSAGE_TTL = AWS_CONFIG.get("state_store", {}).get("message_ttl", 60 * 60) # in seconds
+
+# how long a message stays pending before the expiry sweep times it out
+MESSAGE_TIMEOUT = AWS_CONFIG.get("message_timeout", 180) # in seconds
+# a reply gives staff at least this long to resolve before it times out, like the kiosk's countdown
+REPLY_TIMEOUT = MESSAGE_TIMEOUT // 3 + 1
+# how long a reply may wait on users.info for an author that isn't cached, in seconds
+USER_LOOKUP_TIMEOUT = CONFIG.get("user_lookup_timeout", 1)
+
+# runs independent Slack/SNS calls side by side within an invocation
+EXECUTOR = ThreadPoolExecutor(max_workers=4)
+
+# everything below is built on first use by its get_ function, then kept for
+# the life of the container. the lock stops concurrent tasks building twice
+SNS_CLIENT = None
+IOT_CLIENT = None
+SLACK_CLIENT = None
+USER_DIRECTORY = None
+STATE_STORE = None
+IDEMPOTENCY_INDEX = None
+RATE_LIMITER = None
+EXPIRY_INDEX = None
+INIT_LOCK = threading.RLock()
+
+def create_aws_client(service: str, endpoint_url: str = None):
+    """
+    Creates a boto3 client using config/aws.json. Blank keys fall back on
+    the execution role's credentials
+
+    Args:
+        service (str): the AWS service, e.g. "sns"
+        endpoint_url (str): overrides "endpoint_url" from config/aws.json
+
+    Returns:
+        boto3.client: the client
+    """
+    import boto3 # deferred, importing boto3 is most of a cold start
+
+    return boto3.client(
+        service,
+        aws_access_key_id=ACCESS_KEY or None,
+        aws_secret_access_key=SECRET or None,
+        region_name=REGION,
+        endpoint_url=endpoint_url or AWS_CONFIG.get("endpoint_url") or None # e.g. a local SNS/SQS stand-in
+    )
+
+def get_sns_client():
+    """
+    Gets the SNS client, creating it on first use
+
+    Returns:
+        boto3.client: the SNS client
+    """
+    global SNS_CLIENT
+
+    with INIT_LOCK:
+        if SNS_CLIENT is None:
+            SNS_CLIENT = metrics.Instrumented(create_aws_client("sns"), METRICS, "sns", ("publish",))
+
+    return SNS_CLIENT
+
+def get_iot_client():
+    """
+    Gets the IoT data plane client used to push notifications, creating it on first use
+
+    Returns:
+        boto3.client: the iot-data client
+    """
+    global IOT_CLIENT
+
+    with INIT_LOCK:
+        if IOT_CLIENT is None:
+            IOT_CLIENT = metrics.Instrumented(create_aws_client("iot-data", PUSH_CONFIG.get("iot_endpoint")),
+                                              METRICS, "iot", ("publish",))
+
+    return IOT_CLIENT
+
+def get_slack_client():
+    """
+    Gets the Slack client, creating it on first use. One client per
+    container so warm invocations reuse open connections
+
+    Returns:
+        slack_client.SlackClient: the Slack client
+    """
+    global SLACK_CLIENT
+
+    with INIT_LOCK:
+        if SLACK_CLIENT is None:
+            import slack_client # deferred, pulls in requests
+
+            SLACK_CLIENT = slack_client.SlackClient(
+                BOT_OAUTH_TOKEN,
+                base_url=CONFIG.get("slack_api_url") or slack_client.SLACK_API_URL,
+                log=LOG
+            )
+            SLACK_CLIENT.observer = record_slack_call
+
+    return SLACK_CLIENT
+
+def record_slack_call(method: str, elapsed_ms: float, error: bool,
+                      retried: bool, rate_limited: bool) -> None:
+    """
+    Feeds one Slack round trip into the invocation's metrics, see SlackClient.observer
+    """
+    METRICS.record(f"slack.{method}", elapsed_ms, error, retried, rate_limited)
+
+def get_user_directory():
+    """
+    Gets the user name cache, creating it on first use. Reply authors are
+    the same few staff members over and over. With warm_user_cache it's
+    created and warmed (in the background) while the container initializes
+
+    Returns:
+        slack_client.UserDirectory: the user directory
+    """
+    global USER_DIRECTORY
+
+    with INIT_LOCK:
+        if USER_DIRECTORY is None:
+            import slack_client
 
-POST_COOLDOWN = 15 # in seconds
+            USER_DIRECTORY = slack_client.UserDirectory(get_slack_client(), log=LOG)
 
-pending_messages = []
-message_to_channel = {} # pairs message ids with channel ids
-message_to_device_id = {} # pairs message ids with device ids
+    return USER_DIRECTORY
+
+def get_state_store() -> state_store.StateStore:
+    """
+    Gets the state store, creating it on first use. Pending messages live
+    there so that any container can resolve them
+
+    Returns:
+        state_store.StateStore: the configured store
+    """
+    global STATE_STORE
+
+    with INIT_LOCK:
+        if STATE_STORE is None:
+            STATE_STORE = metrics.Instrumented(
+                state_store.create_state_store(AWS_CONFIG.get("state_store", {}), AWS_CONFIG),
+                METRICS, "store", STORE_OPERATIONS
+            )
+
+    return STATE_STORE
+
+def get_idempotency_index() -> idempotency.IdempotencyIndex:
+    """
+    Gets the index of handled events, creating it on first use. Optionally
+    checked against the state store so retries landing on other containers count too
+
+    Returns:
+        idempotency.IdempotencyIndex: the index
+    """
+    global IDEMPOTENCY_INDEX
+
+    with INIT_LOCK:
+        if IDEMPOTENCY_INDEX is None:
+            shared = AWS_CONFIG.get("idempotency", {}).get("shared", False)
+            IDEMPOTENCY_INDEX = idempotency.IdempotencyIndex(get_state_store() if shared else None)
+
+    return IDEMPOTENCY_INDEX
+
+def get_rate_limiter() -> rate_limiter.SlidingWindowRateLimiter:
+    """
+    Gets the press rate limiter, creating it on first use.
+    See "rate_limits" in config/slack.json
+
+    Returns:
+        rate_limiter.SlidingWindowRateLimiter: the limiter
+    """
+    global RATE_LIMITER
+
+    with INIT_LOCK:
+        if RATE_LIMITER is None:
+            RATE_LIMITER = rate_limiter.SlidingWindowRateLimiter.from_config(
+                get_state_store(), CONFIG.get("rate_limits", {})
+            )
+
+    return RATE_LIMITER
+
+def get_expiry_index() -> expiry.ExpiryIndex:
+    """
+    Gets the index of message deadlines, creating it on first use. It lives
+    in the state store, so every container adds to the same one
+
+    Returns:
+        expiry.ExpiryIndex: the index
+    """
+    global EXPIRY_INDEX
+
+    with INIT_LOCK:
+        if EXPIRY_INDEX is None:
+            EXPIRY_INDEX = expiry.ExpiryIndex(get_state_store(), MESSAGE_TTL)
+
+    return EXPIRY_INDEX
+
+def message_key(message_id: str) -> str:
+    """
+    Gets the state store key for a pending message
+
+    Args:
+        message_id (str): the message ID/timestamp
+
+    Returns:
+        str: the key the message is stored under
+    """
+    return f"message:{message_id}"
+
+class MessageStatus(Enum):
+    """
+    Where a posted message is in its lifecycle. The value doubles as the
+    marker appended to the message text on Slack.
+    """
+    PENDING = "pending"
+    REPLIED = "replied"
+    RESOLVED = "resolved"
+    TIMED_OUT = "timed out"
+
+# which statuses each status may move to, anything else is a double-mark
+STATUS_TRANSITIONS = {
+    MessageStatus.PENDING: (MessageStatus.REPLIED, MessageStatus.RESOLVED, MessageStatus.TIMED_OUT),
+    MessageStatus.REPLIED: (MessageStatus.RESOLVED, MessageStatus.TIMED_OUT),
+    MessageStatus.RESOLVED: (),
+    MessageStatus.TIMED_OUT: ()
+}
+
+def is_pending(message: dict | None) -> bool:
+    """
+    Checks whether a stored message is still waiting on staff
+
+    Args:
+        message (dict | None): the message record from the state store
+
+    Returns:
+        bool: whether the message can still be replied to or resolved
+    """
+    return message is not None and bool(STATUS_TRANSITIONS[MessageStatus(message["status"])])
+
+def render_message_text(message: dict) -> str:
+    """
+    Builds the Slack text for a message from its original text and status.
+    A replied message that later times out keeps its replied marker, so
+    staff can tell it was answered
+
+    Args:
+        message (dict): the message record from the state store
+
+    Returns:
+        str: the text the message should show on Slack
+    """
+    status = MessageStatus(message["status"])
+    if status == MessageStatus.PENDING:
+        return message["text"]
+    if status == MessageStatus.TIMED_OUT and message.get("replied"):
+        return f"{message['text']} *({MessageStatus.REPLIED.value}, {status.value})*"
+
+    return f"{message['text']} *({status.value})*"
+
+# event type -> function(event) -> response, filled in by @route below
+EVENT_ROUTES = {}
+
+def route(event_type: str):
+    """
+    Registers a function as the handler for an event type
+
+    Args:
+        event_type (str): the "type" of the (unwrapped) event
+
+    Returns:
+        the decorator
+    """
+    def register(func):
+        EVENT_ROUTES[event_type] = func
+        return func
+
+    return register
+
+def ok_response(body: str, posted_message_id: str = None, posted_message_channel: str = None) -> dict:
+    """
+    Builds a 200 response in the shape the kiosk expects
+
+    Args:
+        body (str): the response text
+        posted_message_id (str): the ID of a message we posted, if any
+        posted_message_channel (str): the channel of a message we posted, if any
+
+    Returns:
+        dict: a response object for the HTTP request
+    """
+    return {
+        "statusCode": 200,
+        "headers": {
+            "Content-Type": "text/plain"
+        },
+        "body": body,
+        "posted_message_id": posted_message_id or None,
+        "posted_message_channel": posted_message_channel or None
+    }
 
 def lambda_handler(event: dict, context: object):
     """
@@ -78,19 +400,40 @@ def lambda_handler(event: dict, context: object):
     Returns:
         dict: a response object for the HTTP request
     """
-    print("full payload:", event)
+    METRICS.start()
+    try:
+        return handle_event(event, context)
+    finally:
+        METRICS.flush()
 
-    event_body = event.get("body", "{}")
-    if isinstance(event_body, str):
-        event_body.replace("“", "\"").replace("”", "\"").replace("‘", "\"").replace("’", "\"").replace(",", "\"")
-    print(event_body)
+def handle_event(event: dict, context: object) -> dict:
+    """
+    Acknowledges, verifies and deduplicates a request, then processes it
+    now or hands it to the deferred stage
 
-    # slack sends body as a json-string, but our local test code doesn't
-    # so let's handle both here
-    if isinstance(event_body, str):
-        event_body = json.loads(event_body)
+    Args:
+        event (dict): the event data from Slack
+        context (object): the runtime information
 
+    Returns:
+        dict: a response object for the HTTP request
+    """
+    LOG.payload("Received payload", event)
+
+    # events we deferred to ourselves were verified and acked by the invocation that deferred them
+    if event.get("deferred"):
+        return process_deferred_event(event["body"])
+
+    # the EventBridge schedule that drives the expiry sweep
+    if event.get("source") == "aws.events":
+        return process_event({"type": "expiry_sweep"})
+
+    # slack sends body as a json-string, but our local test code doesn't
+    # so let's handle both here, decoding once
+    raw_body = event.get("body", "{}")
+    event_body = json.loads(raw_body) if isinstance(raw_body, str) else raw_body
     event_type = event_body.get("type")
+    METRICS.set_event_type(event_type)
 
     # slack url verification
     # respond with the challenge to verify the url
@@ -99,136 +442,327 @@ def lambda_handler(event: dict, context: object):
             "statusCode": 200,
             "body": event_body.get("challenge", "")
         }
+
+    if event_type == "event_callback":
+        # only requests from API Gateway arrive as a raw string we can check
+        if SIGNING_SECRET and isinstance(raw_body, str) and \
+                not deferred.verify_slack_signature(SIGNING_SECRET, event.get("headers"), raw_body):
+            LOG.warning("Slack signature verification failed")
+            return {
+                "statusCode": 401
+            }
+
+    # a retried delivery of an event we've already seen gets a 200 and nothing else
+    key = idempotency.event_key(event_body)
+    if key is not None and not get_idempotency_index().claim(key):
+        headers = {name.lower(): value for name, value in (event.get("headers") or {}).items()}
+        LOG.info("Duplicate event ignored", key=key, retry=headers.get("x-slack-retry-num"),
+                 deduplicated=get_idempotency_index().deduplicated)
+        return {
+            "statusCode": 200
+        }
+
+    # ack now so Slack doesn't retry, the work (and settling the claim) happens in the deferred stage
+    if FAST_ACK_CONFIG.get("enabled") and event_type == "event_callback" and \
+            isinstance(event_body.get("event"), dict):
+        try:
+            get_deferred_stage().submit(event_body, context)
+        except Exception:
+            if key is not None:
+                get_idempotency_index().release(key)
+            raise
+
+        return {
+            "statusCode": 200
+        }
+
+    return process_claimed_event(event_body, key)
+
+def process_deferred_event(event_body: dict) -> dict:
+    """
+    Processes an event in the deferred stage. Async invokes can be delivered
+    (and are retried) more than once, so the event is claimed again for this
+    stage, and the claim taken when it was acked is settled here once the
+    work is done
+
+    Args:
+        event_body (dict): the decoded request body
+
+    Returns:
+        dict: a response object
+    """
+    key = idempotency.event_key(event_body)
+    deferred_key = f"deferred:{key}" if key is not None else None
+
+    if deferred_key is not None and not get_idempotency_index().claim(deferred_key):
+        LOG.info("Duplicate deferred event ignored", key=key)
+        return {
+            "statusCode": 200
+        }
+
+    return process_claimed_event(event_body, deferred_key, key)
+
+def process_claimed_event(event_body: dict, *keys) -> dict:
+    """
+    Processes a request whose idempotency claims we hold, completing them if
+    it worked. A failed attempt gives them up so a retry can take over
+
+    Args:
+        event_body (dict): the decoded request body
+        *keys: the claimed idempotency keys, None for none
+
+    Returns:
+        dict: a response object for the HTTP request
+    """
+    keys = [key for key in keys if key is not None]
+    index = get_idempotency_index()
+
+    try:
+        response = process_event(event_body)
+    except Exception:
+        for key in keys:
+            index.release(key)
+        raise
+
+    for key in keys:
+        if response.get("statusCode", 200) >= 500:
+            index.release(key)
+        else:
+            index.complete(key)
+
+    return response
+
+def process_event(event_body: dict) -> dict:
+    """
+    Does the actual work for a request by routing it to its handler:
+    Slack events, posts and status updates
+
+    Args:
+        event_body (dict): the decoded request body
+
+    Returns:
+        dict: a response object for the HTTP request
+    """
     # if we're not doing URL verification, we need to go one level deeper
-    elif event_type == "event_callback":
-        event_body = event_body.get("event", "{}")
-        event_type = event_body.get("type")
+    if event_body.get("type") == "event_callback":
+        event_body = event_body.get("event", {})
 
-    print("type:", event_type)
-    posted_message_id = None
-    posted_message_channel = None
+    event_type = event_body.get("type")
+    handler = EVENT_ROUTES.get(event_type)
+    METRICS.set_event_type(event_type)
 
+    LOG.info("Routing event", type=event_type, handled=handler is not None)
+
+    if handler is None:
+        return {
+            "statusCode": 404
+        }
+
+    return handler(event_body)
+
+@route("message")
+def route_message(event: dict) -> dict:
+    """
+    Handles Slack messages, of which we only care about thread replies
+    """
     # according to THIS page: https://api.slack.com/events/message/message_replied
     # there is a bug where subtype is currently missing when the event is
     # dispatched via the events API. until fixed, we need to verify that it has a thread_ts,
     # which is unique to message replies
-    if event_type == "message" and event_body.get("thread_ts") is not None:
-        message = event_body.get("text")
-        handle_message_replied(event_body, message)
-    elif event_type == "reaction_added":
-        message = event_body.get("reaction", "")
-        handle_reaction_added(event_body)
-    elif event_type == "post":
-        channel_id = event_body.get("channel_id", "")
-        message = event_body.get("message", "")
-        device_id = event_body.get("device_id", "")
-        location = event_body.get("location", "")
-        posted_message_id, posted_message_channel = post_to_slack(channel_id, message, device_id, location)
-    elif event_type == "message_timeout":
-        channel_id = event_body.get("channel_id", "")
-        message_id = event_body.get("message_id", "")
-        message = "message_timeout"
-        mark_message_timedout(channel_id, message_id)
-    elif event_type == "message_replied":
-        channel_id = event_body.get("channel_id", "")
-        message_id = event_body.get("message_id", "")
-        message = "message_replied"
-        mark_message_replied(channel_id, message_id)
-    else:
+    if event.get("thread_ts") is None:
         return {
             "statusCode": 404
         }
 
-    response = {
-        "statusCode": 200,
-        "headers": {
-            "Content-Type": "text/plain"
-        },
-        "body": message,
-        "posted_message_id": posted_message_id or None,
-        "posted_message_channel": posted_message_channel or None
-    }
+    message = event.get("text")
+    handle_message_replied(event, message)
 
-    return response
+    return ok_response(message)
 
-def get_user_first_name(user_id: str):
+@route("reaction_added")
+def route_reaction_added(event: dict) -> dict:
+    """
+    Handles reactions added to Slack messages
     """
-    Gets a user's name from Slack via their ID, falls back on real name
+    handle_reaction_added(event)
+
+    return ok_response(event.get("reaction", ""))
+
+@route("post")
+def route_post(event: dict) -> dict:
+    """
+    Handles a kiosk asking us to post its message
+    """
+    message = event.get("message", "")
+    try:
+        posted_message_id, posted_message_channel = post_to_slack(
+            event.get("channel_id", ""),
+            message,
+            event.get("device_id", ""),
+            event.get("location", ""),
+            event.get("post_id")
+        )
+    except PostOutcomeUnknown as e:
+        LOG.warning("Post outcome unknown", post_id=event.get("post_id"), error=str(e))
+        return {
+            "statusCode": 502,
+            "body": "post outcome unknown",
+            "post_status": "unknown"
+        }
+
+    return ok_response(message, posted_message_id, posted_message_channel)
+
+@route("message_timeout")
+def route_message_timeout(event: dict) -> dict:
+    """
+    Handles a kiosk reporting that its message timed out
+    """
+    mark_message_timedout(event.get("channel_id", ""), event.get("message_id", ""))
+
+    return ok_response("message_timeout")
+
+@route("message_replied")
+def route_message_replied(event: dict) -> dict:
+    """
+    Handles a kiosk reporting that its message was replied to
+    """
+    mark_message_replied(event.get("channel_id", ""), event.get("message_id", ""))
+
+    return ok_response("message_replied")
+
+@route("expiry_sweep")
+def route_expiry_sweep(event: dict) -> dict:
+    """
+    Handles the scheduled sweep that times out overdue messages
+    """
+    expired = sweep_expired_messages()
+
+    return ok_response(f"expired {len(expired)}")
+
+DEFERRED_STAGE = None
+
+def get_deferred_stage():
+    """
+    Gets the stage that fast-acked events are handed to, creating it on first use
+
+    Returns:
+        LambdaSelfInvokeStage | LocalQueueStage: the configured stage
+    """
+    global DEFERRED_STAGE
+
+    if DEFERRED_STAGE is None:
+        if FAST_ACK_CONFIG.get("stage", "lambda") == "local":
+            DEFERRED_STAGE = deferred.LocalQueueStage(process_deferred_event, log=LOG)
+        else:
+            DEFERRED_STAGE = deferred.LambdaSelfInvokeStage(create_aws_client("lambda"),
+                                                            FAST_ACK_CONFIG.get("function_name"))
+
+    return DEFERRED_STAGE
+
+def get_user_first_name(user_id: str, timeout: float = None):
+    """
+    Gets a user's name from Slack via their ID, falls back on real name.
+    Served from the user directory cache whenever possible
 
     Args:
         user_id (str): the user ID to gather info on
+        timeout (float): the longest to wait on Slack for a name that isn't
+            cached, see slack_client.UserDirectory.first_name
 
     Returns:
         str: the user's first name
     """
-    url = "https://slack.com/api/users.info"
-    headers = {
-        "Authorization": f"Bearer {BOT_OAUTH_TOKEN}",
-        "Content-Type": "application/json; charset=utf-8"
-    }
-    params = {
-        "user": user_id
-    }
+    return get_user_directory().first_name(user_id, timeout=timeout)
 
-    # 10 second timeout
-    response = requests.get(url, headers=headers, params=params, timeout=10)
-    user_info = response.json()
+def run_concurrently(*tasks) -> list:
+    """
+    Runs independent side effects at the same time and waits for all of them.
+    Each task is a no-argument callable; chain dependent calls inside one task.
 
-    if not user_info.get("ok"):
-        raise RuntimeError(f"Error retrieving message: {user_info['error']}")
+    Args:
+        *tasks: the callables to run
 
-    first_name = user_info["user"].get("real_name", "Unknown") # get real name
-    first_name = first_name.split()[0] # trim to first name only
+    Returns:
+        list: each task's return value, in order. The first exception raised
+            by any task is re-raised once all of them have finished
+    """
+    futures = [EXECUTOR.submit(task) for task in tasks]
+    wait(futures)
 
-    return first_name
+    return [future.result() for future in futures]
 
-def get_location_last_message(channel_id: str, user_id: str, location: str):
+def is_push_device(device_id: str) -> bool:
     """
-    Gets a user's last message from Slack via their ID
+    Checks whether a device gets its notifications over MQTT push. With
+    "devices" left out of the push config, every device does
 
     Args:
-        channel_id (str): the ID of the channel to look through
-        user_id (str): the user ID to gather info on
-        location (str): the location we're finding the last message from
+        device_id (str): the device's ID
 
     Returns:
-        dict: the data of the last message the user sent
+        bool: whether to push to it
     """
+    if not PUSH_CONFIG.get("enabled"):
+        return False
 
-    # no empty locations pls
-    if location == "":
-        return None
-
-    url = "https://slack.com/api/conversations.history"
-    headers = {
-        "Content-Type": "application/json; charset=utf-8",
-        "Authorization": f"Bearer {BOT_OAUTH_TOKEN}"
-    }
-    params = {
-        "channel": channel_id,
-        "oldest": str(time.time() - POST_COOLDOWN), # get messages within cooldown period
-        "inclusive": True
-    }
-
-    # 10 second timeout
-    ct_response = requests.get(url, headers=headers, params=params, timeout=10)
-    response_data = ct_response.json()
+    devices = PUSH_CONFIG.get("devices")
+    return devices is None or device_id in devices
 
-    if not response_data.get("ok"):
-        raise RuntimeError(f"Error retrieving message: {response_data['error']}")
+def publish_notification(device_id: str, sns_message: dict, subject: str) -> None:
+    """
+    Publishes a notification for a device straight to its MQTT topic if it
+    uses push, otherwise (or if the push fails) to SNS. Kiosks use
+    notification_id to drop a copy that arrives both ways
 
-    messages = response_data.get("messages")
+    Args:
+        device_id (str): the device that posted the original message
+        sns_message (dict): the notification contents
+        subject (str): the SNS subject, e.g. "Message Reply Notification"
+    """
+    sns_message = {**sns_message, "notification_id": uuid.uuid4().hex}
+
+    if is_push_device(device_id):
+        try:
+            get_iot_client().publish(
+                topic=f"{PUSH_CONFIG.get('topic_prefix', 'slackLambda/devices')}/{device_id}",
+                qos=1,
+                payload=json.dumps(sns_message)
+            )
+            # the kiosk's persistent session holds it if it's offline, so SNS isn't needed
+            return
+        except Exception as e: # SNS still gets it there, just slower
+            LOG.warning("Unable to push notification, falling back on SNS", device_id=device_id, error=str(e))
+
+    get_sns_client().publish(
+        TopicArn=SNS_ARN,
+        Message=json.dumps(sns_message),
+        MessageGroupId=device_id, # original device
+        Subject=subject,
+        # subscription filter policies use this to deliver only to the device's own queue
+        MessageAttributes={"device_id": {"DataType": "String", "StringValue": device_id}}
+    )
+
+def notify_author_reply(device_id: str, message_id: str, reply_text: str,
+                        author_id: str, subject: str) -> None:
+    """
+    Looks up a reply's author and then publishes the reply to SNS. The
+    lookup is cut off after USER_LOOKUP_TIMEOUT, so a slow users.info
+    can't hold the reply up; the author goes out as "Unknown" instead
 
-    # loop over recent messages
-    for message in messages:
-        user = message.get("user")
-        text = message.get("text")
-        print(text.split(" "))
-        # verify this is from the user specified and is in the location specified
-        if user == user_id and location.strip() in text:
-            return message
+    Args:
+        device_id (str): the device that posted the original message
+        message_id (str): the message ID/timestamp that was replied to
+        reply_text (str): the reply or reaction text
+        author_id (str): the Slack user ID of the author
+        subject (str): the SNS subject
+    """
+    sns_message = {
+        "ts": message_id,
+        "reply_text": reply_text,
+        "reply_author": get_user_first_name(author_id, timeout=USER_LOOKUP_TIMEOUT)
+    }
 
-    return None
+    publish_notification(device_id, sns_message, subject)
 
 def handle_message_replied(event: dict, reply_text: str) -> bool:
     """
@@ -241,50 +775,35 @@ def handle_message_replied(event: dict, reply_text: str) -> bool:
     Returns:
         resolved (bool): whether the message was marked as resolved, for GUI
     """
-    print("Handling message...")
-
-    channel_id = event.get("channel")
     thread_ts = event.get("thread_ts")
-
-    # gather information about the author
     author_id = event.get("user")
-    author_name = get_user_first_name(author_id)
 
-    # going to be used in the GUI to determine if we should display the message
-    resolved = False
+    pending_message = get_state_store().get(message_key(thread_ts))
+    if not is_pending(pending_message):
+        LOG.info("Timestamp was not in pending messages", ts=thread_ts)
+        return False
 
-    sns_message = {
-        "ts": thread_ts,
-        "reply_text": reply_text,
-        "reply_author": author_name
-    }
+    device_id = pending_message["device_id"]
 
-    if thread_ts in pending_messages:
-        if ":white_check_mark:" in reply_text or ":+1:" in reply_text:
-            print(f"Message thread {thread_ts} has received a resolving response. Marking as resolved.")
-            pending_messages.remove(thread_ts)
+    if ":white_check_mark:" in reply_text or ":+1:" in reply_text:
+        message = claim_message_status(thread_ts, MessageStatus.RESOLVED)
+        if message is None:
+            return False
 
-            message_append(channel_id, thread_ts, "*(resolved)*")
+        LOG.info("Resolving reply received", ts=thread_ts)
 
-            SNS_CLIENT.publish(
-                TopicArn=SNS_ARN,
-                Message=json.dumps(sns_message),
-                MessageGroupId=message_to_device_id[thread_ts], # original device
-                Subject="Message Resolved Notification"
-            )
+        # the edit doesn't depend on the author's name, so overlap it with lookup + publish
+        run_concurrently(
+            lambda: edit_message(thread_ts, message),
+            lambda: notify_author_reply(device_id, thread_ts, reply_text, author_id,
+                                        "Message Resolved Notification")
+        )
 
-            resolved = True
-        else:
-            SNS_CLIENT.publish(
-                TopicArn=SNS_ARN,
-                Message=json.dumps(sns_message),
-                MessageGroupId=message_to_device_id[thread_ts], # original device
-                Subject="Message Reply Notification"
-            )
-    else:
-        print("Timestamp was not in pending messages")
+        return True
 
-    return resolved
+    notify_author_reply(device_id, thread_ts, reply_text, author_id, "Message Reply Notification")
+
+    return False
 
 def handle_reaction_added(event: dict) -> bool:
     """
@@ -296,183 +815,212 @@ def handle_reaction_added(event: dict) -> bool:
     Returns:
         resolved (bool): whether the message was marked as resolved, for GUI
     """
-    print("Handling reaction added...")
-
-    reaction = event.get("reaction")
+    reaction = event.get("reaction", "")
     item = event.get("item", {})
     message_id = item.get("ts")
-    channel_id = message_to_channel.get(message_id)
-
-    # going to be used in the GUI to determine if we should display the message
-    resolved = False
-
-    # gather information about the author
     author_id = event.get("user")
-    author_name = get_user_first_name(author_id)
 
-    if message_id in pending_messages:
-        # no colons in Slack reaction values
-        # +1 in reaction because there are multiple possible skin tones
-        if reaction == "white_check_mark" or "+1" in reaction:
-            print(f"Message {message_id} has received a resolving reaction. Marking as resolved.")
-            pending_messages.remove(message_id)
+    # no colons in Slack reaction values
+    # +1 in reaction because there are multiple possible skin tones
+    if reaction != "white_check_mark" and "+1" not in reaction:
+        LOG.debug("Reaction was not white_check_mark or +1", reaction=reaction)
+        return False
 
-            message_append(channel_id, message_id, "*(resolved)*")
+    pending_message = get_state_store().get(message_key(message_id))
+    if not is_pending(pending_message):
+        LOG.info("Timestamp was not in pending messages", ts=message_id)
+        return False
 
-            sns_message = {
-                "ts": message_id,
-                "reply_text": reaction,
-                "reply_author": author_name
-            }
+    message = claim_message_status(message_id, MessageStatus.RESOLVED)
+    if message is None:
+        return False
 
-            SNS_CLIENT.publish(
-                TopicArn=SNS_ARN,
-                Message=json.dumps(sns_message),
-                MessageGroupId=message_to_device_id[message_id], # original device
-                Subject="Message Resolved Notification"
-            )
-        else:
-            print("Reaction was not white_check_mark or +1")
-    else:
-        print("Timestamp was not in pending messages")
+    LOG.info("Resolving reaction received", ts=message_id, reaction=reaction)
+
+    run_concurrently(
+        lambda: edit_message(message_id, message),
+        lambda: notify_author_reply(message["device_id"], message_id, reaction, author_id,
+                                    "Message Resolved Notification")
+    )
 
-    return resolved
+    return True
 
-def get_message_content(channel_id: str, message_id: str):
+def claim_message_status(message_id: str, status: MessageStatus, due_by: float = None) -> dict | None:
     """
-    Retrieves the content of a message from Slack using conversations.history
+    Moves a message to a new status in the state store only. Compare-and-set,
+    so when containers race exactly one of them gets the message back.
+    A reply pushes the message's deadline back to give staff time to resolve it
 
     Args:
-        channel_id (str): the Slack channel ID where the message was posted
-        message_id (str): the message ID/timestamp to get content from
+        message_id (str): the message ID/timestamp to update
+        status (MessageStatus): the status to move to
+        due_by (float): only move it if its deadline is at or before this epoch time
 
     Returns:
-        str: The content of the message
+        dict | None: the updated message record, or None if the move isn't allowed
     """
-    url = "https://slack.com/api/conversations.history"
-    headers = {
-        "Content-Type": "application/json; charset=utf-8",
-        "Authorization": f"Bearer {BOT_OAUTH_TOKEN}"
-    }
-    params = {
-        "channel": channel_id,
-        "latest": message_id,
-        "limit": 1,
-        "inclusive": True
-    }
+    deadline_moved = []
+
+    def transition(message: dict | None) -> dict | None:
+        deadline_moved.clear()
+        if message is None or status not in STATUS_TRANSITIONS[MessageStatus(message["status"])]:
+            return None
+        if due_by is not None and message.get("expires_at", 0) > due_by:
+            return None
 
-    # 10 second timeout
-    ct_response = requests.get(url, headers=headers, params=params, timeout=10)
-    response_data = ct_response.json()
+        updated = {**message, "status": status.value}
+        if status == MessageStatus.REPLIED:
+            updated["replied"] = True
+            updated["expires_at"] = max(message.get("expires_at", 0), time.time() + REPLY_TIMEOUT)
+            if updated["expires_at"] != message.get("expires_at"):
+                deadline_moved.append(True)
 
-    if not response_data.get("ok"):
-        raise RuntimeError(f"Error retrieving message: {response_data['error']}")
+        return updated
 
-    messages = response_data.get("messages")
-    if not messages:
-        raise RuntimeError("No messages found")
+    message = get_state_store().update(message_key(message_id), transition, ttl=MESSAGE_TTL)
+    if message is None:
+        LOG.info("Message is unknown or can't change status", ts=message_id, status=status.value)
+    elif deadline_moved:
+        get_expiry_index().add(message_id, message["expires_at"])
 
-    return messages[0].get("text")
+    return message
 
-def message_append(channel_id: str, ts: str, to_append: str):
+def edit_message(message_id: str, message: dict) -> None:
     """
-    Marks a message as resolved by appending (resolved) to the message text.
+    Edits a message on Slack to show its current status
 
     Args:
-        channel_id (str): the ID of the channel containing the message
-        ts (str): the timestamp of the message to update
+        message_id (str): the message ID/timestamp to edit
+        message (dict): the message record from the state store
     """
-    existing_content = get_message_content(channel_id, ts)
-    updated_content = f"{existing_content} {to_append}"
+    get_slack_client().post("chat.update", channel=message["channel_id"], ts=message_id,
+                            text=render_message_text(message))
 
-    url = "https://slack.com/api/chat.update"
-    headers = {
-        "Content-Type": "application/json; charset=utf-8",
-        "Authorization": f"Bearer {BOT_OAUTH_TOKEN}"
-    }
-    payload = {
-        "channel": channel_id,
-        "ts": ts,
-        "text": updated_content
-    }
+    LOG.info("Message edited", ts=message_id, status=message["status"])
 
-    # 10 second timeout
-    res_response = requests.post(url, headers=headers, json=payload, timeout=10)
-    response_data = res_response.json()
+def set_message_status(message_id: str, status: MessageStatus) -> bool:
+    """
+    Moves a message to a new status and edits it on Slack to match.
+    The new text comes from the stored original text, so this is exactly one
+    chat.update, and double-marking is rejected without touching the network.
 
-    if not response_data.get("ok"):
-        raise RuntimeError(f"Error editing message: {response_data['error']}")
+    Args:
+        message_id (str): the message ID/timestamp to update
+        status (MessageStatus): the status to move to
 
-    print(f"Message with ID {ts} edited successfully")
+    Returns:
+        bool: whether the status changed
+    """
+    message = claim_message_status(message_id, status)
+    if message is None:
+        return False
+
+    edit_message(message_id, message)
+
+    return True
 
-    return response_data
+class PostOutcomeUnknown(Exception):
+    """
+    Slack may or may not have posted a message (a timeout or server error
+    after sending it), so posting it again could duplicate it
+    """
 
-def post_to_slack(channel_id: str, message: str, device_id: str, location: str):
+def post_key(post_id: str) -> str:
     """
-    Posts a message to Slack using chat.postMessage
+    Gets the state store key remembering what happened to a kiosk's post
 
     Args:
-        channel (str): the Slack channel to send the message to
-        message (str): the message to send
-        location (str): the location we're sending from
+        post_id (str): the post ID the kiosk sent
+
+    Returns:
+        str: the key
     """
-    url = "https://slack.com/api/chat.postMessage"
-    headers = {
-        "Content-Type": "application/json; charset=utf-8",
-        "Authorization": f"Bearer {BOT_OAUTH_TOKEN}"
-    }
-    payload = {
-        "channel": channel_id,
-        "text": message
-    }
+    return f"post:{post_id}"
 
-    last_message = get_location_last_message(channel_id, get_bot_user_id(), location)
-    if last_message:
-        print("Last message found: ", last_message["ts"])
-        last_message_time = float(last_message["ts"])
-        current_time = time.time()
+def post_to_slack(channel_id: str, message: str, device_id: str, location: str, post_id: str = None):
+    """
+    Posts a message to Slack using chat.postMessage. A post_id makes retries
+    safe: a retry of a post that went through gets the same message back
 
-        # if the difference between this message's time and 
-        # the last message's is less than the cooldown, don't post
-        if last_message_time and current_time - last_message_time <= POST_COOLDOWN:
-            print("Posting messages too fast! Rate limit applied.")
-            return "N/A", "N/A"
+    Args:
+        channel (str): the Slack channel to send the message to
+        message (str): the message to send
+        device_id (str): the device we're sending from
+        location (str): the location we're sending from
+        post_id (str): the kiosk's unique ID for this help request, if any
 
-    # 10 second timeout
-    post_response = requests.post(url, headers=headers, json=payload, timeout=10)
-    response_data = post_response.json()
+    Returns:
+        tuple: the message ID and channel ID, both "N/A" if rate limited.
+            Raises PostOutcomeUnknown if it mustn't be retried
+    """
+    import slack_client
+
+    store = get_state_store()
+
+    if post_id:
+        # a short claim, so a post whose invocation died mid-call isn't stuck for an hour
+        if not store.add(post_key(post_id), {"state": "in_progress"}, ttl=idempotency.CLAIM_TTL):
+            previous = store.get(post_key(post_id)) or {}
+            if previous.get("state") == "posted":
+                LOG.info("Post retried, returning the first one", post_id=post_id, ts=previous["message_id"])
+                return previous["message_id"], previous["channel_id"]
+            if previous.get("state") == "unknown":
+                raise PostOutcomeUnknown(f"Post {post_id} may already have been posted")
+
+            raise RuntimeError(f"Post {post_id} is still in progress")
+
+    # limit per device, falling back on location then channel for old payloads
+    limiter = get_rate_limiter()
+    rate_key = device_id or location.strip() or channel_id
+    pressed_at = time.time()
+    if not limiter.allow(rate_key, pressed_at):
+        LOG.info("Rate limit applied", device_id=device_id, **limiter.counters)
+        METRICS.count("RateLimitHits")
+        if post_id:
+            store.delete(post_key(post_id))
+        return "N/A", "N/A"
 
-    if not response_data.get("ok"):
-        raise RuntimeError(f"Error posting message: {response_data}")
+    try:
+        response_data = get_slack_client().post("chat.postMessage", channel=channel_id, text=message)
+    except slack_client.SlackApiError: # Slack answered, and didn't post it
+        limiter.release(rate_key, pressed_at) # so the kiosk's retry isn't rate limited
+        if post_id:
+            store.delete(post_key(post_id))
+        raise
+    except Exception as e: # timed out or a server error, it may have gone through
+        # the press still counts, since the message may well be on Slack
+        if post_id:
+            store.put(post_key(post_id), {"state": "unknown"}, ttl=MESSAGE_TTL)
+        raise PostOutcomeUnknown(str(e)) from e
 
     # Extract the message ID (timestamp)
     message_id = response_data.get("ts")
-    pending_messages.append(message_id)
-    message_to_channel[message_id] = channel_id
-    message_to_device_id[message_id] = device_id
-
-    print(f"Message posted with ID: {message_id}")
 
-    return message_id, channel_id
-
-def get_bot_user_id():
-    """
-    Retrieves the user ID of the currently running bot
-    Returns:
-        str: The bot's user ID
-    """
-    url = "https://slack.com/api/auth.test"
-    headers = {
-        "Authorization": f"Bearer {BOT_OAUTH_TOKEN}"
-    }
-
-    response = requests.get(url, headers=headers, timeout=10)
-    response_data = response.json()
+    # recorded first, so whatever fails below, a retry gets this message back
+    if post_id:
+        store.put(post_key(post_id), {"state": "posted", "message_id": message_id, "channel_id": channel_id},
+                  ttl=MESSAGE_TTL)
+
+    expires_at = time.time() + MESSAGE_TIMEOUT
+    store.put(
+        message_key(message_id),
+        {
+            "channel_id": channel_id,
+            "device_id": device_id,
+            "text": message,
+            "status": MessageStatus.PENDING.value,
+            "expires_at": expires_at
+        },
+        ttl=MESSAGE_TTL
+    )
+    try:
+        get_expiry_index().add(message_id, expires_at)
+    except Exception as e: # the message still expires with its TTL, just without the Slack edit
+        LOG.warning("Unable to index message deadline", ts=message_id, error=str(e))
 
-    if not response_data.get("ok"):
-        raise RuntimeError(f"Error retrieving bot user ID: {response_data['error']}")
+    LOG.info("Message posted", ts=message_id, channel_id=channel_id, device_id=device_id)
 
-    return response_data["user_id"]
+    return message_id, channel_id
 
 def mark_message_timedout(channel_id: str, message_id: str):
     """
@@ -481,11 +1029,8 @@ def mark_message_timedout(channel_id: str, message_id: str):
         channel_id (str): the Slack channel ID where the message was posted
         message_id (str): the message ID/timestamp to get content from
     """
-    if message_id in pending_messages:
-        pending_messages.remove(message_id)
-        message_append(channel_id, message_id, "*(timed out)*")
-
-        print(f"Message {message_id} has timed out")
+    if set_message_status(message_id, MessageStatus.TIMED_OUT):
+        LOG.info("Message timed out", ts=message_id)
 
 def mark_message_replied(channel_id: str, message_id: str):
     """
@@ -494,23 +1039,73 @@ def mark_message_replied(channel_id: str, message_id: str):
         channel_id (str): the Slack channel ID where the message was posted
         message_id (str): the message ID/timestamp to get content from
     """
-    if message_id in pending_messages:
-        if not (get_message_content(channel_id, message_id).endswith("*(replied)*")
-                or get_message_content(channel_id, message_id).endswith("*(resolved)*")
-                or get_message_content(channel_id, message_id).endswith("*(timed out)*")):
-            message_append(channel_id, message_id, "*(replied)*")
+    if set_message_status(message_id, MessageStatus.REPLIED):
+        LOG.info("Message marked replied", ts=message_id)
+
+def sweep_expired_messages(now: float = None) -> list:
+    """
+    Times out every message still waiting on staff (pending or replied) past
+    its deadline, in bulk: one chat.update per message plus a notification
+    for its kiosk. Run on a schedule, so kiosks that reboot or drop off Wi-Fi
+    don't leave messages open forever. Only the index buckets that have come
+    due are read
+
+    Args:
+        now (float): the current epoch time, defaults to time.time()
 
-        print(f"Message {message_id} has been marked as replied")
+    Returns:
+        list: the message IDs that were timed out
+    """
+    now = time.time() if now is None else now
+    due = get_expiry_index().pop_due(now)
+
+    # claim first, anything resolved, or given more time by a reply, is skipped
+    claimed = []
+    for message_id in due:
+        message = claim_message_status(message_id, MessageStatus.TIMED_OUT, due_by=now)
+        if message is not None:
+            claimed.append((message_id, message))
+
+    # then all the edits and notifications side by side, flat so that
+    # no task waits on another in the executor
+    tasks = []
+    for message_id, message in claimed:
+        tasks.append(lambda message_id=message_id, message=message: edit_message(message_id, message))
+        tasks.append(lambda message_id=message_id, message=message: publish_notification(
+            message["device_id"], {"ts": message_id, "status": "timed_out"},
+            "Message Timed Out Notification"
+        ))
+    run_concurrently(*tasks)
+
+    expired = [message_id for message_id, _ in claimed]
+    LOG.info("Expiry sweep finished", due=len(due), expired=len(expired))
+
+    return expired
+
+# users.list takes up to 10 pages, so it's started on cold start and never run inside a request
+if CONFIG.get("warm_user_cache", False):
+    get_user_directory().warm_up_in_background()
 
 if __name__ == "__main__":
-    # Run test
+    # Run test, optionally with a different event: python lambda_function.py aws_json/test_reply.json
+    test_path = sys.argv[1] if len(sys.argv) > 1 else "aws_json/test_post.json"
     try:
-        with open("aws_json/test_post.json", "r", encoding="utf8") as test_file:
+        with open(test_path, "r", encoding="utf8") as test_file:
             test_event = json.load(test_file)
+
+            start = time.perf_counter()
             response = lambda_handler(test_event, None)
+            print(f"Ack latency: {(time.perf_counter() - start) * 1000:.1f} ms")
             print("Response:", response)
+
+            # with the local fast-ack stage the real work is still running
+            if isinstance(DEFERRED_STAGE, deferred.LocalQueueStage):
+                DEFERRED_STAGE.join()
+                for latency in DEFERRED_STAGE.processing_latencies:
+                    print(f"Processing latency: {latency * 1000:.1f} ms")
+
+            print("Slack API stats:", get_slack_client().stats())
     except FileNotFoundError as e:
-        print("test_post.json not found.")
+        print(f"{test_path} not found.")
     except json.JSONDecodeError as e:
-        print("Error decoding test_post.json:", e)
-    
\ No newline at end of file
+        print(f"Error decoding {test_path}:", e)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+"""
+Per-invocation timing for the Lambda function's external calls (Slack, SNS
+and the state store), written as CloudWatch Embedded Metric Format records.
+CloudWatch turns the one JSON line we print per invocation into metrics, so
+nothing here ever calls the metrics API.
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+NAMESPACE = "SlackLambdaButton"
+
+# upper bounds of the latency histogram buckets, in ms
+HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+MAX_VALUES = 100 # EMF accepts at most 100 values per metric per record
+
+class InvocationMetrics:
+    """
+    Collects call counts, latencies, retries and rate limit hits for one
+    invocation at a time, then flushes them as a single EMF record.
+    Lambda only runs one invocation per container at once, so one instance
+    per container is enough.
+    """
+
+    def __init__(self, namespace: str = NAMESPACE, enabled: bool = True, stream=None):
+        """
+        Args:
+            namespace (str): the CloudWatch namespace the metrics land in
+            enabled (bool): whether flush() writes anything
+            stream: where to write, defaults to stdout (CloudWatch in Lambda)
+        """
+        self.namespace = namespace
+        self.enabled = enabled
+        self.stream = stream
+
+        self.cold_start = True # only the first invocation in a container is cold
+        self._invocations = 0
+        self._lock = threading.Lock()
+        self._reset()
+
+    @classmethod
+    def from_config(cls, metrics_config: dict):
+        """
+        Builds the metrics from the "metrics" section of config/aws.json, e.g.
+        {"enabled": true, "namespace": "SlackLambdaButton"}
+
+        Args:
+            metrics_config (dict): the metrics config section
+
+        Returns:
+            InvocationMetrics: the configured metrics
+        """
+        return cls(metrics_config.get("namespace", NAMESPACE), metrics_config.get("enabled", True))
+
+    def start(self) -> None:
+        """
+        Starts a new invocation, dropping anything left over from the last one
+        """
+        with self._lock:
+            self._reset()
+            self.cold_start = self._invocations == 0
+            self._invocations += 1
+            self._started = time.perf_counter()
+
+    def set_event_type(self, event_type: str) -> None:
+        """
+        Sets the event type the record is dimensioned by
+
+        Args:
+            event_type (str): the (unwrapped) event type, e.g. "reaction_added"
+        """
+        self.event_type = event_type or "unknown"
+
+    def record(self, operation: str, elapsed_ms: float, error: bool = False,
+               retried: bool = False, rate_limited: bool = False) -> None:
+        """
+        Adds one call to an operation's aggregates
+
+        Args:
+            operation (str): what was called, e.g. "slack.chat.update"
+            elapsed_ms (float): how long the call took
+            error (bool): whether it failed
+            retried (bool): whether it's about to be retried
+            rate_limited (bool): whether it was rate limited
+        """
+        with self._lock:
+            aggregate = self._operations.setdefault(operation, {
+                "calls": 0, "errors": 0, "retries": 0, "rate_limited": 0,
+                "latencies": [], "histogram": [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+            })
+            aggregate["calls"] += 1
+            aggregate["errors"] += error
+            aggregate["retries"] += retried
+            aggregate["rate_limited"] += rate_limited
+
+            if len(aggregate["latencies"]) < MAX_VALUES:
+                aggregate["latencies"].append(round(elapsed_ms, 3))
+
+            bucket = next((index for index, bound in enumerate(HISTOGRAM_BUCKETS_MS)
+                           if elapsed_ms <= bound), len(HISTOGRAM_BUCKETS_MS))
+            aggregate["histogram"][bucket] += 1
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Bumps a plain counter, e.g. "RateLimitHits"
+
+        Args:
+            name (str): the counter
+            value (int): how much to add
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    @contextmanager
+    def timed(self, operation: str):
+        """
+        Times the body of a with block as one call to an operation,
+        counting it as an error if it raises
+
+        Args:
+            operation (str): what's being called, e.g. "sns.publish"
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.record(operation, (time.perf_counter() - start) * 1000, error=True)
+            raise
+
+        self.record(operation, (time.perf_counter() - start) * 1000)
+
+    def flush(self) -> dict:
+        """
+        Writes the invocation's aggregates as one EMF record
+
+        Returns:
+            dict: the record, written or not
+        """
+        with self._lock:
+            record = self._build_record()
+
+        if self.enabled:
+            print(json.dumps(record, separators=(",", ":")), file=self.stream or sys.stdout)
+
+        return record
+
+    def _build_record(self) -> dict:
+        """
+        Builds the EMF record. Per-operation values are metrics named
+        "<operation>.<measure>"; histograms ride along as plain properties
+        for Logs Insights
+        """
+        record = {
+            "EventType": self.event_type,
+            "ColdStart": int(self.cold_start),
+            "Duration": round((time.perf_counter() - self._started) * 1000, 3),
+            "HistogramBucketsMs": list(HISTOGRAM_BUCKETS_MS)
+        }
+        metrics = [
+            {"Name": "ColdStart", "Unit": "Count"},
+            {"Name": "Duration", "Unit": "Milliseconds"}
+        ]
+
+        for operation, aggregate in self._operations.items():
+            record[f"{operation}.Latency"] = aggregate["latencies"]
+            record[f"{operation}.Calls"] = aggregate["calls"]
+            record[f"{operation}.Errors"] = aggregate["errors"]
+            record[f"{operation}.Retries"] = aggregate["retries"]
+            record[f"{operation}.RateLimited"] = aggregate["rate_limited"]
+            record[f"{operation}.Histogram"] = aggregate["histogram"]
+
+            metrics.append({"Name": f"{operation}.Latency", "Unit": "Milliseconds"})
+            metrics.extend({"Name": f"{operation}.{measure}", "Unit": "Count"}
+                           for measure in ("Calls", "Errors", "Retries", "RateLimited"))
+
+        for name, value in self._counters.items():
+            record[name] = value
+            metrics.append({"Name": name, "Unit": "Count"})
+
+        record["_aws"] = {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": self.namespace,
+                "Dimensions": [["EventType"]],
+                "Metrics": metrics
+            }]
+        }
+
+        return record
+
+    def _reset(self) -> None:
+        """
+        Clears the aggregates, call with the lock held
+        """
+        self.event_type = "unknown"
+        self._operations = {} # operation -> aggregate
+        self._counters = {}
+        self._started = time.perf_counter()
+
+class Instrumented:
+    """
+    Wraps an object so the listed methods are timed as "<prefix>.<method>".
+    Everything else is passed straight through.
+    """
+
+    def __init__(self, target, metrics: InvocationMetrics, prefix: str, methods: tuple):
+        """
+        Args:
+            target: the object to wrap, e.g. a boto3 client or a state store
+            metrics (InvocationMetrics): where timings go
+            prefix (str): the operation prefix, e.g. "sns"
+            methods (tuple): the method names to time
+        """
+        self._target = target
+        self._metrics = metrics
+        self._prefix = prefix
+        self._methods = methods
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._target, name)
+        if name not in self._methods:
+            return attribute
+
+        def timed_method(*args, **kwargs):
+            with self._metrics.timed(f"{self._prefix}.{name}"):
+                return attribute(*args, **kwargs)
+
+        return timed_method
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+
+"""
+A durable store-and-forward outbox for the kiosk. Presses, status updates
+and log rows are written to a local SQLite file (WAL mode, so a write takes
+well under a millisecond) and the GUI carries on right away. A background
+flusher sends them when the network allows, in order per device, backing
+off while it's down and dropping anything too old to matter.
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+OUTBOX_PATH = os.path.join(tempfile.gettempdir(), "slack_lambda_outbox.sqlite3")
+
+BASE_BACKOFF = 1 # in seconds, doubled after every failed attempt
+MAX_BACKOFF = 60
+BATCH_SIZE = 20 # the most rows of each kind a flush looks at
+
+class Discard(Exception):
+    """
+    Raised by a handler when a request must not be retried, e.g. because the
+    server refused it for good or it may already have gone through. The
+    request is dropped and its callback gets the message as the error
+    """
+
+class Outbox:
+    """
+    Queued requests, each with a kind ("post", "status", "log") that says
+    which handler sends it. Handlers are registered with register().
+    """
+
+    def __init__(self, path: str = OUTBOX_PATH, batch_size: int = BATCH_SIZE,
+                 base_backoff: float = BASE_BACKOFF, max_backoff: float = MAX_BACKOFF):
+        """
+        Args:
+            path (str): the SQLite file, kept across restarts
+            batch_size (int): the most rows of each kind a flush looks at
+            base_backoff (float): the first retry delay, in seconds
+            max_backoff (float): the longest retry delay, in seconds
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        # kind -> {"handler", "batch", "max_age"}
+        self.handlers = {}
+        # outbox id -> callback(result, error), in memory only
+        self.callbacks = {}
+
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL") # durable across app crashes, fast
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, device_id TEXT, kind TEXT, payload TEXT, "
+            "created_at REAL, attempts INTEGER DEFAULT 0, next_attempt_at REAL DEFAULT 0)"
+        )
+        self._lock = threading.Lock()
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._next_flush_at = 0 # when a delayed request is next due, set by flush()
+
+    def register(self, kind: str, handler, batch: bool = False, max_age: float = None) -> None:
+        """
+        Registers the handler that sends one kind of request
+
+        Args:
+            kind (str): the request kind, e.g. "post"
+            handler: called with a payload and returns a result, or with a list
+                of payloads if batch is True. Raising Discard drops the request,
+                raising anything else means "try again later"
+            batch (bool): whether the handler takes every due payload at once
+            max_age (float): how old a request may get before it's dropped, in
+                seconds, None to keep it until it's sent
+        """
+        self.handlers[kind] = {"handler": handler, "batch": batch, "max_age": max_age}
+
+    def enqueue(self, kind: str, payload: dict, device_id: str = "", callback=None) -> int:
+        """
+        Writes a request to the outbox and wakes the flusher
+
+        Args:
+            kind (str): the request kind
+            payload (dict): what the handler is sent
+            device_id (str): requests for the same device are sent in order
+            callback: called as callback(result, error) from the flusher thread
+                once the request is sent (error None) or dropped (result None)
+
+        Returns:
+            int: the request's outbox ID
+        """
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT INTO outbox (device_id, kind, payload, created_at) VALUES (?, ?, ?, ?)",
+                (device_id, kind, json.dumps(payload), time.time())
+            )
+            request_id = cursor.lastrowid
+            if callback is not None:
+                self.callbacks[request_id] = callback
+
+        self._wake.set()
+
+        return request_id
+
+    def pending(self) -> int:
+        """
+        Gets how many requests are waiting to be sent
+
+        Returns:
+            int: the number of queued requests
+        """
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def start(self) -> None:
+        """
+        Starts the background flusher, if it isn't running
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="outbox-flusher")
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the flusher after its current flush
+        """
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self) -> None:
+        """
+        The flusher loop: flush, then sleep until woken or the next retry is due
+        """
+        while not self._stop.is_set():
+            self._wake.clear()
+            self.flush()
+            self._wake.wait(max(self._next_flush_at - time.time(), 0.05))
+
+    def flush(self) -> int:
+        """
+        Sends every request that's due, oldest first. Once a request for a
+        device fails, that device's later requests wait for it. Each kind
+        gets its own share of the batch, so a kind that keeps failing (say,
+        log rows while Sheets is down) can't crowd out the others
+
+        Returns:
+            int: how many requests were sent
+        """
+        now = time.time()
+        kinds = list(self.handlers)
+        done = self._expire(now) # sent or expired
+        rows = []
+
+        with self._lock:
+            for kind in kinds:
+                # due, and not queued behind an older request for the same device that isn't
+                rows += self._connection.execute(
+                    "SELECT id, device_id, kind, payload, created_at, attempts, next_attempt_at "
+                    "FROM outbox AS o WHERE kind = ? AND next_attempt_at <= ? AND NOT EXISTS ("
+                    "SELECT 1 FROM outbox AS e WHERE e.device_id = o.device_id AND e.id < o.id "
+                    f"AND e.next_attempt_at > ? AND e.kind IN ({', '.join('?' * len(kinds))})) "
+                    "ORDER BY id LIMIT ?", (kind, now, now, *kinds, self.batch_size)
+                ).fetchall()
+
+            # nothing waiting means sleeping until enqueue() wakes us
+            next_attempt_at = self._connection.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE next_attempt_at > ? "
+                f"AND kind IN ({', '.join('?' * len(kinds))})", (now, *kinds)
+            ).fetchone()[0] if kinds else None
+
+        self._next_flush_at = min(next_attempt_at or now + self.max_backoff, now + self.max_backoff)
+
+        rows.sort(key=lambda row: row[0])
+        blocked = set() # devices with an earlier request that just failed
+        batches = {} # batched kind -> rows
+        sent = 0
+        full = False # whether some kind had more due than we looked at
+
+        for kind in kinds:
+            full = full or sum(1 for row in rows if row[2] == kind) == self.batch_size
+
+        for row in rows:
+            request_id, device_id, kind, payload, created_at, attempts, next_attempt_at = row
+            registration = self.handlers[kind]
+
+            if device_id in blocked:
+                continue
+
+            if registration["batch"]:
+                batches.setdefault(kind, []).append(row)
+                continue
+
+            try:
+                result = registration["handler"](json.loads(payload))
+            except Discard as e:
+                print(f"Outbox request {request_id} ({kind}) dropped: {e}")
+                self._finish(request_id, None, str(e))
+                done += 1
+                continue
+            except Exception as e: # network down, timeouts, etc. all mean try again
+                print(f"Outbox request {request_id} ({kind}) failed, will retry: {e}")
+                self._retry([request_id], attempts)
+                blocked.add(device_id)
+                continue
+
+            self._finish(request_id, result, None)
+            sent += 1
+            done += 1
+
+        for kind, batch_rows in batches.items():
+            request_ids = [row[0] for row in batch_rows]
+            try:
+                result = self.handlers[kind]["handler"]([json.loads(row[3]) for row in batch_rows])
+            except Discard as e:
+                print(f"Outbox batch of {len(batch_rows)} ({kind}) dropped: {e}")
+                for request_id in request_ids:
+                    self._finish(request_id, None, str(e))
+                done += len(request_ids)
+                continue
+            except Exception as e:
+                print(f"Outbox batch of {len(batch_rows)} ({kind}) failed, will retry: {e}")
+                self._retry(request_ids, max(row[5] for row in batch_rows))
+                continue
+
+            for request_id in request_ids:
+                self._finish(request_id, result, None)
+            sent += len(request_ids)
+            done += len(request_ids)
+
+        # a full batch that made progress may have more behind it
+        if done and full:
+            self._next_flush_at = now
+
+        return sent
+
+    def _expire(self, now: float) -> int:
+        """
+        Drops requests older than their kind's max_age, whether or not they're due
+
+        Returns:
+            int: how many were dropped
+        """
+        expired = []
+
+        with self._lock:
+            for kind, registration in self.handlers.items():
+                if registration["max_age"] is not None:
+                    expired += self._connection.execute(
+                        "SELECT id, kind, attempts FROM outbox WHERE kind = ? AND created_at < ?",
+                        (kind, now - registration["max_age"])
+                    ).fetchall()
+
+        for request_id, kind, attempts in expired:
+            print(f"Outbox request {request_id} ({kind}) expired after {attempts} attempts")
+            self._finish(request_id, None, "expired")
+
+        return len(expired)
+
+    def _retry(self, request_ids: list, attempts: int) -> None:
+        """
+        Schedules requests for another attempt with exponential backoff and jitter
+        """
+        delay = min(self.base_backoff * 2 ** attempts, self.max_backoff)
+        next_attempt_at = time.time() + delay * random.uniform(0.5, 1)
+        self._next_flush_at = min(self._next_flush_at, next_attempt_at)
+
+        with self._lock:
+            self._connection.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ? WHERE id = ?",
+                [(next_attempt_at, request_id) for request_id in request_ids]
+            )
+
+    def _finish(self, request_id: int, result, error) -> None:
+        """
+        Removes a sent or expired request and runs its callback
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM outbox WHERE id = ?", (request_id,))
+            callback = self.callbacks.pop(request_id, None)
+
+        if callback is not None:
+            try:
+                callback(result, error)
+            except Exception as e: # a bad callback shouldn't stop the flusher
+                print(f"Error in outbox callback: {e}")
@@ -13,6 +13,9 @@ pip install --target ./package --upgrade google-api-python-client google-auth-ht
 :: Install boto3
 pip install --target ./package --upgrade boto3
 
+:: Copy the Lambda function and the modules it imports
+for %%f in (lambda_function.py state_store.py slack_client.py rate_limiter.py deferred.py idempotency.py structured_log.py expiry.py metrics.py) do copy %%f package\
+
 :: Copy config over to package, if it exists
 copy config ./package/config
 
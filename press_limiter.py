@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+"""
+The kiosk's own rate limit on presses, checked before anything else so a
+spammed screen is turned away without any I/O. Each device's last post is
+kept on the monotonic clock along with the limit it was posted under, and
+saved to a small state file so the limit survives auto_updater restarts.
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import json
+import os
+import tempfile
+import time
+
+STATE_PATH = os.path.join(tempfile.gettempdir(), "slack_lambda_presses.json")
+BOOT_TOLERANCE = 5 # in seconds, how far the estimated boot time may move within one boot
+
+def get_boot_id() -> str | None:
+    """
+    Gets the kernel's ID for this boot, where there is one (Linux)
+
+    Returns:
+        str | None: the boot ID, or None if it isn't available
+    """
+    try:
+        with open("/proc/sys/kernel/random/boot_id", "r", encoding="utf8") as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+class PressLimiter:
+    """
+    Device ID -> (monotonic time of its last post, rate limit in seconds).
+    Monotonic times only mean something within one boot, so presses saved
+    before a reboot are carried over by their wall clock time instead
+    """
+
+    def __init__(self, path: str = STATE_PATH):
+        """
+        Args:
+            path (str): the state file, kept across restarts
+        """
+        self.path = path
+        self.presses = {}
+
+        self.load()
+
+    def is_limited(self, device_id: str) -> bool:
+        """
+        Checks whether a device posted too recently, from memory only
+
+        Args:
+            device_id (str): the device's ID
+
+        Returns:
+            bool: whether a press now should be turned away
+        """
+        press = self.presses.get(device_id)
+        if press is None:
+            return False
+
+        posted_at, rate_limit = press
+        return time.monotonic() - posted_at < rate_limit
+
+    def record(self, device_id: str, rate_limit: float) -> None:
+        """
+        Records a post and saves the state file
+
+        Args:
+            device_id (str): the device's ID
+            rate_limit (float): the fewest seconds allowed until its next post
+        """
+        self.presses[device_id] = (time.monotonic(), rate_limit)
+        self.save()
+
+    def save(self) -> None:
+        """
+        Writes the state file, replacing it in one step so a crash can't leave half of it
+        """
+        state = {
+            "boot_id": get_boot_id(),
+            "booted_at": time.time() - time.monotonic(),
+            "presses": {device_id: {"monotonic": posted_at, "rate_limit": rate_limit}
+                        for device_id, (posted_at, rate_limit) in self.presses.items()}
+        }
+
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf8") as file:
+                json.dump(state, file)
+            os.replace(temp_path, self.path)
+        except OSError as e: # the limit still holds until we restart
+            print(f"Unable to save press state: {e}")
+
+    def load(self) -> None:
+        """
+        Reads the state file, if there is one
+        """
+        try:
+            with open(self.path, "r", encoding="utf8") as file:
+                state = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return
+
+        # same boot means the saved monotonic times still line up with ours
+        boot_id = get_boot_id()
+        booted_at = time.time() - time.monotonic()
+
+        if boot_id is not None and state.get("boot_id") is not None:
+            same_boot = boot_id == state["boot_id"]
+        else:
+            same_boot = abs(booted_at - state.get("booted_at", 0)) < BOOT_TOLERANCE
+
+        for device_id, press in state.get("presses", {}).items():
+            posted_at = press["monotonic"]
+            if not same_boot:
+                # back to wall clock time under the old boot, then onto ours
+                posted_at = state.get("booted_at", 0) + posted_at - booted_at
+
+            self.presses[device_id] = (posted_at, press["rate_limit"])
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+"""
+Gives every kiosk its own notification queue. Each device gets a FIFO queue
+subscribed to the SNS topic with a filter policy on the "device_id" message
+attribute, so SNS only delivers a device's own notifications to it and no
+kiosk ever sees (or deletes) another's. Safe to re-run as devices are added.
+
+Usage:
+    python provision_notifications.py DEVICE_ID [DEVICE_ID ...] [--endpoint-url http://localhost:4566]
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import argparse
+import json
+
+import boto3
+
+import aws
+
+def queue_policy(queue_arn: str, topic_arn: str) -> str:
+    """
+    Builds a queue policy letting the SNS topic deliver to the queue
+
+    Args:
+        queue_arn (str): the queue's ARN
+        topic_arn (str): the topic's ARN
+
+    Returns:
+        str: the policy document, as JSON
+    """
+    return json.dumps({
+        "Version": "2012-10-17",
+        "Statement": [{
+            "Effect": "Allow",
+            "Principal": {"Service": "sns.amazonaws.com"},
+            "Action": "sqs:SendMessage",
+            "Resource": queue_arn,
+            "Condition": {"ArnEquals": {"aws:SourceArn": topic_arn}}
+        }]
+    })
+
+def provision_device(sns_client: boto3.client, sqs_client: boto3.client, topic_arn: str,
+                     device_id: str, dev: bool = True) -> str:
+    """
+    Creates a device's queue and subscribes it to the topic, filtered to
+    that device. Creating an existing queue or subscription is a no-op
+
+    Args:
+        sns_client (boto3.client): the SNS client
+        sqs_client (boto3.client): the SQS client
+        topic_arn (str): the FIFO topic the Lambda function publishes to
+        device_id (str): the device's ID
+        dev (bool): whether we're using the dev AWS instance
+
+    Returns:
+        str: the queue URL
+    """
+    queue_url = sqs_client.create_queue(
+        QueueName=aws.device_queue_name(device_id, dev),
+        Attributes={
+            "FifoQueue": "true",
+            "ContentBasedDeduplication": "true",
+            "ReceiveMessageWaitTimeSeconds": "20" # long poll even if a client forgets to
+        }
+    )["QueueUrl"]
+
+    queue_arn = sqs_client.get_queue_attributes(
+        QueueUrl=queue_url,
+        AttributeNames=["QueueArn"]
+    )["Attributes"]["QueueArn"]
+
+    sqs_client.set_queue_attributes(
+        QueueUrl=queue_url,
+        Attributes={"Policy": queue_policy(queue_arn, topic_arn)}
+    )
+
+    sns_client.subscribe(
+        TopicArn=topic_arn,
+        Protocol="sqs",
+        Endpoint=queue_arn,
+        Attributes={"FilterPolicy": json.dumps({"device_id": [device_id]})},
+        ReturnSubscriptionArn=True
+    )
+
+    return queue_url
+
+def provision_devices(sns_client: boto3.client, sqs_client: boto3.client, topic_arn: str,
+                      device_ids: list, dev: bool = True) -> dict:
+    """
+    Provisions a queue for each device
+
+    Args:
+        sns_client (boto3.client): the SNS client
+        sqs_client (boto3.client): the SQS client
+        topic_arn (str): the FIFO topic the Lambda function publishes to
+        device_ids (list): the devices
+        dev (bool): whether we're using the dev AWS instance
+
+    Returns:
+        dict: device ID -> queue URL
+    """
+    return {device_id: provision_device(sns_client, sqs_client, topic_arn, device_id, dev)
+            for device_id in device_ids}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("Usage:")[0].strip())
+    parser.add_argument("device_ids", nargs="+", help="the devices to provision")
+    parser.add_argument("--endpoint-url", help="e.g. a local SNS/SQS stand-in such as LocalStack")
+    parser.add_argument("--topic-arn", help="defaults to sns_arn from config/aws.json")
+    parser.add_argument("--prod", action="store_true", help="provision for slackLambda instead of slackLambda-dev")
+    args = parser.parse_args()
+
+    with open("config/aws.json", "r", encoding="utf8") as file:
+        aws_config = json.load(file)
+
+    clients = {
+        service: boto3.client(
+            service,
+            aws_access_key_id=aws_config.get("aws_access_key") or None,
+            aws_secret_access_key=aws_config.get("aws_secret") or None,
+            region_name=aws_config.get("region", "us-east-2"),
+            endpoint_url=args.endpoint_url or aws_config.get("endpoint_url") or None
+        )
+        for service in ("sns", "sqs")
+    }
+
+    queue_urls = provision_devices(clients["sns"], clients["sqs"], args.topic_arn or aws_config["sns_arn"],
+                                   args.device_ids, not args.prod)
+
+    for device_id, queue_url in queue_urls.items():
+        print(f"{device_id}: {queue_url}")
+
+if __name__ == "__main__":
+    main()
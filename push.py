@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+"""
+Optional push delivery of replies over MQTT, e.g. from AWS IoT Core. The
+kiosk keeps one persistent connection subscribed to its own device topic, so
+replies show up as soon as they're published with no polling in between.
+SQS is only polled while the connection is down or refused. The Lambda
+function leaves push devices out of the SNS fan-out unless a push fails, so
+there's no backlog of copies waiting in the queue either.
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import json
+import queue
+import threading
+from collections import OrderedDict
+
+is_paho_installed = True
+try:
+    import paho.mqtt.client as mqtt
+except ImportError as e:
+    print("WARNING: paho-mqtt is not installed, replies will only come from SQS")
+    is_paho_installed = False
+
+TOPIC_PREFIX = "slackLambda/devices" # each device listens on <prefix>/<device id>
+
+def device_topic(device_id: str, topic_prefix: str = TOPIC_PREFIX) -> str:
+    """
+    Gets the MQTT topic a device's notifications are published to
+
+    Args:
+        device_id (str): the device's ID
+        topic_prefix (str): the topic prefix
+
+    Returns:
+        str: the topic
+    """
+    return f"{topic_prefix}/{device_id}"
+
+class PushConsumer:
+    """
+    Receives notifications over MQTT and hands them over through the same
+    get_message() as aws.SqsConsumer. The SQS consumer is only run while
+    MQTT is disconnected, and a notification that does arrive both ways
+    (a push that timed out but went through) is only delivered once.
+    """
+
+    def __init__(self, push_config: dict, device_id: str, fallback, seen_size: int = 256):
+        """
+        Args:
+            push_config (dict): the "push" section of config/aws.json, e.g.
+                {"host": "localhost", "port": 1883} for a local broker, plus
+                "ca_certs", "certfile" and "keyfile" for IoT Core
+            device_id (str): the device we're on
+            fallback (aws.SqsConsumer): where notifications come from while MQTT is down
+            seen_size (int): how many notification IDs to remember for dropping duplicates
+        """
+        self.push_config = push_config
+        self.device_id = device_id
+        self.fallback = fallback
+        self.topic = device_topic(device_id, push_config.get("topic_prefix", TOPIC_PREFIX))
+
+        self.messages = queue.Queue(maxsize=100)
+        self.connected = False
+
+        self.seen_size = seen_size
+        self._seen = OrderedDict() # notification ID -> None, oldest first
+        self._lock = threading.Lock()
+        self._client = None
+
+    def start(self) -> None:
+        """
+        Starts connecting in the background. SQS covers us until we're
+        connected, and reconnects happen on their own
+        """
+        self.fallback.start()
+
+        if not is_paho_installed or self._client is not None:
+            return
+
+        # paho-mqtt 2 wants the callback API version spelled out
+        if hasattr(mqtt, "CallbackAPIVersion"):
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1,
+                                 client_id=f"kiosk-{self.device_id}", clean_session=False)
+        else:
+            client = mqtt.Client(client_id=f"kiosk-{self.device_id}", clean_session=False)
+
+        if self.push_config.get("ca_certs"):
+            client.tls_set(ca_certs=self.push_config["ca_certs"],
+                           certfile=self.push_config.get("certfile"),
+                           keyfile=self.push_config.get("keyfile"))
+
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_message = self._on_message
+        client.reconnect_delay_set(min_delay=1, max_delay=60)
+
+        client.connect_async(self.push_config.get("host", "localhost"),
+                             int(self.push_config.get("port", 1883)),
+                             keepalive=int(self.push_config.get("keepalive", 60)))
+        client.loop_start() # paho's own thread, reconnects automatically
+
+        self._client = client
+
+    def stop(self) -> None:
+        """
+        Disconnects and stops the SQS fallback
+        """
+        if self._client is not None:
+            self._client.disconnect()
+            self._client.loop_stop()
+            self._client = None
+
+        self.fallback.stop()
+
+    def get_message(self) -> dict | None:
+        """
+        Gets the next notification without waiting, from MQTT or SQS
+
+        Returns:
+            dict | None: the decoded notification, or None if there isn't one
+        """
+        while True:
+            try:
+                notification = self.messages.get_nowait()
+            except queue.Empty:
+                notification = self.fallback.get_message()
+
+            if notification is None or self._remember(notification):
+                return notification
+
+    def _on_connect(self, client, userdata, flags, rc) -> None:
+        if rc != 0:
+            print(f"MQTT connection refused ({rc}), staying on SQS")
+            self.fallback.start()
+            return
+
+        print(f"MQTT connected, subscribing to {self.topic}")
+        client.subscribe(self.topic, qos=1)
+        self.connected = True
+
+        # the persistent session gets us anything published while we were away,
+        # and the consumer finishes its current poll before stopping
+        self.fallback.stop()
+
+    def _on_disconnect(self, client, userdata, rc) -> None:
+        self.connected = False
+
+        if rc != 0:
+            print(f"MQTT disconnected ({rc}), falling back on SQS until we reconnect")
+            self.fallback.start()
+
+    def _on_message(self, client, userdata, message) -> None:
+        try:
+            notification = json.loads(message.payload)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            print(f"Ignoring malformed MQTT message on {message.topic}")
+            return
+
+        print("MQTT message received:", notification)
+        self.messages.put(notification)
+
+    def _remember(self, notification: dict) -> bool:
+        """
+        Records a notification's ID
+
+        Returns:
+            bool: False if it was already delivered the other way
+        """
+        notification_id = notification.get("notification_id")
+        if notification_id is None:
+            return True # older publishers don't set one
+
+        with self._lock:
+            if notification_id in self._seen:
+                return False
+
+            self._seen[notification_id] = None
+            while len(self._seen) > self.seen_size:
+                self._seen.popitem(last=False)
+
+        return True
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+"""
+A sliding-window rate limiter for button presses, backed by the state store
+so every Lambda container sees the same press history.
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import threading
+import time
+
+import state_store
+
+DEFAULT_LIMIT = 1 # presses allowed...
+DEFAULT_WINDOW = 15 # ...per this many seconds
+
+class SlidingWindowRateLimiter:
+    """
+    Allows at most `limit` presses per key in any `window` seconds. Keys are
+    usually device IDs, and each device can have its own limit/window.
+    """
+
+    def __init__(self, store: state_store.StateStore, default_limit: int = DEFAULT_LIMIT,
+                 default_window: float = DEFAULT_WINDOW, overrides: dict = None):
+        """
+        Args:
+            store (state_store.StateStore): where press history lives
+            default_limit (int): presses allowed per window for keys without an override
+            default_window (float): the window length in seconds for keys without an override
+            overrides (dict): key -> {"limit": int, "window": float}
+        """
+        self.store = store
+        self.default_limit = default_limit
+        self.default_window = default_window
+        self.overrides = overrides or {}
+
+        self.counters = {"allowed": 0, "throttled": 0, "released": 0}
+        self._counters_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, store: state_store.StateStore, rate_limit_config: dict):
+        """
+        Builds a limiter from the "rate_limits" section of config/slack.json, e.g.
+        {"default": {"limit": 1, "window": 15}, "devices": {"dev3": {"limit": 2, "window": 60}}}
+
+        Args:
+            store (state_store.StateStore): where press history lives
+            rate_limit_config (dict): the rate limit config section
+
+        Returns:
+            SlidingWindowRateLimiter: the configured limiter
+        """
+        default = rate_limit_config.get("default", {})
+
+        return cls(
+            store,
+            int(default.get("limit", DEFAULT_LIMIT)),
+            float(default.get("window", DEFAULT_WINDOW)),
+            rate_limit_config.get("devices", {})
+        )
+
+    def limits_for(self, key: str) -> tuple:
+        """
+        Gets the limit and window that apply to a key
+
+        Args:
+            key (str): the device ID (or other key) being limited
+
+        Returns:
+            tuple: (limit, window in seconds)
+        """
+        override = self.overrides.get(key, {})
+
+        return (int(override.get("limit", self.default_limit)),
+                float(override.get("window", self.default_window)))
+
+    def allow(self, key: str, now: float = None) -> bool:
+        """
+        Records a press for a key if it's within its limit. Checking and
+        recording are one step, so concurrent presses can't both squeeze in;
+        a press that then fails to go through is taken back with release
+
+        Args:
+            key (str): the device ID (or other key) being limited
+            now (float): the press's epoch time, defaults to time.time()
+
+        Returns:
+            bool: True if the press may go ahead, False if it's rate limited
+        """
+        limit, window = self.limits_for(key)
+        now = time.time() if now is None else now
+        allowed = False
+
+        def record_press(history: dict | None) -> dict | None:
+            nonlocal allowed
+
+            # only presses inside the window count against the limit
+            presses = [press for press in (history or {}).get("presses", []) if press > now - window]
+            allowed = len(presses) < limit
+            if not allowed:
+                return None
+
+            return {"presses": presses + [now]}
+
+        self.store.update(f"ratelimit:{key}", record_press, ttl=window)
+
+        with self._counters_lock:
+            self.counters["allowed" if allowed else "throttled"] += 1
+
+        return allowed
+
+    def release(self, key: str, press: float) -> None:
+        """
+        Takes back a press allow recorded, e.g. because its post failed,
+        so it doesn't count against the limit
+
+        Args:
+            key (str): the device ID (or other key) being limited
+            press (float): the epoch time the press was allowed at
+        """
+        _, window = self.limits_for(key)
+
+        def forget_press(history: dict | None) -> dict | None:
+            presses = (history or {}).get("presses", [])
+            if press not in presses:
+                return None
+
+            presses = list(presses)
+            presses.remove(press)
+            return {"presses": presses}
+
+        self.store.update(f"ratelimit:{key}", forget_press, ttl=window)
+
+        with self._counters_lock:
+            self.counters["released"] += 1
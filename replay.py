@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+
+"""
+Replays recorded or synthesized event streams through lambda_handler, offline.
+
+Slack is replaced by a local fake Web API server and SNS by an in-process
+stand-in, so a whole event-heavy weekend can be load tested without touching
+the real workspace. Reports throughput and p50/p95/p99 handler latency per
+event type.
+
+Usage:
+    python replay.py --scenarios 200 --concurrency 8 --rate 20
+    python replay.py --events recorded.jsonl --concurrency 4
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import argparse
+import importlib
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+class FakeSlackServer:
+    """
+    A tiny stand-in for the Slack Web API, covering the methods the
+    Lambda function calls. Every response is {"ok": true, ...}
+    """
+
+    def __init__(self, latency_ms: float = 0):
+        """
+        Args:
+            latency_ms (float): how long each call should take, to mimic the real API
+        """
+        self.latency_ms = latency_ms
+        self.calls = {} # method -> count
+        self._ts_counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keep-alive, like the real API
+            disable_nagle_algorithm = True # headers and body go out separately
+
+            def log_message(self, format, *args):
+                pass # far too noisy under load
+
+            def do_GET(self):
+                self._respond(parse_qs(urlparse(self.path).query))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                self._respond(json.loads(self.rfile.read(length)) if length else {})
+
+            def _respond(self, params: dict):
+                method = urlparse(self.path).path.rsplit("/", 1)[-1]
+                body = json.dumps(fake.handle(method, params)).encode("utf-8")
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/api/"
+
+    def start(self) -> None:
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+    def handle(self, method: str, params: dict) -> dict:
+        """
+        Builds the response for one Slack method call
+
+        Args:
+            method (str): the Slack method, e.g. "chat.postMessage"
+            params (dict): the query parameters or JSON body
+
+        Returns:
+            dict: the response data
+        """
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+        response_data = {"ok": True}
+        if method == "auth.test":
+            response_data.update({"user_id": "UFAKEBOT", "bot_id": "BFAKEBOT"})
+        elif method == "users.info":
+            response_data["user"] = {"id": params.get("user"), "real_name": "Replay Staff"}
+        elif method == "users.list":
+            response_data["members"] = [{"id": f"USTAFF{i}", "real_name": f"Staff {i}"} for i in range(5)]
+        elif method == "chat.postMessage":
+            response_data["ts"] = f"{int(time.time())}.{next(self._ts_counter):06d}"
+        elif method == "conversations.history":
+            response_data["messages"] = []
+
+        return response_data
+
+class FakeSNSClient:
+    """
+    Stands in for the boto3 SNS client, remembering what was published
+    """
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency_ms = latency_ms
+        self.published = []
+        self._lock = threading.Lock()
+
+    def publish(self, **kwargs) -> dict:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+        with self._lock:
+            self.published.append(kwargs)
+
+        return {"MessageId": str(len(self.published))}
+
+class LatencyRecorder:
+    """
+    Collects handler latencies per event type
+    """
+
+    def __init__(self):
+        self.latencies = {} # event type -> [seconds]
+        self.errors = {} # event type -> count
+        self._lock = threading.Lock()
+
+    def record(self, event_type: str, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            self.latencies.setdefault(event_type, []).append(seconds)
+            if error:
+                self.errors[event_type] = self.errors.get(event_type, 0) + 1
+
+    def report(self, wall_seconds: float) -> str:
+        """
+        Summarizes everything recorded
+
+        Args:
+            wall_seconds (float): how long the whole replay took
+
+        Returns:
+            str: a printable table
+        """
+        total = sum(len(latencies) for latencies in self.latencies.values())
+        lines = [f"{total} events in {wall_seconds:.2f}s = {total / wall_seconds:.1f} events/s", "",
+                 f"{'event type':<18} {'count':>6} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"]
+
+        for event_type, latencies in sorted(self.latencies.items()):
+            lines.append(f"{event_type:<18} {len(latencies):>6} {self.errors.get(event_type, 0):>6} "
+                         f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 95) * 1000:>8.1f} "
+                         f"{percentile(latencies, 99) * 1000:>8.1f}")
+
+        return "\n".join(lines)
+
+def percentile(values: list, pct: float) -> float:
+    """
+    Gets a nearest-rank percentile
+
+    Args:
+        values (list): the samples
+        pct (float): the percentile, 0 to 100
+
+    Returns:
+        float: the percentile value, 0 if there are no samples
+    """
+    if not values:
+        return 0
+
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+
+    return ordered[min(rank, len(ordered)) - 1]
+
+def event_type_of(event: dict) -> str:
+    """
+    Gets the type of a Lambda event, unwrapping event_callback
+    """
+    body = event.get("body", {})
+    if isinstance(body, str):
+        body = json.loads(body)
+    if body.get("type") == "event_callback":
+        return body.get("event", {}).get("type", "event_callback")
+
+    return body.get("type", "unknown")
+
+class Replayer:
+    """
+    Drives lambda_handler and times every call
+    """
+
+    def __init__(self, lambda_function, recorder: LatencyRecorder):
+        self.lambda_function = lambda_function
+        self.recorder = recorder
+        self._event_ids = itertools.count(1)
+
+    def invoke(self, event: dict) -> dict:
+        """
+        Calls lambda_handler once, recording its latency
+
+        Args:
+            event (dict): the Lambda event
+
+        Returns:
+            dict: the handler's response, or {} if it raised
+        """
+        event_type = event_type_of(event)
+        start = time.perf_counter()
+        try:
+            response = self.lambda_function.lambda_handler(event, None)
+            self.recorder.record(event_type, time.perf_counter() - start)
+            return response
+        except Exception as e: # keep replaying, but count it
+            self.recorder.record(event_type, time.perf_counter() - start, error=True)
+            print(f"{event_type} failed: {e!r}", file=sys.stderr)
+            return {}
+
+    def slack_event(self, event: dict) -> dict:
+        """
+        Wraps an event the way the Events API delivers it
+        """
+        return {"body": json.dumps({
+            "type": "event_callback",
+            "event_id": f"EvReplay{next(self._event_ids)}",
+            "event": event
+        })}
+
+    def run_scenario(self, index: int, channel_id: str, rng: random.Random) -> None:
+        """
+        Plays out one help request: a kiosk posts, staff reply a few times,
+        then it's resolved by reaction or reply, or it times out
+
+        Args:
+            index (int): the scenario number, used as the device ID
+            channel_id (str): the channel to post in
+            rng (random.Random): for choosing how the request plays out
+        """
+        device_id = f"replay-device-{index}"
+        response = self.invoke({"body": {
+            "type": "post",
+            "message": f"Guest needs assistance at replay location {index}",
+            "channel_id": channel_id,
+            "device_id": device_id
+        }})
+
+        ts = response.get("posted_message_id")
+        if not ts or ts == "N/A":
+            return # rate limited or failed
+
+        staff = f"USTAFF{rng.randrange(5)}"
+        for reply in range(rng.randint(0, 3)):
+            self.invoke(self.slack_event({
+                "type": "message", "channel": channel_id, "user": staff,
+                "text": f"On my way ({reply})", "ts": f"{ts}{reply}", "thread_ts": ts
+            }))
+            if reply == 0:
+                self.invoke({"body": {"type": "message_replied", "message_id": ts, "channel_id": channel_id}})
+
+        outcome = rng.random()
+        if outcome < 0.5:
+            self.invoke(self.slack_event({
+                "type": "reaction_added", "user": staff, "reaction": "white_check_mark",
+                "item": {"type": "message", "channel": channel_id, "ts": ts}
+            }))
+        elif outcome < 0.8:
+            self.invoke(self.slack_event({
+                "type": "message", "channel": channel_id, "user": staff,
+                "text": "All set :+1:", "ts": f"{ts}9", "thread_ts": ts
+            }))
+        else:
+            self.invoke({"body": {"type": "message_timeout", "message_id": ts, "channel_id": channel_id}})
+
+def paced(count: int, rate: float):
+    """
+    Yields 0..count-1, spaced out to at most `rate` per second (0 for no limit)
+    """
+    start = time.perf_counter()
+    for index in range(count):
+        if rate > 0:
+            delay = start + index / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        yield index
+
+def load_events(path: str) -> list:
+    """
+    Loads recorded Lambda events from a JSON-lines file, a JSON list, or a
+    directory of fixtures like aws_json/
+
+    Args:
+        path (str): where the events are
+
+    Returns:
+        list: the events
+    """
+    if os.path.isdir(path):
+        events = []
+        for name in sorted(os.listdir(path)):
+            with open(os.path.join(path, name), "r", encoding="utf8") as file:
+                events.append(json.load(file))
+        return events
+
+    with open(path, "r", encoding="utf8") as file:
+        contents = file.read().strip()
+
+    if contents.startswith("["):
+        return json.loads(contents)
+
+    return [json.loads(line) for line in contents.splitlines() if line.strip()]
+
+def write_offline_config(directory: str, args: argparse.Namespace, slack_url: str) -> None:
+    """
+    Writes throwaway config files that point the Lambda function at our fakes
+    """
+    os.makedirs(os.path.join(directory, "config"), exist_ok=True)
+
+    slack_config = {
+        "bot_oauth_token": "xoxb-replay",
+        "button_config": {"device_id": "replay"},
+        "slack_api_url": slack_url
+    }
+    aws_config = {
+        "aws_access_key": "replay", "aws_secret": "replay", "region": "us-east-2",
+        "sns_arn": "arn:aws:sns:us-east-2:000000000000:replay",
+        "state_store": {"backend": args.state_store},
+        "logging": {"level": args.log_level, "payload_sample_rate": 0},
+        "metrics": {"enabled": False}, # per-invocation records mean little with concurrent invocations
+        "fast_ack": {"enabled": args.fast_ack, "stage": "local"}
+    }
+
+    with open(os.path.join(directory, "config", "slack.json"), "w", encoding="utf8") as file:
+        json.dump(slack_config, file)
+    with open(os.path.join(directory, "config", "aws.json"), "w", encoding="utf8") as file:
+        json.dump(aws_config, file)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays events through lambda_handler offline.")
+    parser.add_argument("--events", help="recorded events (JSON lines, JSON list, or a fixture directory)")
+    parser.add_argument("--scenarios", type=int, default=100, help="synthesized help requests to play out")
+    parser.add_argument("--rate", type=float, default=0, help="scenarios/events started per second, 0 for no limit")
+    parser.add_argument("--concurrency", type=int, default=4, help="how many run at once")
+    parser.add_argument("--channel", default="CREPLAY", help="the channel synthesized posts go to")
+    parser.add_argument("--slack-latency-ms", type=float, default=0, help="added to every fake Slack call")
+    parser.add_argument("--sns-latency-ms", type=float, default=0, help="added to every fake SNS publish")
+    parser.add_argument("--state-store", default="memory", choices=("memory", "sqlite"))
+    parser.add_argument("--fast-ack", action="store_true", help="ack Slack events first, process on a local queue")
+    parser.add_argument("--log-level", default="WARNING", help="the Lambda function's log level")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.events:
+        args.events = os.path.abspath(args.events) # we're about to chdir
+
+    slack = FakeSlackServer(args.slack_latency_ms)
+    slack.start()
+
+    # import lambda_function from a scratch directory holding our offline config,
+    # so nothing here can reach the real workspace
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, repo_dir)
+    scratch = tempfile.mkdtemp(prefix="slack-lambda-replay-")
+    write_offline_config(scratch, args, slack.url)
+    os.chdir(scratch)
+
+    lambda_function = importlib.import_module("lambda_function")
+    sns = FakeSNSClient(args.sns_latency_ms)
+    lambda_function.SNS_CLIENT = sns
+
+    recorder = LatencyRecorder()
+    replayer = Replayer(lambda_function, recorder)
+    rng = random.Random(args.seed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        if args.events:
+            events = load_events(args.events)
+            futures = [executor.submit(replayer.invoke, events[index])
+                       for index in paced(len(events), args.rate)]
+        else:
+            futures = [executor.submit(replayer.run_scenario, index, args.channel,
+                                       random.Random(rng.random()))
+                       for index in paced(args.scenarios, args.rate)]
+
+        for future in futures:
+            future.result()
+    wall_seconds = time.perf_counter() - start
+
+    print(recorder.report(wall_seconds))
+
+    stage = lambda_function.DEFERRED_STAGE
+    if stage is not None and hasattr(stage, "join"):
+        stage.join()
+        processing = stage.processing_latencies
+        print(f"\ndeferred processing: {len(processing)} events, p50 {percentile(processing, 50) * 1000:.1f} ms, "
+              f"p95 {percentile(processing, 95) * 1000:.1f} ms, p99 {percentile(processing, 99) * 1000:.1f} ms")
+
+    print(f"\nfake Slack calls: {dict(sorted(slack.calls.items()))}")
+    print(f"SNS publishes: {len(sns.published)}")
+
+    slack.stop()
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,8 @@ Nikki Hess (nkhess@umich.edu)
 import os
 import json
 import time
+import threading
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import List, TextIO#, Tuple
 import traceback
@@ -20,12 +22,23 @@ from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+import google_auth_httplib2
+import httplib2
 
 # The only scope we need is drive.file so we can create files and interact with those files
 SCOPES = ["https://www.googleapis.com/auth/drive.file"]
 CACHE = {}
 CACHE_COOLDOWN = 1500
 
+# the process-wide service registry, see get_service
+CREDENTIALS = None
+SERVICES = {} # (name, version) -> service
+SPREADSHEET_IDS = {} # config name -> spreadsheet id
+REFRESH_MARGIN = 5 * 60 # refresh credentials this many seconds before they expire
+REGISTRY_LOCK = threading.Lock()
+THREAD_HTTP = threading.local() # httplib2 isn't thread-safe, so one connection per thread
+
 config_defaults = {}
 try:
 	with open("config/credentials.json", "r", encoding="utf8") as file:
@@ -127,11 +140,102 @@ def do_oauth_flow() -> Credentials:
 			)
 			creds = flow.run_local_server(port=0)
 		# Save the credentials for the next run
-		with open("config/token.json", "w", encoding="utf8") as token:
-			token.write(creds.to_json())
+		save_credentials(creds)
 
 	return creds
 
+def save_credentials(creds: Credentials) -> None:
+	"""
+	Writes credentials to config/token.json for the next run
+
+	Args:
+		creds (Credentials): OAuth2 user credentials
+	"""
+
+	with open("config/token.json", "w", encoding="utf8") as token:
+		token.write(creds.to_json())
+
+def get_credentials() -> Credentials:
+	"""
+	Gets the process-wide credentials, logging in on first use and then
+	keeping them fresh in the background
+
+	Returns:
+		creds (Credentials): OAuth2 user credentials
+	"""
+
+	global CREDENTIALS
+
+	with REGISTRY_LOCK:
+		if CREDENTIALS is None:
+			CREDENTIALS = do_oauth_flow()
+
+			thread = threading.Thread(target=refresh_credentials, daemon=True, name="google-credential-refresh")
+			thread.start()
+
+	return CREDENTIALS
+
+def refresh_credentials() -> None:
+	"""
+	Refreshes the credentials REFRESH_MARGIN seconds before they expire, forever,
+	so no request ever has to stop and refresh them
+	"""
+
+	while True:
+		expiry = CREDENTIALS.expiry # naive UTC, None if it never expires
+		if expiry is None:
+			return
+
+		now = datetime.now(timezone.utc).replace(tzinfo=None)
+		time.sleep(max((expiry - now).total_seconds() - REFRESH_MARGIN, 30))
+
+		try:
+			CREDENTIALS.refresh(Request())
+			save_credentials(CREDENTIALS)
+			print(f"Google credentials refreshed, good until {CREDENTIALS.expiry}")
+		except RefreshError as e: # revoked, logging in again needs a person
+			print(f"Unable to refresh Google credentials, restart to log in again: {e}")
+			return
+		except Exception as e: # network trouble, try again shortly
+			print(f"Unable to refresh Google credentials, retrying: {e}")
+
+def build_request(http, *args, **kwargs) -> HttpRequest:
+	"""
+	Builds each request on the calling thread's own connection, so one
+	service can be shared between threads
+	"""
+
+	thread_http = getattr(THREAD_HTTP, "http", None)
+	if thread_http is None:
+		thread_http = google_auth_httplib2.AuthorizedHttp(get_credentials(), http=httplib2.Http(timeout=10))
+		THREAD_HTTP.http = thread_http
+
+	return HttpRequest(thread_http, *args, **kwargs)
+
+def get_service(name: str, version: str):
+	"""
+	Gets a Google API service from the registry, building it on first use
+	from the discovery document bundled with the client library
+
+	Args:
+		name (str): the API, e.g. "sheets"
+		version (str): the API version, e.g. "v4"
+
+	Returns:
+		the service
+	"""
+
+	creds = get_credentials()
+
+	with REGISTRY_LOCK:
+		service = SERVICES.get((name, version))
+		if service is None:
+			service = build(name, version, credentials=creds, static_discovery=True,
+							requestBuilder=build_request)
+			SERVICES[(name, version)] = service
+
+	return service
+
 def create_spreadsheet(sheets_service, name: str = "Test") -> dict:
 	"""
 	Create a new spreadsheet by name, returns the created spreadsheet
@@ -331,6 +435,38 @@ def add_row(sheets_service, spreadsheet_id: str, cells: List[str]):
 	print(f"{result.get('updatedCells')} cells added in row {next_row}: {cells}")
 	return result
 
+def add_rows(sheets_service, spreadsheet_id: str, rows: List[List[str]]):
+	"""
+	Appends several rows after the last row of the spreadsheet in one request
+
+	Args:
+		sheets_service: the Google Sheets service to be used
+		spreadsheet_id (str): the id of the spreadsheet we're operating on
+		rows (list): a list of rows, each a list of cell contents
+
+	Returns:
+		result: the result of the execution
+	"""
+
+	result = (
+		sheets_service.spreadsheets()
+		.values()
+		.append(
+			spreadsheetId=spreadsheet_id,
+			range="A:A",
+			valueInputOption="USER_ENTERED",
+			insertDataOption="INSERT_ROWS",
+			body={"values": rows}
+		)
+		.execute()
+	)
+
+	# the cached first empty row is behind now
+	CACHE.get("spreadsheets", {}).get(spreadsheet_id, {}).pop("first_empty_row", None)
+
+	print(f"{len(rows)} rows appended: {rows}")
+	return result
+
 def get_region(sheets_service, spreadsheet_id: str, first_row: int = 1, last_row: int = 1,
 			   first_letter: str = "A", last_letter: str = "A") -> List[str]:
 	"""
@@ -397,9 +533,6 @@ def setup_sheets(config_name: str):
 		spreadsheet_id: the spreadsheet's id, for convenience
 	"""
 
-	# Log in using OAuth
-	creds = do_oauth_flow()
-
 	config_file = open_config(config_name)
 
 	sheets_service = None
@@ -408,8 +541,8 @@ def setup_sheets(config_name: str):
 	spreadsheet_id = None
 
 	try:
-		sheets_service = build("sheets", "v4", credentials=creds)
-		drive_service = build("drive", "v3", credentials=creds)
+		sheets_service = get_service("sheets", "v4")
+		drive_service = get_service("drive", "v3")
 
 		# If we've already saved this spreadsheet by name, let's grab it
 		config_data = json.load(config_file)
@@ -436,6 +569,26 @@ def setup_sheets(config_name: str):
 
 	return config_file, sheets_service, drive_service, spreadsheet, spreadsheet_id
 
+def get_sheets(config_name: str):
+	"""
+	Gets a ready Sheets service and spreadsheet id for a config. Only the
+	first call per config checks the spreadsheet, later ones are free
+
+	Args:
+		config_name (str): the name of the config file to open
+
+	Returns:
+		sheets_service: the shared Google Sheets service
+		spreadsheet_id: the spreadsheet's id
+	"""
+
+	spreadsheet_id = SPREADSHEET_IDS.get(config_name)
+	if spreadsheet_id is None:
+		_, _, _, _, spreadsheet_id = setup_sheets(config_name)
+		SPREADSHEET_IDS[config_name] = spreadsheet_id
+
+	return get_service("sheets", "v4"), spreadsheet_id
+
 if __name__ == "__main__":
 	_, sheets_service, drive_service, _, spreadsheet_id = setup_sheets("test")
 	get_spreadsheet(sheets_service, drive_service, spreadsheet_id)
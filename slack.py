@@ -10,19 +10,18 @@ Nikki Hess (nkhess@umich.edu)
 import json
 import sys
 import time
+import uuid
 
 from typing import List
 
-from datetime import datetime
-from subprocess import DEVNULL, STDOUT, check_call
-import requests
-from requests.exceptions import RequestException
-import boto3
-
 import sheets
 import aws
+import transport
+import outbox
+import device_config
+import clock
+import press_limiter
 
-lambda_client, sqs_client = aws.setup_aws()
 is_raspberry_pi = not sys.platform.startswith("win32")
 
 config_defaults = {"bot_oauth_token": "", "button_config": {"device_id": ""}}
@@ -47,117 +46,217 @@ except (FileNotFoundError, json.JSONDecodeError):
 BUTTON_CONFIG = slack_config["button_config"]
 BOT_OAUTH_TOKEN = slack_config["bot_oauth_token"]
 
-# Dictionary to store the timestamp of the last message sent for each button
-LAST_MESSAGE_TIMESTAMP = {}
+# each button's last post, checked before anything else on a press
+PRESS_LIMITER = None
+
+# presses, status updates and log rows wait here until they've been sent
+OUTBOX = None
+POST_MAX_AGE = 180 # in seconds, a press older than its own timeout isn't worth posting
+STATUS_MAX_AGE = 180
+LOG_MAX_AGE = 7 * 24 * 60 * 60 # log rows are worth keeping for a while
+
+# the time, synced with a time source in the background
+CLOCK = None
 
-def get_config(sheets_service, spreadsheet_id: int, device_id: str) -> List[str]:
+# every device's config, read from Google Sheets once and refreshed in the background
+DEVICE_CONFIGS = None
+
+def get_outbox() -> outbox.Outbox:
     """
-    Gets the configuration for a button from Google Sheets
-    and returns it as a List
+    Gets the outbox, creating it and starting its flusher on first use.
+    Log rows are only sent once the GUI registers a "log" handler
 
-    Args:
-        sheets_service: the Google Sheets service we're working with
-        spreadsheet_id (int): the id of the spreadsheet we're working on
-        device_id (str): the id of this specific device, received from slack.json
+    Returns:
+        outbox.Outbox: the outbox
     """
+    global OUTBOX
+
+    if OUTBOX is None:
+        OUTBOX = outbox.Outbox()
+        OUTBOX.register("post", send_post, max_age=POST_MAX_AGE)
+        OUTBOX.register("status", send_status_update, max_age=STATUS_MAX_AGE)
+        OUTBOX.start()
 
-    last_row = sheets.find_first_empty_row(sheets_service, spreadsheet_id)
+    return OUTBOX
 
-    device_id_list = sheets.get_region(sheets_service, spreadsheet_id,
-                                        first_row = 2, last_row = last_row,
-                                        first_letter = "B", last_letter = "B")
+def send_post(payload: dict) -> tuple:
+    """
+    Sends a queued press through AWS, run by the outbox flusher
+
+    Args:
+        payload (dict): the queued "post" request
 
-    device_id_list = [id[0].strip() if id != [] else "" for id in device_id_list]
+    Returns:
+        tuple: the posted message ID and channel ID
+    """
+    # the post ID makes retries safe, a post that already went through is returned, not repeated
     try:
-        # add 2 because skip first row + Google Sheets is 1 indexed
-        device_index = device_id_list.index(device_id) + 2
-    except ValueError:
+        message_id, channel_id = aws.post_to_slack(aws.get_client("lambda"), payload["message"],
+                                                   payload["channel_id"], payload["device_id"], True,
+                                                   payload.get("post_id"))
+    except transport.PostRejected as e: # rate limited, or it may be on Slack already
+        raise outbox.Discard(e.reason) from e
+
+    if message_id is None:
+        raise RuntimeError("The backend didn't post the message")
+
+    return message_id, channel_id
+
+def send_status_update(payload: dict) -> None:
+    """
+    Sends a queued status update through AWS, run by the outbox flusher
+
+    Args:
+        payload (dict): the queued "status" request
+    """
+    mark = aws.mark_message_replied if payload["status"] == "replied" else aws.mark_message_timed_out
+
+    # waiting here means a failed update stays in the outbox for another try
+    mark(aws.get_client("lambda"), payload["message_id"], payload["channel_id"], True).result()
+
+def queue_status_update(message_id: str, channel_id: str, status: str, callback=None) -> int:
+    """
+    Queues a status update for a message, returning right away
+
+    Args:
+        message_id (str): the message id to edit
+        channel_id (str): the Slack channel the message is in
+        status (str): "replied" or "timed_out"
+        callback: called as callback(result, error) once it's sent or dropped
+
+    Returns:
+        int: the outbox ID
+    """
+    payload = {"message_id": message_id, "channel_id": channel_id, "status": status}
+
+    return get_outbox().enqueue("status", payload, BUTTON_CONFIG["device_id"], callback)
+
+def queue_log_row(cells: List[str]) -> int:
+    """
+    Queues a row for the logging spreadsheet, returning right away
+
+    Args:
+        cells (list): the row's cell contents
+
+    Returns:
+        int: the outbox ID
+    """
+    return get_outbox().enqueue("log", {"cells": cells}, "log")
+
+def get_device_configs() -> device_config.DeviceConfigTable:
+    """
+    Gets the device config table, loading it and starting its background
+    refresh on first use. Only this first load waits on Google Sheets
+
+    Returns:
+        device_config.DeviceConfigTable: every device's config
+    """
+    global DEVICE_CONFIGS
+
+    if DEVICE_CONFIGS is None:
+        sheets_service, spreadsheet_id = sheets.get_sheets("google_config")
+
+        table = device_config.DeviceConfigTable(sheets_service, spreadsheet_id)
+        table.load()
+        table.start_refresh()
+
+        DEVICE_CONFIGS = table
+
+    return DEVICE_CONFIGS
+
+def get_press_limiter() -> press_limiter.PressLimiter:
+    """
+    Gets the press limiter, loading its saved state on first use
+
+    Returns:
+        press_limiter.PressLimiter: the press limiter
+    """
+    global PRESS_LIMITER
+
+    if PRESS_LIMITER is None:
+        PRESS_LIMITER = press_limiter.PressLimiter()
+
+    return PRESS_LIMITER
+
+def get_config(device_id: str) -> device_config.DeviceConfig:
+    """
+    Gets the configuration for a button from the device config table,
+    without touching the network once the table is loaded
+
+    Args:
+        device_id (str): the id of this specific device, received from slack.json
+
+    Returns:
+        device_config.DeviceConfig: the device's config
+    """
+    config = get_device_configs().get(device_id)
+
+    if config is None:
         print(f"Unable to get device config. Device {device_id} was not listed. Exiting.")
         sys.exit()
 
-    try:
-        device_info = sheets.get_region(sheets_service, spreadsheet_id,
-                                        first_row = device_index, last_row = device_index,
-                                        first_letter = "A", last_letter = "I")[0]
-    except IndexError:
-        print("Index out of range when selecting device config. Did you forget to set the device ID (slack.json)?")
-        sys.exit()
+    return config
 
-    return device_info
+def get_clock() -> clock.Clock:
+    """
+    Gets the clock, starting its background sync on first use
 
-def get_datetime(update_system_time: bool = False) -> str | None:
+    Returns:
+        clock.Clock: the clock
     """
-    Gets the current datetime as a beautifully formatted string
+    global CLOCK
 
-    Args:
-        update_system_time (bool): whether to update the system time (Linux only)
+    if CLOCK is None:
+        CLOCK = clock.Clock(slack_config.get("time_source", clock.TIME_SOURCE))
+        CLOCK.start()
+
+    return CLOCK
+
+def get_datetime() -> str:
+    """
+    Gets the current datetime as a beautifully formatted string.
+    The clock syncs in the background, so this never waits on the network
 
     Returns:
-        formatted_time (str | None): the formatted time string, if present
+        formatted_time (str): the formatted time string
     """
 
-    formatted_time = None
-    try:
-        response = requests.get(
-            "http://worldtimeapi.org/api/timezone/America/Detroit",
-            timeout=3
-        )
-        response.raise_for_status() # prevent uncatchable errors
-        response_data = response.json()
-        iso_datetime = response_data["datetime"]
-        current_time = datetime.fromisoformat(iso_datetime)
-        formatted_time = current_time.strftime("%B %d, %Y %I:%M:%S %p")
-
-        # May be useful for keeping system time up-to-date throughout runtime
-        if update_system_time and is_raspberry_pi:
-            date_command = f"sudo date -s {iso_datetime}"
-            date_command = date_command.split()
-            check_call(date_command, stdout=DEVNULL, stderr=STDOUT)
-    except (requests.exceptions.Timeout, json.decoder.JSONDecodeError, RequestException):
-        # Fall back on system time, though potentially iffy
-        now = datetime.now()
-        formatted_time = now.strftime("%B %d, %Y %I:%M:%S %p")
-
-    return formatted_time
-
-def handle_interaction(aws_client: boto3.client, do_post: bool = True, press_length: float = 0) -> str | None:
-    """
-    Handles a button press or screen tap, basically just does the main functionality
+    return get_clock().format()
+
+def handle_interaction(do_post: bool = True, press_length: float = 0, on_posted=None) -> int | dict | None:
+    """
+    Handles a button press or screen tap, basically just does the main functionality.
+    The post itself goes through the outbox, so this returns without waiting on it
 
     Args:
-        aws_client (boto3.client): the AWS client we're using
         do_post (bool): whether to post to the Slack or just log in console, for debug
         press_length (float): how long was the button pressed?
+        on_posted: called as on_posted((message_id, channel_id), error) from the outbox
+            flusher once the message is posted, or with (None, "expired") if it never was
 
     Returns:
-        the posted message id, if there is one OR None
+        the outbox ID of the queued post, a 429 response if rate limited, OR None
     """
 
-    press_type = "LONG" if press_length > 2 else "SINGLE"
-
-    # set up Google Sheets and grab the config
-    _, sheets_service, _, _, spreadsheet_id = sheets.setup_sheets("google_config")
     device_id = BUTTON_CONFIG["device_id"]
 
-    device_config = get_config(sheets_service, spreadsheet_id, device_id)
+    # check for rate limit first, so a spammed screen costs nothing
+    if get_press_limiter().is_limited(device_id):
+        print("Rate limit applied. Message not sent.")
+        return {"statusCode": 429, "body": "Rate limit applied."}
 
-    # device_mac = device_config[2]
-    device_location = device_config[3]
-    # device_function = device_config[5]
-    device_message = device_config[4]
-    device_rate_limit = int(device_config[7])
-    device_channel_id = device_config[8]
+    press_type = "LONG" if press_length > 2 else "SINGLE"
 
-    # get the time but nice looking
-    fancy_time = get_datetime(True)
+    # grab the config, from memory
+    config = get_config(device_id)
 
-    # handle timestamp, check for rate limit
-    last_timestamp = LAST_MESSAGE_TIMESTAMP.get(device_id, 0)
-    current_timestamp = time.time()
+    device_location = config.location
+    device_message = config.message
+    device_rate_limit = config.rate_limit
+    device_channel_id = config.channel_id
 
-    if current_timestamp - last_timestamp < device_rate_limit:
-        print("Rate limit applied. Message not sent.")
-        return {"statusCode": 429, "body": "Rate limit applied."}
+    # get the time but nice looking
+    fancy_time = get_datetime()
 
     # handle empty message/location
     if device_message is None or device_message == "":
@@ -180,18 +279,22 @@ def handle_interaction(aws_client: boto3.client, do_post: bool = True, press_len
 
     print(f"\nINFO\n--------\nRetrieved message: {final_message}")
 
-    # if we post to Slack, we need to go through AWS and return a message/channel id
+    # if we post to Slack, we need to go through AWS, the message/channel id arrive later
     if do_post:
-        message_id, channel_id = aws.post_to_slack(aws_client, final_message, device_channel_id, device_id, True)
+        payload = {"message": final_message, "channel_id": device_channel_id, "device_id": device_id,
+                   "post_id": uuid.uuid4().hex}
+        request_id = get_outbox().enqueue("post", payload, device_id, on_posted)
 
-        LAST_MESSAGE_TIMESTAMP[device_id] = current_timestamp
+        get_press_limiter().record(device_id, device_rate_limit)
 
-        return message_id, channel_id
+        return request_id
     # else not needed here cuz return
     print(f"\nMESSAGE\n--------\n{final_message}")
 
-    return None, None
+    return None
 
 if __name__ == "__main__":
     # testing
-    handle_interaction(lambda_client, do_post = True, press_length = 1)
+    handle_interaction(do_post = True, press_length = 1,
+                       on_posted = lambda result, error: print("Posted:", result, error))
+    time.sleep(30) # give the outbox a chance to send it
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+
+"""
+A small Slack Web API client that keeps its connections alive between calls.
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import structured_log
+
+SLACK_API_URL = "https://slack.com/api/"
+
+USER_CACHE_SIZE = 512
+USER_CACHE_TTL = 6 * 60 * 60 # in seconds, names rarely change
+
+# write methods that are safe to repeat after a 5xx, which may or may not have
+# taken effect. GETs always are; chat.postMessage is not (it could post twice)
+IDEMPOTENT_WRITES = ("chat.update",)
+
+class SlackApiError(RuntimeError):
+    """
+    Raised when Slack answers with {"ok": false}. Subclasses RuntimeError
+    since that's what callers have always caught.
+    """
+
+    def __init__(self, method: str, error: str, response_data: dict):
+        super().__init__(f"Slack method {method} failed: {error}")
+        self.method = method
+        self.error = error
+        self.response_data = response_data
+
+class SlackServerError(RuntimeError):
+    """
+    Raised when Slack answers with a 5xx that wasn't retried. Unlike
+    SlackApiError, the call may or may not have taken effect.
+    """
+
+    def __init__(self, method: str, status_code: int):
+        super().__init__(f"Slack method {method} failed with HTTP {status_code}")
+        self.method = method
+        self.status_code = status_code
+
+class SlackClient:
+    """
+    Wraps a pooled requests.Session for the Slack Web API. Build one per
+    process/container and reuse it, so warm calls skip the TLS handshake.
+    """
+
+    def __init__(self, token: str, timeout: float = 10, max_retries: int = 3,
+                 max_backoff: float = 1, max_retry_time: float = 2, pool_size: int = 10,
+                 base_url: str = SLACK_API_URL, log: structured_log.StructuredLogger = None):
+        """
+        Args:
+            token (str): the bot OAuth token
+            timeout (float): the per-request timeout, in seconds
+            max_retries (int): how many times to retry rate limited/5xx calls
+            max_backoff (float): the longest we'll sleep between server error retries, in seconds
+            max_retry_time (float): the longest a call may spend retrying in total,
+                in seconds. Keep it well under the Lambda timeout and Slack's 3 s retry
+            pool_size (int): how many keep-alive connections to hold onto
+            base_url (str): the API root, overridable for a local fake Slack
+            log (structured_log.StructuredLogger): where retries are logged, defaults to stdout
+        """
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.max_retry_time = max_retry_time
+        self.base_url = base_url if base_url.endswith("/") else base_url + "/"
+        self.log = log or structured_log.StructuredLogger()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._stats = {} # method -> latency counters
+        self._stats_lock = threading.Lock()
+
+        # optionally called as observer(method, elapsed_ms, error, retried, rate_limited)
+        # after every round trip, e.g. to feed per-invocation metrics
+        self.observer = None
+
+        self.set_token(token)
+
+    def set_token(self, token: str) -> None:
+        """
+        Switches the token used for every call
+
+        Args:
+            token (str): the bot OAuth token
+        """
+        self.token = token
+        self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def get(self, method: str, **params) -> dict:
+        """
+        Calls a read-style Slack method with query parameters
+
+        Args:
+            method (str): the Slack method, e.g. "users.info"
+            **params: the query parameters
+
+        Returns:
+            dict: the response data, guaranteed to have ok == True
+        """
+        return self.call(method, "GET", params=params)
+
+    def post(self, method: str, **payload) -> dict:
+        """
+        Calls a write-style Slack method with a JSON body
+
+        Args:
+            method (str): the Slack method, e.g. "chat.postMessage"
+            **payload: the JSON body
+
+        Returns:
+            dict: the response data, guaranteed to have ok == True
+        """
+        return self.call(method, "POST", payload=payload)
+
+    def call(self, method: str, http_method: str = "GET", params: dict = None,
+             payload: dict = None) -> dict:
+        """
+        Calls a Slack method, retrying rate limits (honoring Retry-After) and,
+        for idempotent methods only, server errors, within max_retry_time.
+        Then unwraps the ok/error envelope
+
+        Args:
+            method (str): the Slack method, e.g. "chat.update"
+            http_method (str): GET or POST
+            params (dict): query parameters
+            payload (dict): JSON body
+
+        Returns:
+            dict: the response data, guaranteed to have ok == True
+        """
+        url = self.base_url + method
+        headers = {"Content-Type": "application/json; charset=utf-8"} if payload is not None else None
+        idempotent = http_method == "GET" or method in IDEMPOTENT_WRITES
+        deadline = time.monotonic() + self.max_retry_time
+
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = self.session.request(http_method, url, params=params, json=payload,
+                                                headers=headers, timeout=self.timeout)
+            except requests.exceptions.RequestException:
+                self._record(method, time.perf_counter() - start, error=True)
+                raise
+            elapsed = time.perf_counter() - start
+
+            # a 429 was never processed, so it's always safe to send again
+            rate_limited = response.status_code == 429
+            retryable = rate_limited or (response.status_code >= 500 and idempotent)
+            delay = self._backoff(response, attempt) if retryable else 0
+            if retryable and attempt < self.max_retries and time.monotonic() + delay < deadline:
+                self._record(method, elapsed, retried=True, rate_limited=rate_limited)
+                self.log.warning("Slack call retrying", method=method, status=response.status_code,
+                                 delay=round(delay, 2), attempt=attempt + 1)
+
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            if response.status_code >= 500:
+                self._record(method, elapsed, error=True)
+                raise SlackServerError(method, response.status_code)
+
+            if rate_limited: # out of retries, or Slack wants us to wait longer than we can
+                self._record(method, elapsed, error=True, rate_limited=True)
+                raise SlackApiError(method, "ratelimited", {"retry_after": response.headers.get("Retry-After")})
+
+            response_data = response.json()
+            ok = response_data.get("ok", False)
+            self._record(method, elapsed, error=not ok)
+
+            if not ok:
+                raise SlackApiError(method, response_data.get("error", "unknown_error"), response_data)
+
+            return response_data
+
+    def stats(self) -> dict:
+        """
+        Gets per-method latency counters
+
+        Returns:
+            dict: method -> {"calls", "errors", "retries", "rate_limited",
+                "total_ms", "max_ms", "avg_ms"}
+        """
+        with self._stats_lock:
+            stats = {method: dict(counters) for method, counters in self._stats.items()}
+
+        for counters in stats.values():
+            counters["avg_ms"] = counters["total_ms"] / counters["calls"] if counters["calls"] else 0
+
+        return stats
+
+    def reset_stats(self) -> None:
+        """
+        Clears the latency counters
+        """
+        with self._stats_lock:
+            self._stats.clear()
+
+    def _backoff(self, response: requests.Response, attempt: int) -> float:
+        """
+        Works out how long to wait before retrying. A 429's Retry-After is
+        honored as is (call gives up if it's too long to wait); anything else
+        backs off exponentially from 0.25 s
+
+        Args:
+            response (requests.Response): the failed response
+            attempt (int): how many retries we've already done
+
+        Returns:
+            float: the delay in seconds
+        """
+        if response.status_code == 429:
+            try:
+                return max(float(response.headers["Retry-After"]), 0)
+            except (KeyError, ValueError):
+                pass
+
+        return min(0.25 * 2 ** attempt, self.max_backoff)
+
+    def _record(self, method: str, elapsed: float, error: bool = False,
+                retried: bool = False, rate_limited: bool = False) -> None:
+        """
+        Adds one HTTP round trip to a method's counters
+        """
+        elapsed_ms = elapsed * 1000
+
+        with self._stats_lock:
+            counters = self._stats.setdefault(method, {
+                "calls": 0, "errors": 0, "retries": 0, "rate_limited": 0,
+                "total_ms": 0.0, "max_ms": 0.0
+            })
+            counters["calls"] += 1
+            counters["errors"] += error
+            counters["retries"] += retried
+            counters["rate_limited"] += rate_limited
+            counters["total_ms"] += elapsed_ms
+            counters["max_ms"] = max(counters["max_ms"], elapsed_ms)
+
+        if self.observer is not None:
+            self.observer(method, elapsed_ms, error, retried, rate_limited)
+
+class UserDirectory:
+    """
+    A bounded cache of user ID -> first name with TTL and LRU eviction.
+
+    Fresh names are served straight from memory. Expired names are still served
+    immediately while a background refresh fetches the new one, so a slow Slack
+    never holds up a reply; only a user we've never seen costs a users.info call.
+    """
+
+    def __init__(self, client: SlackClient, max_size: int = USER_CACHE_SIZE,
+                 ttl: float = USER_CACHE_TTL, log: structured_log.StructuredLogger = None):
+        """
+        Args:
+            client (SlackClient): the client to look users up with
+            max_size (int): the most users to remember before evicting the oldest
+            ttl (float): how long a name is fresh for, in seconds
+            log (structured_log.StructuredLogger): where lookup failures are logged,
+                defaults to stdout
+        """
+        self.client = client
+        self.log = log or structured_log.StructuredLogger()
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._names = OrderedDict() # user id -> (first name, expiry), oldest first
+        self._refreshing = {} # user id -> Event set once its background fetch is done
+        self._lock = threading.Lock()
+
+    def first_name(self, user_id: str, timeout: float = None) -> str:
+        """
+        Gets a user's first name, falling back on a stale name or "Unknown"
+        if Slack can't be reached
+
+        Args:
+            user_id (str): the user ID to look up
+            timeout (float): the longest to wait on users.info for a user we've
+                never seen, in seconds, or None to wait as long as it takes.
+                Past it, "Unknown" is returned and the fetch carries on in the
+                background for next time
+
+        Returns:
+            str: the user's first name
+        """
+        with self._lock:
+            cached = self._names.get(user_id)
+            if cached is not None:
+                self._names.move_to_end(user_id)
+
+        if cached is not None:
+            name, expiry = cached
+            if time.monotonic() >= expiry:
+                self._refresh_in_background(user_id)
+
+            return name
+
+        if timeout is not None:
+            if self._refresh_in_background(user_id).wait(timeout):
+                with self._lock:
+                    cached = self._names.get(user_id)
+                if cached is not None:
+                    return cached[0]
+
+            return "Unknown"
+
+        try:
+            return self._fetch(user_id)
+        except (RuntimeError, requests.exceptions.RequestException) as e:
+            self.log.warning("Unable to look up user", user_id=user_id, error=str(e))
+            return "Unknown"
+
+    def warm_up(self, page_size: int = 200, max_pages: int = 10) -> int:
+        """
+        Fills the cache from users.list, following pagination cursors
+
+        Args:
+            page_size (int): how many users to ask for per page
+            max_pages (int): the most pages to fetch
+
+        Returns:
+            int: how many users were cached
+        """
+        cursor = None
+        count = 0
+
+        for _ in range(max_pages):
+            params = {"limit": page_size}
+            if cursor:
+                params["cursor"] = cursor
+
+            response_data = self.client.get("users.list", **params)
+
+            for member in response_data.get("members", []):
+                if member.get("deleted") or member.get("is_bot"):
+                    continue
+
+                self._store(member["id"], _first_name(member))
+                count += 1
+
+            cursor = response_data.get("response_metadata", {}).get("next_cursor")
+            if not cursor:
+                break
+
+        self.log.info("User directory warmed up", users=count)
+
+        return count
+
+    def warm_up_in_background(self) -> threading.Thread:
+        """
+        Runs warm_up on a daemon thread, so no caller waits on users.list.
+        Names asked for before it finishes are looked up one by one as usual
+
+        Returns:
+            threading.Thread: the warm-up thread
+        """
+        def worker():
+            try:
+                self.warm_up()
+            except (RuntimeError, requests.exceptions.RequestException) as e:
+                self.log.warning("Unable to warm up user directory", error=str(e))
+
+        thread = threading.Thread(target=worker, daemon=True, name="user-directory-warm-up")
+        thread.start()
+
+        return thread
+
+    def _fetch(self, user_id: str) -> str:
+        """
+        Looks a user up with users.info and caches the result
+        """
+        user_info = self.client.get("users.info", user=user_id)
+        name = _first_name(user_info["user"])
+        self._store(user_id, name)
+
+        return name
+
+    def _store(self, user_id: str, name: str) -> None:
+        """
+        Caches a name, evicting the least recently used entries past max_size
+        """
+        with self._lock:
+            self._names[user_id] = (name, time.monotonic() + self.ttl)
+            self._names.move_to_end(user_id)
+
+            while len(self._names) > self.max_size:
+                self._names.popitem(last=False)
+
+    def _refresh_in_background(self, user_id: str) -> threading.Event:
+        """
+        Fetches a missing or stale name on a daemon thread, at most once at a time per user
+
+        Returns:
+            threading.Event: set once the fetch is done, whether or not it worked
+        """
+        with self._lock:
+            done = self._refreshing.get(user_id)
+            if done is not None:
+                return done
+
+            done = threading.Event()
+            self._refreshing[user_id] = done
+
+        def worker():
+            try:
+                self._fetch(user_id)
+            except (RuntimeError, requests.exceptions.RequestException) as e:
+                self.log.warning("Unable to refresh user", user_id=user_id, error=str(e))
+            finally:
+                with self._lock:
+                    self._refreshing.pop(user_id, None)
+                done.set()
+
+        threading.Thread(target=worker, daemon=True).start()
+
+        return done
+
+def _first_name(user: dict) -> str:
+    """
+    Gets a first name from a Slack user object, falls back on "Unknown"
+
+    Args:
+        user (dict): the user object from users.info/users.list
+
+    Returns:
+        str: the user's first name
+    """
+    real_name = user.get("real_name") or user.get("profile", {}).get("real_name") or "Unknown"
+
+    return real_name.split()[0] # trim to first name only
@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+
+"""
+Pluggable key-value storage for the Lambda function's message state.
+
+Every backend exposes the same small API (get, put, add, pop, update, delete, scan)
+keyed by string with an optional TTL in seconds, so the Lambda function
+doesn't care whether its state lives in memory, in a local SQLite file,
+or in a DynamoDB table shared by every container.
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import abc
+import contextlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+BACKENDS = ("memory", "sqlite", "dynamodb")
+DEFAULT_SQLITE_PATH = os.path.join(tempfile.gettempdir(), "slack_lambda_state.sqlite3")
+
+# how many times update() retries when another writer beats us to a key
+MAX_UPDATE_ATTEMPTS = 5
+
+class StateStore(abc.ABC):
+    """
+    The base class for state backends. Subclasses only need to implement the
+    abstract primitives; everything else is built on top of them.
+    """
+
+    def get(self, key: str) -> dict | None:
+        """
+        Gets the value stored under a key
+
+        Args:
+            key (str): the key to look up
+
+        Returns:
+            dict | None: the stored value, or None if missing/expired
+        """
+        value, _ = self._get_versioned(key)
+        return value
+
+    @abc.abstractmethod
+    def put(self, key: str, value: dict, ttl: float | None = None) -> None:
+        """
+        Stores a value under a key, overwriting anything already there
+
+        Args:
+            key (str): the key to store under
+            value (dict): the JSON-serializable value to store
+            ttl (float | None): seconds until the value expires, None for never
+        """
+
+    def add(self, key: str, value: dict, ttl: float | None = None) -> bool:
+        """
+        Stores a value only if the key is missing or expired
+
+        Args:
+            key (str): the key to store under
+            value (dict): the JSON-serializable value to store
+            ttl (float | None): seconds until the value expires, None for never
+
+        Returns:
+            bool: whether the value was stored
+        """
+        return self._put_versioned(key, value, ttl, None)
+
+    @abc.abstractmethod
+    def pop(self, key: str) -> dict | None:
+        """
+        Atomically removes a key and returns what was stored there.
+        Only one caller can ever receive a given value.
+
+        Args:
+            key (str): the key to remove
+
+        Returns:
+            dict | None: the removed value, or None if missing/expired
+        """
+
+    def delete(self, key: str) -> None:
+        """
+        Removes a key if it exists
+
+        Args:
+            key (str): the key to remove
+        """
+        self.pop(key)
+
+    @abc.abstractmethod
+    def scan(self, prefix: str):
+        """
+        Iterates over every live key starting with a prefix. This reads the
+        whole keyspace on some backends, so keep it off hot paths
+
+        Args:
+            prefix (str): the key prefix, e.g. "message:"
+
+        Yields:
+            tuple: (key, value) pairs, in no particular order
+        """
+
+    def update(self, key: str, func, ttl: float | None = None) -> dict | None:
+        """
+        Read-modify-writes a key with optimistic concurrency, retrying if
+        another writer changed the value in between
+
+        Args:
+            key (str): the key to update
+            func (Callable[[dict | None], dict | None]): receives the current
+                value (None if missing) and returns the new value, or None
+                to leave the key untouched
+            ttl (float | None): seconds until the new value expires
+
+        Returns:
+            dict | None: the value that was written, or None if func declined
+        """
+        for _ in range(MAX_UPDATE_ATTEMPTS):
+            current, version = self._get_versioned(key)
+            new_value = func(current)
+            if new_value is None:
+                return None
+
+            if self._put_versioned(key, new_value, ttl, version):
+                return new_value
+
+        raise RuntimeError(f"Too much contention updating state key {key}")
+
+    @abc.abstractmethod
+    def _get_versioned(self, key: str) -> tuple:
+        """
+        Gets a value along with its version number
+
+        Returns:
+            tuple: (value, version), or (None, None) if missing/expired
+        """
+
+    @abc.abstractmethod
+    def _put_versioned(self, key: str, value: dict, ttl: float | None,
+                       expected_version: int | None) -> bool:
+        """
+        Writes a value only if the stored version matches expected_version.
+        An expected_version of None means "only if missing or expired".
+
+        Returns:
+            bool: whether the write happened
+        """
+
+def _expiry(ttl: float | None) -> float | None:
+    """
+    Converts a TTL into an absolute expiry time
+
+    Args:
+        ttl (float | None): seconds from now, None for never
+
+    Returns:
+        float | None: the epoch time the value expires at
+    """
+    return time.time() + ttl if ttl is not None else None
+
+def _is_expired(expires_at: float | None) -> bool:
+    """
+    Checks whether an absolute expiry time has passed
+
+    Args:
+        expires_at (float | None): the epoch expiry time, None for never
+
+    Returns:
+        bool: whether the value is expired
+    """
+    return expires_at is not None and expires_at <= time.time()
+
+class MemoryStateStore(StateStore):
+    """
+    A dict-backed store. Only shared within a single warm container,
+    but handy for local testing.
+    """
+
+    def __init__(self):
+        self._items = {} # key -> (value, version, expires_at)
+        self._lock = threading.Lock()
+
+    def put(self, key: str, value: dict, ttl: float | None = None) -> None:
+        with self._lock:
+            _, version, _ = self._items.get(key, (None, 0, None))
+            self._items[key] = (value, version + 1, _expiry(ttl))
+
+    def pop(self, key: str) -> dict | None:
+        with self._lock:
+            value, _, expires_at = self._items.pop(key, (None, 0, None))
+
+        return None if _is_expired(expires_at) else value
+
+    def scan(self, prefix: str):
+        with self._lock:
+            items = [(key, value) for key, (value, _, expires_at) in self._items.items()
+                     if key.startswith(prefix) and not _is_expired(expires_at)]
+
+        yield from items
+
+    def _get_versioned(self, key: str) -> tuple:
+        with self._lock:
+            value, version, expires_at = self._items.get(key, (None, None, None))
+
+            if _is_expired(expires_at):
+                del self._items[key]
+                return None, None
+
+            return value, version
+
+    def _put_versioned(self, key: str, value: dict, ttl: float | None,
+                       expected_version: int | None) -> bool:
+        with self._lock:
+            _, version, expires_at = self._items.get(key, (None, None, None))
+            if _is_expired(expires_at):
+                version = None
+
+            if version != expected_version:
+                return False
+
+            self._items[key] = (value, (version or 0) + 1, _expiry(ttl))
+            return True
+
+class SQLiteStateStore(StateStore):
+    """
+    A store backed by a local SQLite file. Survives restarts of the process
+    and can be shared by anything that can see the same file. Sticks to SQL
+    that SQLite 3.7 understands (no UPSERT or RETURNING), since that's what
+    some Lambda runtimes ship.
+    """
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                expires_at REAL
+            )"""
+        )
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """
+        Runs a read-then-write as one transaction, holding the write lock from
+        the start so another process can't slip in between
+        """
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def put(self, key: str, value: dict, ttl: float | None = None) -> None:
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE state SET value = ?, version = version + 1, expires_at = ? WHERE key = ?",
+                (json.dumps(value), _expiry(ttl), key)
+            )
+            if cursor.rowcount == 0:
+                connection.execute(
+                    "INSERT INTO state (key, value, version, expires_at) VALUES (?, ?, 1, ?)",
+                    (key, json.dumps(value), _expiry(ttl))
+                )
+
+    def pop(self, key: str) -> dict | None:
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT value, expires_at FROM state WHERE key = ?", (key,)
+            ).fetchone()
+            connection.execute("DELETE FROM state WHERE key = ?", (key,))
+
+        if row is None or _is_expired(row[1]):
+            return None
+
+        return json.loads(row[0])
+
+    def scan(self, prefix: str):
+        with self._lock:
+            # a range on the primary key instead of LIKE, so the index is used
+            rows = self._connection.execute(
+                """SELECT key, value FROM state WHERE key >= ? AND key < ?
+                AND (expires_at IS NULL OR expires_at > ?)""",
+                (prefix, prefix + "\uffff", time.time())
+            ).fetchall()
+
+        for key, value in rows:
+            yield key, json.loads(value)
+
+    def _get_versioned(self, key: str) -> tuple:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, version, expires_at FROM state WHERE key = ?", (key,)
+            ).fetchone()
+
+        if row is None or _is_expired(row[2]):
+            return None, None
+
+        return json.loads(row[0]), row[1]
+
+    def _put_versioned(self, key: str, value: dict, ttl: float | None,
+                       expected_version: int | None) -> bool:
+        serialized = json.dumps(value)
+        expires_at = _expiry(ttl)
+
+        with self._transaction() as connection:
+            if expected_version is not None:
+                cursor = connection.execute(
+                    """UPDATE state SET value = ?, version = version + 1, expires_at = ?
+                    WHERE key = ? AND version = ?""",
+                    (serialized, expires_at, key, expected_version)
+                )
+                return cursor.rowcount == 1
+
+            # insert, or take over the row if what's there has expired
+            row = connection.execute(
+                "SELECT expires_at FROM state WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                connection.execute(
+                    "INSERT INTO state (key, value, version, expires_at) VALUES (?, ?, 1, ?)",
+                    (key, serialized, expires_at)
+                )
+                return True
+
+            if not _is_expired(row[0]):
+                return False
+
+            connection.execute(
+                "UPDATE state SET value = ?, version = version + 1, expires_at = ? WHERE key = ?",
+                (serialized, expires_at, key)
+            )
+            return True
+
+class DynamoDBStateStore(StateStore):
+    """
+    A store backed by a DynamoDB table, shared across every container.
+
+    The table needs a string partition key called "key". Enable DynamoDB TTL on
+    the "expires_at" attribute to have AWS clean up old items; reads filter
+    expired items themselves since TTL deletion can lag.
+    Point endpoint_url at DynamoDB Local (or similar) to test without AWS.
+    """
+
+    def __init__(self, table_name: str, region: str, access_key: str = None,
+                 secret: str = None, endpoint_url: str = None):
+        import boto3 # only needed for this backend
+        from botocore.exceptions import ClientError
+
+        self._client_error = ClientError
+        self._table = boto3.resource(
+            "dynamodb",
+            aws_access_key_id=access_key or None,
+            aws_secret_access_key=secret or None,
+            region_name=region,
+            endpoint_url=endpoint_url or None
+        ).Table(table_name)
+
+    def put(self, key: str, value: dict, ttl: float | None = None) -> None:
+        self._table.update_item(
+            Key={"key": key},
+            UpdateExpression="SET #v = :v, expires_at = :e ADD version :one",
+            ExpressionAttributeNames={"#v": "value"},
+            ExpressionAttributeValues={":v": json.dumps(value), ":e": self._ttl_attribute(ttl),
+                                       ":one": 1}
+        )
+
+    def pop(self, key: str) -> dict | None:
+        response = self._table.delete_item(Key={"key": key}, ReturnValues="ALL_OLD")
+        item = response.get("Attributes")
+
+        if item is None or _is_expired(self._expires_at(item)):
+            return None
+
+        return json.loads(item["value"])
+
+    def scan(self, prefix: str):
+        kwargs = {
+            "FilterExpression": "begins_with(#k, :prefix)",
+            "ExpressionAttributeNames": {"#k": "key"},
+            "ExpressionAttributeValues": {":prefix": prefix},
+            "ConsistentRead": True
+        }
+
+        while True:
+            response = self._table.scan(**kwargs)
+
+            for item in response.get("Items", []):
+                if not _is_expired(self._expires_at(item)):
+                    yield item["key"], json.loads(item["value"])
+
+            if "LastEvaluatedKey" not in response:
+                break
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def _get_versioned(self, key: str) -> tuple:
+        item = self._table.get_item(Key={"key": key}, ConsistentRead=True).get("Item")
+
+        if item is None or _is_expired(self._expires_at(item)):
+            return None, None
+
+        return json.loads(item["value"]), int(item["version"])
+
+    def _put_versioned(self, key: str, value: dict, ttl: float | None,
+                       expected_version: int | None) -> bool:
+        if expected_version is None:
+            condition = "attribute_not_exists(#k) OR (expires_at <> :never AND expires_at <= :now)"
+            values = {":never": 0, ":now": int(time.time())}
+        else:
+            condition = "version = :expected"
+            values = {":expected": expected_version}
+
+        try:
+            self._table.update_item(
+                Key={"key": key},
+                UpdateExpression="SET #v = :v, expires_at = :e ADD version :one",
+                ConditionExpression=condition,
+                ExpressionAttributeNames={"#k": "key", "#v": "value"},
+                ExpressionAttributeValues={":v": json.dumps(value), ":e": self._ttl_attribute(ttl),
+                                           ":one": 1, **values}
+            )
+        except self._client_error as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+
+        return True
+
+    @staticmethod
+    def _ttl_attribute(ttl: float | None) -> int:
+        """
+        DynamoDB TTL wants whole epoch seconds, and 0 stands in for "never"
+        """
+        return int(_expiry(ttl) + 1) if ttl is not None else 0
+
+    @staticmethod
+    def _expires_at(item: dict) -> float | None:
+        expires_at = int(item.get("expires_at", 0))
+        return expires_at or None
+
+def default_backend() -> str:
+    """
+    Gets the backend to use when none is configured. On Lambda, /tmp belongs
+    to one container, so only DynamoDB shares state between containers
+
+    Returns:
+        str: "dynamodb" on Lambda, "sqlite" anywhere else
+    """
+    return "dynamodb" if os.environ.get("AWS_LAMBDA_FUNCTION_NAME") else "sqlite"
+
+def create_state_store(store_config: dict, aws_config: dict) -> StateStore:
+    """
+    Creates the state store described by the "state_store" section of config/aws.json
+
+    Args:
+        store_config (dict): e.g. {"backend": "dynamodb", "table": "slackLambdaState"}
+        aws_config (dict): the rest of config/aws.json, for credentials/region
+
+    Returns:
+        StateStore: the configured store
+    """
+    backend = store_config.get("backend", default_backend())
+
+    if backend == "memory":
+        return MemoryStateStore()
+    if backend == "sqlite":
+        return SQLiteStateStore(store_config.get("path", DEFAULT_SQLITE_PATH))
+    if backend == "dynamodb":
+        return DynamoDBStateStore(
+            store_config.get("table", "slackLambdaState"),
+            store_config.get("region", aws_config.get("region")),
+            aws_config.get("aws_access_key"),
+            aws_config.get("aws_secret"),
+            store_config.get("endpoint_url")
+        )
+
+    raise ValueError(f"Unknown state store backend {backend}, expected one of {BACKENDS}")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+"""
+One-line JSON logging for the Lambda function. Records are leveled, long
+fields are truncated, and full payloads are only logged for a sample of
+invocations so CloudWatch isn't paying to ingest every Slack event in full.
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import json
+import random
+import sys
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+class StructuredLogger:
+    """
+    Writes records like {"level": "INFO", "msg": "...", "key": "value"}, one per line
+    """
+
+    def __init__(self, level: str = "INFO", payload_sample_rate: float = 0.01,
+                 max_field_length: int = 256, stream=None):
+        """
+        Args:
+            level (str): the lowest level to write, e.g. "INFO"
+            payload_sample_rate (float): the fraction of payloads to log in full, 0 to 1
+            max_field_length (int): the longest a single field may be before it's cut
+            stream: where to write, defaults to stdout (CloudWatch in Lambda)
+        """
+        self.level = LEVELS[level.upper()]
+        self.payload_sample_rate = payload_sample_rate
+        self.max_field_length = max_field_length
+        self.stream = stream
+
+    @classmethod
+    def from_config(cls, log_config: dict):
+        """
+        Builds a logger from the "logging" section of config/aws.json, e.g.
+        {"level": "INFO", "payload_sample_rate": 0.01, "max_field_length": 256}
+
+        Args:
+            log_config (dict): the logging config section
+
+        Returns:
+            StructuredLogger: the configured logger
+        """
+        return cls(
+            log_config.get("level", "INFO"),
+            float(log_config.get("payload_sample_rate", 0.01)),
+            int(log_config.get("max_field_length", 256))
+        )
+
+    def debug(self, msg: str, **fields) -> None:
+        self.log("DEBUG", msg, **fields)
+
+    def info(self, msg: str, **fields) -> None:
+        self.log("INFO", msg, **fields)
+
+    def warning(self, msg: str, **fields) -> None:
+        self.log("WARNING", msg, **fields)
+
+    def error(self, msg: str, **fields) -> None:
+        self.log("ERROR", msg, **fields)
+
+    def log(self, level: str, msg: str, **fields) -> None:
+        """
+        Writes a record if its level is high enough
+
+        Args:
+            level (str): the record's level
+            msg (str): a short description of what happened
+            **fields: extra context, each truncated to max_field_length
+        """
+        if LEVELS[level] < self.level:
+            return
+
+        record = {"level": level, "msg": msg}
+        record.update({key: self._truncate(value) for key, value in fields.items()})
+
+        print(json.dumps(record, default=str, separators=(",", ":")), file=self.stream or sys.stdout)
+
+    def payload(self, msg: str, payload, **fields) -> None:
+        """
+        Logs a whole payload, but only for a random sample of calls.
+        At DEBUG level every payload is logged
+
+        Args:
+            msg (str): a short description of the payload
+            payload: the payload itself, e.g. the raw Lambda event
+            **fields: extra context
+        """
+        if self.level > LEVELS["DEBUG"] and random.random() >= self.payload_sample_rate:
+            return
+
+        self.log("INFO", msg, payload=payload, **fields)
+
+    def _truncate(self, value):
+        """
+        Cuts a field down to max_field_length characters once serialized,
+        leaving short numbers/strings/bools as they are
+        """
+        if isinstance(value, (int, float, bool)) or value is None:
+            return value
+
+        text = value if isinstance(value, str) else json.dumps(value, default=str, separators=(",", ":"))
+        if len(text) <= self.max_field_length:
+            return value
+
+        return f"{text[:self.max_field_length]}...(+{len(text) - self.max_field_length} chars)"
@@ -0,0 +1,54 @@
+"""
+Shared fixtures. lambda_function reads its config on import, so it's
+imported from a scratch directory of offline config pointing at the fake
+Slack server from replay.py, the same way replay.py does it.
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import argparse
+import importlib
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from replay import FakeSlackServer, FakeSNSClient, write_offline_config
+
+@pytest.fixture(scope="session")
+def fake_slack():
+    slack = FakeSlackServer()
+    slack.start()
+    yield slack
+    slack.stop()
+
+@pytest.fixture(scope="session")
+def lambda_module(fake_slack, tmp_path_factory):
+    scratch = tmp_path_factory.mktemp("lambda")
+    write_offline_config(str(scratch), argparse.Namespace(state_store="memory", log_level="WARNING",
+                                                          fast_ack=False), fake_slack.url)
+
+    cwd = os.getcwd()
+    os.chdir(scratch)
+    try:
+        module = importlib.import_module("lambda_function")
+    finally:
+        os.chdir(cwd)
+
+    return module
+
+@pytest.fixture
+def lambda_function(lambda_module):
+    """
+    lambda_function with a fresh state store, idempotency index and SNS stand-in
+    """
+    lambda_module.STATE_STORE = None
+    lambda_module.IDEMPOTENCY_INDEX = None
+    lambda_module.RATE_LIMITER = None
+    lambda_module.SNS_CLIENT = FakeSNSClient()
+
+    return lambda_module
@@ -0,0 +1,83 @@
+"""
+Tests for aws.py's lazy client setup: nothing heavy at import, and one
+shared factory however many threads ask for a client at once.
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import subprocess
+import sys
+import threading
+import time
+
+import aws
+from conftest import REPO_DIR
+
+def test_import_does_not_load_boto3():
+    result = subprocess.run([sys.executable, "-c", "import sys, aws; print('boto3' in sys.modules)"],
+                            cwd=REPO_DIR, capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == "False"
+
+def test_concurrent_get_client_builds_one_factory(monkeypatch):
+    built = []
+
+    class SlowFactory:
+        def __init__(self, aws_config):
+            time.sleep(0.05) # widens the window for a second factory to sneak in
+            built.append(self)
+
+        def client(self, service):
+            return (self, service)
+
+    monkeypatch.setattr(aws, "CONFIGS_LOADED", True)
+    monkeypatch.setattr(aws, "CLIENT_FACTORY", None)
+    monkeypatch.setattr(aws, "ClientFactory", SlowFactory)
+
+    threads = [threading.Thread(target=aws.get_client, args=("sqs",)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(built) == 1
+
+class FlakySqsClient:
+    """
+    Fails to delete each entry in failures once, the way delete_message_batch
+    reports partial failures
+    """
+
+    def __init__(self, failures: dict):
+        self.failures = failures # entry id -> (code, sender fault)
+        self.deleted = []
+
+    def delete_message_batch(self, QueueUrl, Entries):
+        failed = []
+        for entry in Entries:
+            failure = self.failures.pop(entry["Id"], None)
+            if failure is None:
+                self.deleted.append(entry["ReceiptHandle"])
+            else:
+                failed.append({"Id": entry["Id"], "Code": failure[0], "SenderFault": failure[1]})
+
+        return {"Failed": failed}
+
+def test_failed_deletes_are_retried():
+    sqs = FlakySqsClient({"1": ("InternalError", False)})
+    consumer = aws.SqsConsumer(sqs, "queue")
+
+    failed = consumer.delete_batch([{"ReceiptHandle": "a"}, {"ReceiptHandle": "b"}])
+
+    assert failed == []
+    assert sorted(sqs.deleted) == ["a", "b"]
+
+def test_sender_faults_are_not_retried():
+    sqs = FlakySqsClient({"0": ("ReceiptHandleIsInvalid", True)})
+    consumer = aws.SqsConsumer(sqs, "queue")
+
+    failed = consumer.delete_batch([{"ReceiptHandle": "a"}])
+
+    assert [entry["Code"] for entry in failed] == ["ReceiptHandleIsInvalid"]
+    assert sqs.deleted == []
@@ -0,0 +1,75 @@
+"""
+Tests for expiry.py and the Lambda function's expiry sweep
+"""
+
+import state_store
+import expiry
+
+class NoScanStore(state_store.MemoryStateStore):
+    """
+    A memory store that fails the test if anything scans it
+    """
+
+    def scan(self, prefix: str):
+        raise AssertionError(f"scanned {prefix}")
+
+def test_pop_due_only_returns_due_messages():
+    index = expiry.ExpiryIndex(NoScanStore(), ttl=3600)
+    index.add("late", 1030)
+    index.add("early", 1010)
+    index.add("later", 1100)
+
+    assert index.pop_due(1000) == []
+    assert index.pop_due(1035) == ["early", "late"]
+    assert index.pop_due(1035) == []
+    assert index.pop_due(1200) == ["later"]
+
+def test_passed_buckets_are_deleted_and_the_cursor_moves_on():
+    store = NoScanStore()
+    index = expiry.ExpiryIndex(store, ttl=3600)
+    index.add("a", 1000)
+
+    index.pop_due(1300)
+
+    assert store.get(f"{expiry.KEY_PREFIX}{index.bucket(1000)}") is None
+    assert store.get(expiry.CURSOR_KEY) == {"bucket": index.bucket(1300) - 1}
+
+def test_message_indexed_twice_comes_back_once():
+    index = expiry.ExpiryIndex(NoScanStore(), ttl=3600)
+    index.add("a", 1000)
+    index.add("a", 1090)
+
+    assert index.pop_due(1200) == ["a"]
+
+def post(lambda_function, device_id: str) -> str:
+    return lambda_function.lambda_handler({"body": {
+        "type": "post", "message": "Help", "channel_id": "CTEST", "device_id": device_id
+    }}, None)["posted_message_id"]
+
+def test_sweep_times_out_pending_messages(lambda_function, monkeypatch):
+    monkeypatch.setattr(lambda_function, "STATE_STORE", NoScanStore())
+    monkeypatch.setattr(lambda_function, "EXPIRY_INDEX", None)
+    message_id = post(lambda_function, "expiry-pending")
+    posted_at = lambda_function.time.time()
+
+    assert lambda_function.sweep_expired_messages(posted_at + 10) == []
+    assert lambda_function.sweep_expired_messages(posted_at + lambda_function.MESSAGE_TIMEOUT + 61) == [message_id]
+    assert lambda_function.get_state_store().get(f"message:{message_id}")["status"] == "timed out"
+
+def test_sweep_times_out_replied_messages_after_the_reply_grace(lambda_function, monkeypatch):
+    monkeypatch.setattr(lambda_function, "STATE_STORE", NoScanStore())
+    monkeypatch.setattr(lambda_function, "EXPIRY_INDEX", None)
+    message_id = post(lambda_function, "expiry-replied")
+
+    # marked replied right before its deadline, so the reply grace pushes it back
+    now = lambda_function.get_state_store().get(f"message:{message_id}")["expires_at"] - 1
+    real_time = lambda_function.time.time
+    monkeypatch.setattr(lambda_function.time, "time", lambda: now)
+    assert lambda_function.set_message_status(message_id, lambda_function.MessageStatus.REPLIED)
+    monkeypatch.setattr(lambda_function.time, "time", real_time)
+
+    assert lambda_function.sweep_expired_messages(now + 2) == []
+    assert lambda_function.sweep_expired_messages(now + lambda_function.REPLY_TIMEOUT + 61) == [message_id]
+    message = lambda_function.get_state_store().get(f"message:{message_id}")
+    assert message["status"] == "timed out"
+    assert lambda_function.render_message_text(message).endswith("*(replied, timed out)*")
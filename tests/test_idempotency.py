@@ -0,0 +1,125 @@
+"""
+Tests for idempotency.py and how lambda_handler claims events with it
+"""
+
+import json
+import time
+
+import pytest
+
+import deferred
+import idempotency
+import state_store
+
+class FailingSNSClient:
+    """
+    Fails the first publish, like a brief SNS outage, then works
+    """
+
+    def __init__(self):
+        self.published = []
+        self.failures_left = 1
+
+    def publish(self, **kwargs) -> dict:
+        if self.failures_left:
+            self.failures_left -= 1
+            raise RuntimeError("SNS is down")
+
+        self.published.append(kwargs)
+        return {"MessageId": str(len(self.published))}
+
+def reply_event(event_id: str, thread_ts: str) -> dict:
+    return {"body": json.dumps({
+        "type": "event_callback",
+        "event_id": event_id,
+        "event": {"type": "message", "thread_ts": thread_ts, "ts": "2.000001",
+                  "user": "USTAFF1", "channel": "CTEST", "text": "On my way"}
+    })}
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_claim_turns_away_duplicates(shared):
+    index = idempotency.IdempotencyIndex(state_store.MemoryStateStore() if shared else None)
+
+    assert index.claim("event:1")
+    assert not index.claim("event:1") # still in progress
+    index.complete("event:1")
+    assert not index.claim("event:1") # done
+    assert index.deduplicated == 2
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_released_claim_can_be_retried(shared):
+    index = idempotency.IdempotencyIndex(state_store.MemoryStateStore() if shared else None)
+
+    assert index.claim("event:1")
+    index.release("event:1")
+    assert index.claim("event:1")
+
+def test_claim_of_another_container_lapses():
+    store = state_store.MemoryStateStore()
+    crashed = idempotency.IdempotencyIndex(store, claim_ttl=0.01)
+    other = idempotency.IdempotencyIndex(store, claim_ttl=0.01)
+
+    assert crashed.claim("event:1") # and never finishes
+    assert not other.claim("event:1")
+
+    time.sleep(0.02)
+    assert other.claim("event:1")
+
+def test_failed_event_is_processed_on_retry(lambda_function):
+    posted = lambda_function.lambda_handler(
+        {"body": {"type": "post", "message": "Help", "channel_id": "CTEST", "device_id": "idem-dev"}}, None
+    )
+    thread_ts = posted["posted_message_id"]
+
+    sns = FailingSNSClient()
+    lambda_function.SNS_CLIENT = sns
+
+    with pytest.raises(RuntimeError):
+        lambda_function.lambda_handler(reply_event("EvFAIL", thread_ts), None)
+    assert sns.published == []
+
+    # Slack retries with the same event_id
+    response = lambda_function.lambda_handler(reply_event("EvFAIL", thread_ts), None)
+    assert response["statusCode"] == 200
+    assert len(sns.published) == 1
+    assert json.loads(sns.published[0]["Message"])["reply_text"] == "On my way"
+
+    # and once it's gone through, further retries are duplicates
+    lambda_function.lambda_handler(reply_event("EvFAIL", thread_ts), None)
+    assert len(sns.published) == 1
+
+@pytest.fixture
+def fast_ack(lambda_function, monkeypatch):
+    monkeypatch.setattr(lambda_function, "FAST_ACK_CONFIG", {"enabled": True, "stage": "local"})
+    stage = deferred.LocalQueueStage(lambda_function.process_deferred_event, log=lambda_function.LOG)
+    monkeypatch.setattr(lambda_function, "DEFERRED_STAGE", stage)
+
+    return stage
+
+def post_for(lambda_function, device_id: str) -> str:
+    return lambda_function.lambda_handler(
+        {"body": {"type": "post", "message": "Help", "channel_id": "CTEST", "device_id": device_id}}, None
+    )["posted_message_id"]
+
+def test_failed_deferred_event_releases_its_claim(lambda_function, fast_ack):
+    thread_ts = post_for(lambda_function, "idem-deferred-fail")
+    sns = FailingSNSClient()
+    lambda_function.SNS_CLIENT = sns
+
+    assert lambda_function.lambda_handler(reply_event("EvDEFERFAIL", thread_ts), None)["statusCode"] == 200
+    fast_ack.join()
+    assert sns.published == []
+
+    # the deferred failure gave the claim back, so Slack's retry is processed
+    lambda_function.lambda_handler(reply_event("EvDEFERFAIL", thread_ts), None)
+    fast_ack.join()
+    assert len(sns.published) == 1
+
+def test_redelivered_deferred_invoke_is_processed_once(lambda_function):
+    thread_ts = post_for(lambda_function, "idem-deferred-dup")
+    body = json.loads(reply_event("EvDEFERDUP", thread_ts)["body"])
+
+    lambda_function.lambda_handler({"deferred": True, "body": body}, None)
+    lambda_function.lambda_handler({"deferred": True, "body": body}, None)
+
+    assert len(lambda_function.SNS_CLIENT.published) == 1
@@ -0,0 +1,99 @@
+"""
+Tests for outbox.py
+"""
+
+import time
+
+import outbox
+
+def make_outbox(tmp_path) -> outbox.Outbox:
+    # never started, the tests flush by hand
+    return outbox.Outbox(str(tmp_path / "outbox.sqlite3"), base_backoff=60, max_backoff=60)
+
+def test_failing_kind_does_not_starve_others(tmp_path):
+    box = make_outbox(tmp_path)
+    posts = []
+
+    def send_logs(rows):
+        raise RuntimeError("Sheets is down")
+
+    box.register("log", send_logs, batch=True, max_age=7 * 24 * 60 * 60)
+    box.register("post", posts.append)
+
+    for index in range(box.batch_size):
+        box.enqueue("log", {"cells": [index]}, "log")
+    box.flush() # every log row is now backing off
+
+    box.enqueue("post", {"message": "Help"}, "dev1")
+    box.flush()
+
+    assert posts == [{"message": "Help"}]
+    assert box.pending() == box.batch_size
+
+def test_due_logs_do_not_crowd_out_posts(tmp_path):
+    box = make_outbox(tmp_path)
+    posts = []
+
+    def send_logs(rows):
+        raise RuntimeError("Sheets is down")
+
+    box.register("log", send_logs, batch=True)
+    box.register("post", posts.append)
+
+    for index in range(box.batch_size * 2):
+        box.enqueue("log", {"cells": [index]}, "log")
+    box.enqueue("post", {"message": "Help"}, "dev1")
+    box.flush()
+
+    assert posts == [{"message": "Help"}]
+
+def test_device_order_is_kept_behind_a_backoff(tmp_path):
+    box = make_outbox(tmp_path)
+    sent = []
+    fail = {"post": True}
+
+    def send(payload):
+        if fail.get(payload["kind"]):
+            raise RuntimeError("down")
+        sent.append(payload["kind"])
+
+    box.register("post", send)
+    box.register("status", send)
+
+    box.enqueue("post", {"kind": "post"}, "dev1")
+    box.flush()
+    box.enqueue("status", {"kind": "status"}, "dev1")
+    box.flush()
+
+    assert sent == [] # the status waits for its post
+
+def test_discard_drops_without_retrying(tmp_path):
+    box = make_outbox(tmp_path)
+    results = []
+
+    def send(payload):
+        raise outbox.Discard("rate_limited")
+
+    box.register("post", send)
+    box.enqueue("post", {}, "dev1", lambda result, error: results.append((result, error)))
+    box.flush()
+
+    assert results == [(None, "rate_limited")]
+    assert box.pending() == 0
+
+def test_requests_expire_while_backing_off(tmp_path):
+    box = make_outbox(tmp_path)
+    results = []
+
+    def send(payload):
+        raise RuntimeError("down")
+
+    box.register("post", send, max_age=0.01)
+    box.enqueue("post", {}, "dev1", lambda result, error: results.append(error))
+    box.flush()
+
+    time.sleep(0.02)
+    box.flush()
+
+    assert results == ["expired"]
+    assert box.pending() == 0
@@ -0,0 +1,82 @@
+"""
+Tests for how lambda_function and the kiosk transports handle post retries
+"""
+
+import pytest
+import requests
+
+import slack_client
+import transport
+
+def post(lambda_function, device_id: str, post_id: str = None) -> dict:
+    return lambda_function.lambda_handler({"body": {
+        "type": "post", "message": "Help", "channel_id": "CTEST",
+        "device_id": device_id, "post_id": post_id
+    }}, None)
+
+def test_retried_post_returns_the_first_one(lambda_function, fake_slack):
+    before = fake_slack.calls.get("chat.postMessage", 0)
+
+    first = post(lambda_function, "posts-retry", "post-1")
+    retry = post(lambda_function, "posts-retry", "post-1")
+
+    assert first["posted_message_id"] == retry["posted_message_id"]
+    assert fake_slack.calls["chat.postMessage"] == before + 1
+
+def test_rate_limited_post_is_rejected(lambda_function):
+    transport.posted_ids(post(lambda_function, "posts-limited", "post-2"))
+
+    with pytest.raises(transport.PostRejected) as error:
+        transport.posted_ids(post(lambda_function, "posts-limited", "post-3"))
+    assert error.value.reason == "rate_limited"
+
+def test_post_that_may_have_gone_through_is_not_retried(lambda_function, monkeypatch):
+    class TimingOutClient:
+        def post(self, method, **kwargs):
+            raise requests.exceptions.ReadTimeout("Slack took too long")
+
+    monkeypatch.setattr(lambda_function, "get_slack_client", TimingOutClient)
+
+    response = post(lambda_function, "posts-unknown", "post-4")
+    assert response["post_status"] == "unknown"
+
+    # even once Slack is back, a retry mustn't post it a second time
+    monkeypatch.undo()
+    with pytest.raises(transport.PostRejected) as error:
+        transport.posted_ids(post(lambda_function, "posts-unknown", "post-4"))
+    assert error.value.reason == "unknown"
+
+def test_failed_post_does_not_count_against_the_rate_limit(lambda_function, monkeypatch):
+    class RejectingClient:
+        def post(self, method, **kwargs):
+            raise slack_client.SlackApiError(method, "channel_not_found", {})
+
+    monkeypatch.setattr(lambda_function, "get_slack_client", RejectingClient)
+    with pytest.raises(slack_client.SlackApiError):
+        lambda_function.post_to_slack("CTEST", "Help", "posts-failed", "", "post-5")
+
+    monkeypatch.undo()
+    message_id, _ = transport.posted_ids(post(lambda_function, "posts-failed", "post-5"))
+    assert message_id != "N/A"
+
+def test_post_is_recorded_even_if_indexing_fails(lambda_function, fake_slack, monkeypatch):
+    class FailingIndex:
+        def add(self, message_id, deadline):
+            raise RuntimeError("Too much contention updating state key expiry:1")
+
+    monkeypatch.setattr(lambda_function, "get_expiry_index", FailingIndex)
+    before = fake_slack.calls.get("chat.postMessage", 0)
+
+    first = transport.posted_ids(post(lambda_function, "posts-unindexed", "post-6"))
+    retry = transport.posted_ids(post(lambda_function, "posts-unindexed", "post-6"))
+
+    assert first == retry
+    assert fake_slack.calls["chat.postMessage"] == before + 1
+
+def test_transport_missing_a_method_fails_on_creation():
+    class PostOnly(transport.Transport):
+        def post(self, message, channel_id, device_id, post_id=None):
+            return None, None
+
+    with pytest.raises(TypeError):
+        PostOnly()
@@ -0,0 +1,94 @@
+"""
+Tests for push delivery: the kiosk only polls SQS while MQTT is down,
+the Lambda function leaves push devices out of SNS, and a notification
+that arrives both ways is delivered once.
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import json
+import queue
+
+import push
+
+class FakeSqsConsumer:
+    def __init__(self):
+        self.messages = queue.Queue()
+        self.running = False
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def get_message(self):
+        try:
+            return self.messages.get_nowait()
+        except queue.Empty:
+            return None
+
+class FakeMqttClient:
+    def subscribe(self, topic, qos=0):
+        self.topic = topic
+
+def test_sqs_only_runs_while_mqtt_is_down():
+    fallback = FakeSqsConsumer()
+    consumer = push.PushConsumer({}, "device-1", fallback)
+    fallback.start()
+
+    consumer._on_connect(FakeMqttClient(), None, {}, 0)
+    assert consumer.connected
+    assert not fallback.running
+
+    consumer._on_disconnect(FakeMqttClient(), None, 1)
+    assert fallback.running
+
+def test_refused_connection_stays_on_sqs():
+    fallback = FakeSqsConsumer()
+    consumer = push.PushConsumer({}, "device-1", fallback)
+
+    consumer._on_connect(FakeMqttClient(), None, {}, 5)
+    assert not consumer.connected
+    assert fallback.running
+
+def test_notifications_arriving_both_ways_are_delivered_once():
+    fallback = FakeSqsConsumer()
+    consumer = push.PushConsumer({}, "device-1", fallback)
+
+    notification = {"ts": "1.0", "notification_id": "abc"}
+    consumer.messages.put(dict(notification))
+    fallback.messages.put(dict(notification))
+
+    assert consumer.get_message() == notification
+    assert consumer.get_message() is None
+
+class FakeIotClient:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.published = []
+
+    def publish(self, **kwargs):
+        if self.fail:
+            raise OSError("IoT Core unreachable")
+        self.published.append(kwargs)
+
+def test_push_devices_skip_sns(lambda_function, monkeypatch):
+    iot = FakeIotClient()
+    monkeypatch.setattr(lambda_function, "PUSH_CONFIG", {"enabled": True, "devices": ["push-1"]})
+    monkeypatch.setattr(lambda_function, "get_iot_client", lambda: iot)
+
+    lambda_function.publish_notification("push-1", {"ts": "1.0"}, "Message Reply Notification")
+    lambda_function.publish_notification("sqs-only", {"ts": "2.0"}, "Message Reply Notification")
+
+    assert [call["topic"] for call in iot.published] == ["slackLambda/devices/push-1"]
+    assert [json.loads(message["Message"])["ts"] for message in lambda_function.SNS_CLIENT.published] == ["2.0"]
+
+def test_failed_push_falls_back_on_sns(lambda_function, monkeypatch):
+    monkeypatch.setattr(lambda_function, "PUSH_CONFIG", {"enabled": True})
+    monkeypatch.setattr(lambda_function, "get_iot_client", lambda: FakeIotClient(fail=True))
+
+    lambda_function.publish_notification("push-2", {"ts": "3.0"}, "Message Reply Notification")
+
+    assert len(lambda_function.SNS_CLIENT.published) == 1
@@ -0,0 +1,99 @@
+"""
+Tests for slack_client.SlackClient's retries: only calls that can't have
+taken effect, or can safely take effect twice, are retried, and never for
+longer than the retry budget.
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import io
+import json
+import time
+
+import pytest
+
+import slack_client
+import structured_log
+
+class FakeResponse:
+    def __init__(self, status_code: int, body: dict = None, headers: dict = None):
+        self.status_code = status_code
+        self.body = body if body is not None else {"ok": True}
+        self.headers = headers or {}
+
+    def json(self) -> dict:
+        return self.body
+
+@pytest.fixture
+def scripted():
+    """
+    A client whose HTTP responses are popped off a list, with sleeps recorded
+    instead of slept
+    """
+    client = slack_client.SlackClient("xoxb-test")
+    client.responses = []
+    client.requests = []
+    client.sleeps = []
+
+    def request(http_method, url, **kwargs):
+        client.requests.append(url.rsplit("/", 1)[-1])
+        return client.responses.pop(0)
+
+    client.session.request = request
+    return client
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch, scripted):
+    monkeypatch.setattr(slack_client.time, "sleep", scripted.sleeps.append)
+
+def test_post_message_is_not_retried_on_server_error(scripted):
+    scripted.responses = [FakeResponse(503), FakeResponse(200)]
+
+    with pytest.raises(slack_client.SlackServerError):
+        scripted.post("chat.postMessage", channel="C1", text="hi")
+
+    assert scripted.requests == ["chat.postMessage"]
+
+def test_idempotent_methods_retry_server_errors(scripted):
+    scripted.responses = [FakeResponse(500), FakeResponse(200, {"ok": True, "user": {}})]
+
+    assert scripted.get("users.info", user="U1")["ok"]
+    assert scripted.requests == ["users.info", "users.info"]
+    assert scripted.sleeps == [0.25]
+
+def test_rate_limit_retries_post_message_after_retry_after(scripted):
+    scripted.responses = [FakeResponse(429, headers={"Retry-After": "1"}),
+                          FakeResponse(200, {"ok": True, "ts": "1.0"})]
+
+    assert scripted.post("chat.postMessage", channel="C1", text="hi")["ts"] == "1.0"
+    assert scripted.sleeps == [1.0]
+
+def test_retry_after_is_ignored_on_server_errors(scripted):
+    scripted.responses = [FakeResponse(503, headers={"Retry-After": "30"}), FakeResponse(200)]
+
+    scripted.get("users.info", user="U1")
+    assert scripted.sleeps == [0.25]
+
+def test_gives_up_when_retry_after_outlasts_the_budget(scripted):
+    scripted.responses = [FakeResponse(429, {"ok": False, "error": "ratelimited"},
+                                       headers={"Retry-After": "30"})]
+
+    start = time.monotonic()
+    with pytest.raises(slack_client.SlackApiError) as error:
+        scripted.post("chat.postMessage", channel="C1", text="hi")
+
+    assert error.value.error == "ratelimited"
+    assert scripted.sleeps == []
+    assert time.monotonic() - start < 1
+
+def test_retries_are_logged_as_json(scripted):
+    stream = io.StringIO()
+    scripted.log = structured_log.StructuredLogger(stream=stream)
+    scripted.responses = [FakeResponse(503), FakeResponse(200)]
+
+    scripted.get("users.info", user="U1")
+
+    record = json.loads(stream.getvalue())
+    assert record["level"] == "WARNING"
+    assert (record["method"], record["status"], record["attempt"]) == ("users.info", 503, 1)
@@ -0,0 +1,221 @@
+"""
+Tests for state_store.py, run against every backend that works offline,
+plus DynamoDB when DYNAMODB_ENDPOINT points at DynamoDB Local. The stubbed
+DynamoDB tests check the conditional writes and TTL without a server
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+
+import pytest
+
+import state_store
+
+DYNAMODB_ENDPOINT = os.environ.get("DYNAMODB_ENDPOINT") # e.g. http://localhost:8000 for DynamoDB Local
+
+@pytest.fixture(params=["memory", "sqlite", "dynamodb"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return state_store.MemoryStateStore()
+    if request.param == "sqlite":
+        return state_store.SQLiteStateStore(str(tmp_path / "state.sqlite3"))
+
+    if not DYNAMODB_ENDPOINT:
+        pytest.skip("set DYNAMODB_ENDPOINT to run against DynamoDB Local")
+    boto3 = pytest.importorskip("boto3")
+
+    table_name = f"state-{uuid.uuid4().hex}"
+    dynamodb = boto3.resource("dynamodb", endpoint_url=DYNAMODB_ENDPOINT, region_name="us-east-1",
+                              aws_access_key_id="test", aws_secret_access_key="test")
+    table = dynamodb.create_table(
+        TableName=table_name,
+        KeySchema=[{"AttributeName": "key", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "key", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST"
+    )
+    table.wait_until_exists()
+    request.addfinalizer(table.delete)
+
+    return state_store.DynamoDBStateStore(table_name, "us-east-1", "test", "test", DYNAMODB_ENDPOINT)
+
+def wait_past(store: state_store.StateStore, ttl: float) -> None:
+    """
+    Sleeps until a value put with ttl has expired. DynamoDB keeps whole
+    seconds and rounds up, so it needs longer than the others
+    """
+    if isinstance(store, state_store.DynamoDBStateStore):
+        time.sleep(ttl + 2)
+    else:
+        time.sleep(ttl * 2)
+
+def test_put_get_pop(store):
+    store.put("message:1", {"status": "pending"})
+    store.put("message:1", {"status": "replied"})
+
+    assert store.get("message:1") == {"status": "replied"}
+    assert store.pop("message:1") == {"status": "replied"}
+    assert store.pop("message:1") is None
+    assert store.get("message:1") is None
+
+def test_add_only_once(store):
+    assert store.add("event:1", {"n": 1})
+    assert not store.add("event:1", {"n": 2})
+    assert store.get("event:1") == {"n": 1}
+
+def test_compare_and_swap_rejects_stale_versions(store):
+    store.put("message:1", {"n": 0})
+    _, version = store._get_versioned("message:1")
+
+    assert store._put_versioned("message:1", {"n": 1}, None, version)
+    assert not store._put_versioned("message:1", {"n": 2}, None, version) # someone beat us to it
+    assert store.get("message:1") == {"n": 1}
+
+def test_update_retries_when_another_writer_wins(store):
+    store.put("counter", {"n": 0})
+    calls = []
+
+    def increment(current):
+        calls.append(current["n"])
+        if len(calls) == 1:
+            store.put("counter", {"n": 10}) # a concurrent writer
+        return {"n": current["n"] + 1}
+
+    assert store.update("counter", increment) == {"n": 11}
+    assert calls == [0, 10]
+
+def test_concurrent_updates_are_not_lost(store):
+    store.put("counter", {"n": 0})
+
+    def worker():
+        for _ in range(20):
+            while True:
+                try:
+                    store.update("counter", lambda current: {"n": current["n"] + 1})
+                    break
+                except RuntimeError: # too much contention, try again
+                    pass
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert store.get("counter") == {"n": 80}
+
+def test_update_declining_leaves_the_key(store):
+    store.put("message:1", {"status": "resolved"})
+
+    assert store.update("message:1", lambda current: None) is None
+    assert store.get("message:1") == {"status": "resolved"}
+
+def test_expired_values_are_gone(store):
+    store.put("message:1", {"status": "pending"}, ttl=0.01)
+    store.put("message:2", {"status": "pending"})
+    wait_past(store, 0.01)
+
+    assert store.get("message:1") is None
+    assert store.pop("message:1") is None
+    assert dict(store.scan("message:")) == {"message:2": {"status": "pending"}}
+
+def test_add_takes_over_an_expired_key(store):
+    assert store.add("event:1", {"n": 1}, ttl=0.01)
+    wait_past(store, 0.01)
+
+    assert store.add("event:1", {"n": 2}, ttl=60)
+    assert store.get("event:1") == {"n": 2}
+
+def test_scan_only_matches_the_prefix(store):
+    store.put("message:1", {})
+    store.put("messages", {})
+    store.put("event:1", {})
+
+    assert [key for key, _ in store.scan("message:")] == ["message:1"]
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        state_store.StateStore()
+
+def test_default_backend_is_shared_on_lambda(monkeypatch):
+    monkeypatch.delenv("AWS_LAMBDA_FUNCTION_NAME", raising=False)
+    assert state_store.default_backend() == "sqlite"
+
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_NAME", "slackLambda")
+    assert state_store.default_backend() == "dynamodb"
+
+@pytest.fixture
+def stubbed_dynamodb():
+    """
+    A DynamoDB store whose client replays canned responses, checking each
+    request as it goes
+    """
+    stub = pytest.importorskip("botocore.stub")
+    pytest.importorskip("boto3")
+
+    store = state_store.DynamoDBStateStore("state", "us-east-1", "test", "test")
+    with stub.Stubber(store._table.meta.client) as stubber:
+        yield store, stubber, stub.ANY
+        stubber.assert_no_pending_responses()
+
+def dynamodb_item(value: dict, version: int, expires_at: int = 0) -> dict:
+    return {"Item": {"key": {"S": "message:1"}, "value": {"S": json.dumps(value)},
+                     "version": {"N": str(version)}, "expires_at": {"N": str(expires_at)}}}
+
+def test_dynamodb_add_is_conditional(stubbed_dynamodb):
+    store, stubber, ANY = stubbed_dynamodb
+    stubber.add_client_error("update_item", "ConditionalCheckFailedException", expected_params={
+        "TableName": "state", "Key": {"key": "event:1"},
+        "UpdateExpression": "SET #v = :v, expires_at = :e ADD version :one",
+        "ConditionExpression": "attribute_not_exists(#k) OR (expires_at <> :never AND expires_at <= :now)",
+        "ExpressionAttributeNames": {"#k": "key", "#v": "value"},
+        "ExpressionAttributeValues": ANY
+    })
+
+    assert not store.add("event:1", {"n": 1})
+
+def test_dynamodb_update_retries_on_a_stale_version(stubbed_dynamodb):
+    store, stubber, ANY = stubbed_dynamodb
+
+    def conditional_update(version: int) -> dict:
+        return {"TableName": "state", "Key": {"key": "message:1"}, "UpdateExpression": ANY,
+                "ConditionExpression": "version = :expected", "ExpressionAttributeNames": ANY,
+                "ExpressionAttributeValues": {":v": json.dumps({"n": version + 1}), ":e": 0,
+                                              ":one": 1, ":expected": version}}
+
+    stubber.add_response("get_item", dynamodb_item({"n": 1}, 1))
+    stubber.add_client_error("update_item", "ConditionalCheckFailedException",
+                             expected_params=conditional_update(1))
+    stubber.add_response("get_item", dynamodb_item({"n": 2}, 2))
+    stubber.add_response("update_item", {}, conditional_update(2))
+
+    assert store.update("message:1", lambda current: {"n": current["n"] + 1}) == {"n": 3}
+
+def test_dynamodb_other_errors_are_raised(stubbed_dynamodb):
+    store, stubber, _ = stubbed_dynamodb
+    stubber.add_client_error("update_item", "ProvisionedThroughputExceededException")
+
+    with pytest.raises(store._client_error):
+        store.add("event:1", {"n": 1})
+
+def test_dynamodb_ttl_is_whole_seconds_rounded_up(stubbed_dynamodb, monkeypatch):
+    store, stubber, ANY = stubbed_dynamodb
+    monkeypatch.setattr(state_store.time, "time", lambda: 1000.5)
+    stubber.add_response("update_item", {}, {
+        "TableName": "state", "Key": {"key": "message:1"}, "UpdateExpression": ANY,
+        "ExpressionAttributeNames": ANY,
+        "ExpressionAttributeValues": {":v": "{}", ":e": 1061, ":one": 1}
+    })
+
+    store.put("message:1", {}, ttl=60)
+
+def test_dynamodb_reads_skip_expired_items(stubbed_dynamodb, monkeypatch):
+    store, stubber, _ = stubbed_dynamodb
+    monkeypatch.setattr(state_store.time, "time", lambda: 1000.0)
+    stubber.add_response("get_item", dynamodb_item({"n": 1}, 1, expires_at=999)) # TTL deletion lags
+    stubber.add_response("get_item", dynamodb_item({"n": 1}, 1, expires_at=0)) # never expires
+
+    assert store.get("message:1") is None
+    assert store.get("message:1") == {"n": 1}
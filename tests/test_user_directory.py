@@ -0,0 +1,63 @@
+"""
+Tests for slack_client.UserDirectory: name lookups must never hold up a
+request on a slow Slack.
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import threading
+
+from slack_client import UserDirectory
+
+class SlowClient:
+    """
+    A SlackClient stand-in whose calls block until released
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+
+    def get(self, method: str, **params) -> dict:
+        self.calls.append(method)
+        self.release.wait(5)
+
+        if method == "users.list":
+            return {"members": [{"id": "U1", "real_name": "Ada Lovelace"}]}
+        return {"user": {"id": params["user"], "real_name": "Grace Hopper"}}
+
+def test_warm_up_in_background_does_not_block():
+    client = SlowClient()
+    directory = UserDirectory(client)
+
+    thread = directory.warm_up_in_background()
+    assert thread.is_alive()
+
+    client.release.set()
+    thread.join(5)
+    assert client.calls == ["users.list"]
+    assert directory.first_name("U1") == "Ada"
+
+def test_first_name_waits_up_to_the_timeout():
+    client = SlowClient()
+    directory = UserDirectory(client)
+
+    client.release.set()
+    assert directory.first_name("U2", timeout=1) == "Grace"
+    assert client.calls == ["users.info"]
+
+def test_first_name_falls_back_after_the_timeout_and_keeps_fetching():
+    client = SlowClient()
+    directory = UserDirectory(client)
+
+    assert directory.first_name("U3", timeout=0.05) == "Unknown"
+
+    client.release.set()
+    for _ in range(100):
+        if directory.first_name("U3", timeout=0) == "Grace":
+            break
+        threading.Event().wait(0.05)
+
+    assert directory.first_name("U3", timeout=0) == "Grace"
+    assert client.calls == ["users.info"]
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+"""
+How the kiosk reaches the backend. Every transport posts help requests and
+sends status updates the same way, so which one is used is just a setting
+("transport" in config/aws.json):
+
+- lambda: invokes the Lambda function, as the kiosk always has
+- direct: calls the Slack Web API from the kiosk over a pooled connection,
+  skipping the Lambda round trip. Needs a state store shared with the
+  Lambda function (DynamoDB) so replies still reach the kiosk
+- in_process: runs lambda_function.lambda_handler right here, for tests
+
+Author:
+Nikki Hess (nkhess@umich.edu)
+"""
+
+import abc
+import json
+from concurrent.futures import ThreadPoolExecutor, Future
+
+TRANSPORTS = ("lambda", "direct", "in_process")
+
+# status update kinds -> the event type the Lambda function routes on
+STATUS_EVENT_TYPES = {"replied": "message_replied", "timed_out": "message_timeout"}
+
+class PostRejected(Exception):
+    """
+    A post that must not be retried: the backend rate limited it
+    ("rate_limited"), or Slack may have posted it without saying so ("unknown")
+    """
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+def posted_ids(response: dict) -> tuple:
+    """
+    Gets the posted message from a Lambda "post" response
+
+    Args:
+        response (dict): the response from lambda_handler
+
+    Returns:
+        tuple: the posted message ID and channel ID, both None if it wasn't posted
+    """
+    if response.get("post_status") == "unknown":
+        raise PostRejected("unknown")
+
+    message_id, channel_id = response.get("posted_message_id"), response.get("posted_message_channel")
+    if message_id == "N/A":
+        raise PostRejected("rate_limited")
+
+    return message_id, channel_id
+
+class Transport(abc.ABC):
+    """
+    The interface every transport implements
+    """
+
+    @abc.abstractmethod
+    def post(self, message: str, channel_id: str, device_id: str, post_id: str = None) -> tuple:
+        """
+        Posts a help request to Slack, waiting for the result. Retries with the
+        same post_id return the first post instead of posting again
+
+        Args:
+            message (str): the message to send
+            channel_id (str): the Slack channel to send the message to
+            device_id (str): the device we're sending from
+            post_id (str): a unique ID for this help request
+
+        Returns:
+            tuple: the posted message ID and channel ID, both None if it wasn't
+                posted and may be retried. Raises PostRejected if it mustn't be
+        """
+
+    @abc.abstractmethod
+    def update_status(self, message_id: str, channel_id: str, status: str) -> Future:
+        """
+        Marks a message on Slack without waiting
+
+        Args:
+            message_id (str): the message id to edit
+            channel_id (str): the Slack channel the message is in
+            status (str): "replied" or "timed_out"
+
+        Returns:
+            Future: resolves once the update has been sent
+        """
+
+def status_event(message_id: str, channel_id: str, status: str) -> dict:
+    """
+    Builds the Lambda event for a status update
+
+    Args:
+        message_id (str): the message id to edit
+        channel_id (str): the Slack channel the message is in
+        status (str): "replied" or "timed_out"
+
+    Returns:
+        dict: the event
+    """
+    return {
+        "body": {
+            "type": STATUS_EVENT_TYPES[status],
+            "message_id": message_id,
+            "channel_id": channel_id
+        }
+    }
+
+def post_event(message: str, channel_id: str, device_id: str, post_id: str = None) -> dict:
+    """
+    Builds the Lambda event for a post
+
+    Args:
+        message (str): the message to send
+        channel_id (str): the Slack channel to send the message to
+        device_id (str): the device we're sending from
+        post_id (str): a unique ID for this help request
+
+    Returns:
+        dict: the event
+    """
+    return {
+        "body": {
+            "type": "post",
+            "message": message,
+            "channel_id": channel_id,
+            "device_id": device_id,
+            "post_id": post_id
+        }
+    }
+
+class LambdaTransport(Transport):
+    """
+    Invokes the Lambda function, through an aws.AsyncInvoker
+    """
+
+    def __init__(self, invoker):
+        """
+        Args:
+            invoker (aws.AsyncInvoker): invokes the function in the background
+        """
+        self.invoker = invoker
+
+    def post(self, message: str, channel_id: str, device_id: str, post_id: str = None) -> tuple:
+        response = self.invoker.invoke(post_event(message, channel_id, device_id, post_id)).result()
+
+        return posted_ids(response)
+
+    def update_status(self, message_id: str, channel_id: str, status: str) -> Future:
+        return self.invoker.update_status(message_id, status_event(message_id, channel_id, status))
+
+class InProcessTransport(Transport):
+    """
+    Calls lambda_function.lambda_handler in this process, exactly as Lambda would
+    """
+
+    def __init__(self, max_workers: int = 2):
+        """
+        Args:
+            max_workers (int): how many status updates may run at once
+        """
+        import lambda_function # deferred, reads the Lambda config files
+
+        self.lambda_function = lambda_function
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="in-process")
+
+    def post(self, message: str, channel_id: str, device_id: str, post_id: str = None) -> tuple:
+        # round trip through JSON like a real invoke, so nothing leaks by reference
+        event = json.loads(json.dumps(post_event(message, channel_id, device_id, post_id)))
+        response = self.lambda_function.lambda_handler(event, None)
+
+        return posted_ids(response)
+
+    def update_status(self, message_id: str, channel_id: str, status: str) -> Future:
+        return self.executor.submit(self.lambda_function.lambda_handler,
+                                    status_event(message_id, channel_id, status), None)
+
+class DirectSlackTransport(Transport):
+    """
+    Posts and edits straight through the Slack Web API using the Lambda
+    function's own helpers, so messages are stored and rendered exactly as
+    if the function had handled them, minus the invoke
+    """
+
+    def __init__(self, max_workers: int = 2):
+        """
+        Args:
+            max_workers (int): how many status updates may run at once
+        """
+        import lambda_function # deferred, reads the Lambda config files
+
+        self.lambda_function = lambda_function
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="direct-slack")
+
+        # the first call pays for the TLS handshake, get it out of the way now
+        self.executor.submit(self.lambda_function.get_slack_client)
+
+    def post(self, message: str, channel_id: str, device_id: str, post_id: str = None) -> tuple:
+        try:
+            message_id, posted_channel_id = self.lambda_function.post_to_slack(channel_id, message,
+                                                                               device_id, "", post_id)
+        except self.lambda_function.PostOutcomeUnknown as e:
+            raise PostRejected("unknown") from e
+
+        if message_id == "N/A":
+            raise PostRejected("rate_limited")
+
+        return message_id, posted_channel_id
+
+    def update_status(self, message_id: str, channel_id: str, status: str) -> Future:
+        statuses = {"replied": self.lambda_function.MessageStatus.REPLIED,
+                    "timed_out": self.lambda_function.MessageStatus.TIMED_OUT}
+
+        return self.executor.submit(self.lambda_function.set_message_status, message_id, statuses[status])
+
+def create_transport(name: str, invoker=None) -> Transport:
+    """
+    Creates a transport by name
+
+    Args:
+        name (str): one of TRANSPORTS
+        invoker (aws.AsyncInvoker): the invoker, needed for the lambda transport
+
+    Returns:
+        Transport: the transport
+    """
+    if name == "lambda":
+        return LambdaTransport(invoker)
+    if name == "direct":
+        return DirectSlackTransport()
+    if name == "in_process":
+        return InProcessTransport()
+
+    raise RuntimeError(f"Unknown transport {name!r}, expected one of {TRANSPORTS}")